@@ -1,9 +1,12 @@
-from typing import TypedDict, List, Dict
+from typing import Annotated, TypedDict, List, Dict, Tuple
 from langchain_google_genai import ChatGoogleGenerativeAI
 
 import os
+import time
 from dotenv import load_dotenv
-from langgraph.graph import StateGraph, END
+from langgraph.graph import StateGraph, START, END
+
+from prompt_budget import Prompt, build_prompt, usage_of
 
 dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
 load_dotenv(dotenv_path)
@@ -14,6 +17,9 @@ class CodeReviewState(TypedDict):
     initial_analysis: str
     issues: List[str]
     final_report: str
+    static_findings: str   # compact output of static_analysis, '' if none
+    # Token usage per stage; merged, since the fast graph's first two nodes write it together
+    usage: Annotated[Dict[str, Dict], lambda old, new: {**old, **new}]
 
 class SimpleCodeReviewAgent:
     def __init__(self):
@@ -25,50 +31,67 @@ class SimpleCodeReviewAgent:
 
 
         self.graph = self._build_graph()
+        # Analysis and issue finding side by side, then the report
+        self.fast_graph = self._build_fast_graph()
+
+    def _ask(self, prompt: Prompt) -> Tuple[str, Dict]:
+        """The model's answer to ``prompt`` and the call's token usage"""
+        t0 = time.monotonic()
+        response = self.llm.invoke(prompt.text)
+        return response.content, usage_of(response, prompt, time.monotonic() - t0)
 
     def _analysis_agent(self, state: CodeReviewState) -> Dict:
         """Step1: Analyse the code"""
-        prompt = f"""Analyse the code briefly:
-            {state['code']}
+        prompt = build_prompt("analysis", lambda code, static: f"""Analyse the code briefly:
+            {code}
         Focus on: purpose, structure and concerns.  
-"""
-        response = self.llm.invoke(prompt)
-        return {"code": state["code"],
-    "initial_analysis": response.content,
-    "issues": state["issues"],
-    "final_report": state["final_report"]}
+{static}""", code=state['code'], static=_static_note(state))
+        answer, usage = self._ask(prompt)
+        # Only the keys this node owns: in the fast graph it runs next to issue_finder
+        return {"initial_analysis": answer, "usage": {"analysis": usage}}
     
     def _find_issues(self, state: CodeReviewState) -> Dict:
         """Step2 : Find the issues in code"""
-        prompt = f"""Based on:{state["initial_analysis"]}
-        Code: {state['code']}
-
+        prompt = build_prompt("issues", lambda code, analysis, static: f"""Based on:{analysis}
+        Code: {code}
+{static}
         List 3-5 specific issues. Format each as "-issue".
-"""
+""", code=state['code'], analysis=state["initial_analysis"], static=_static_note(state))
         
-        response =self.llm.invoke(prompt)
-        issues = [line.strip("-•0123456789. ").strip()
-    for line in response.content.split("\n")
-    if line.strip()]
+        answer, usage = self._ask(prompt)
+        return {"issues": parse_issues(answer), "usage": {"issues": usage}}
+
+    def _find_issues_direct(self, state: CodeReviewState) -> Dict:
+        """Step2 (fast graph): Find the issues without waiting for the analysis"""
+        prompt = build_prompt("issues", lambda code, static: f"""Code: {code}
+{static}
+        List 3-5 specific issues. Format each as "-issue".
+""", code=state['code'], static=_static_note(state))
 
-        return {"issues": issues}
+        answer, usage = self._ask(prompt)
+        return {"issues": parse_issues(answer), "usage": {"issues": usage}}
     
     def _generate_report(self, state: CodeReviewState) -> Dict:
         """Step3: Generate report from the review"""
 
-        issues_text = '\n'.join(state['issues'])
+        # One "- issue" per line, without repeats (not the list's repr)
+        issues_text = '\n'.join(f"- {issue}" for issue in dict.fromkeys(state['issues']))
 
-        prompt = f"""Create a code review report:
+        prompt = build_prompt("report", lambda analysis, issues, static: f"""Create a code review report:
         
-        Analysis: {state['initial_analysis']}
-        Issues: {state['issues']}
+        Analysis: {analysis}
+        Issues:
+{issues}
+        Static checks:
+{static}
 
         Format Summary, Issues, and Recommendation.
-"""
+""", analysis=state['initial_analysis'], issues=issues_text or "- none found",
+            static=state.get('static_findings') or 'none')
         
-        response = self.llm.invoke(prompt)
+        answer, usage = self._ask(prompt)
 
-        return {"final_report": response.content}
+        return {"final_report": answer, "usage": {"report": usage}}
     
     def _build_graph(self) -> StateGraph:
         """Build the langgraph workflow"""
@@ -87,4 +110,39 @@ class SimpleCodeReviewAgent:
         workflow.add_edge("report_generator", END)
 
         return workflow.compile()
-    
\ No newline at end of file
+
+    def _build_fast_graph(self) -> StateGraph:
+        """Same review, but analyzer and issue_finder run concurrently"""
+
+        workflow = StateGraph(CodeReviewState)
+
+        workflow.add_node("analyzer", self._analysis_agent)
+        workflow.add_node("issue_finder", self._find_issues_direct)
+        workflow.add_node("report_generator", self._generate_report)
+
+        # Fan out from the start, join before the report
+        workflow.add_edge(START, "analyzer")
+        workflow.add_edge(START, "issue_finder")
+        workflow.add_edge(["analyzer", "issue_finder"], "report_generator")
+        workflow.add_edge("report_generator", END)
+
+        return workflow.compile()
+
+
+def _static_note(state: CodeReviewState) -> str:
+    """Prompt lines quoting the static findings so the model doesn't repeat them"""
+    findings = state.get("static_findings")
+    if not findings:
+        return ""
+    return f"""
+        Static analysis already reported (do not repeat these, look for other problems):
+{findings}
+"""
+
+
+def parse_issues(text: str) -> List[str]:
+    """'- issue' lines of a model answer as a list"""
+    return [line.strip("-•0123456789. ").strip()
+            for line in text.split("\n")
+            if line.strip()]
+    
@@ -7,14 +7,8 @@ import os
 dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
 load_dotenv(dotenv_path)
 
-from schema import CodeReviewRequest, ExecuteCodeRequest
-from agent import SimpleCodeReviewAgent
-from execution import execute_python_code
-from history import add_history_record, get_all_history
-import uuid
-from datetime import datetime
+from router import agent_router
 
-agent = SimpleCodeReviewAgent()
 app = FastAPI()
 
 @app.options("/review")
@@ -45,67 +39,6 @@ app.add_middleware(
 def root():
     return {"message": "Backend is running 🚀"}
 
-@app.post("/review")
-def review_code(request: CodeReviewRequest):
-
-    initial_state = {
-        "code": request.code,
-        "initial_analysis": "",
-        "issues": [],
-        "final_report": ""
-    }
-
-    result = agent.graph.invoke(initial_state)
-
-    record = {
-        "id": str(uuid.uuid4()),
-        "timestamp": datetime.utcnow().isoformat(),
-        "input_code": request.code,
-        "review": {
-            "analysis": result["initial_analysis"],
-            "issues": result["issues"],
-            "report": result["final_report"]
-        },
-        "execution": None
-    }
-
-    add_history_record(record)
-
-    # return record
-    return {
-        "analysis": record["review"]["analysis"],
-        "issues": record["review"]["issues"],
-        "report": record["review"]["report"]
-    }
-@app.post("/execute")
-def execute_code(request: ExecuteCodeRequest):
-
-    if request.language != "python":
-        return {"error": "Only Python supported for now"}
-
-    result = execute_python_code(request.code)
-
-    
-    record = {
-        "id": str(uuid.uuid4()),
-        "timestamp": datetime.utcnow().isoformat(),
-        "input_code": request.code,
-        "review": None,
-        "execution": {
-            "output": result["stdout"],
-            "error": result["stderr"]
-        }
-    
-    }
-
-    add_history_record(record)
-
-    # return record
-    return {
-        "output": result["stdout"],
-        "error": result["stderr"]
-    }
-
-@app.get("/history")
-def fetch_history():
-    return get_all_history()
+# /review, /review/stream, /review/ws, /review/cache, /execute, /history… are the
+# same routes the DeveloperPage app mounts at /api/agent-standalone
+app.include_router(agent_router)
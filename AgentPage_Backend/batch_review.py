@@ -0,0 +1,264 @@
+"""Batch review of a whole workspace, or of a list of files, in one request.
+
+Files are selected under ``root`` (or taken from an explicit list relative
+to it) with include / exclude globs matched against their path relative to
+the root (``fnmatch`` style, so ``*`` also crosses directories and ``**/``
+is optional). The root is resolved against the client's workspace and must
+stay inside it, as must every file, symlinks included: nothing else on the
+server can be sent to the model. Version-control, dependency and build
+directories are never walked.
+
+Each file is reviewed by the normal single-file pipeline (static analysis,
+review cache, incremental chunked review keyed by the file's path), on a pool
+of BATCH_REVIEW_WORKERS async workers. Reviews that need the model start at
+most BATCH_REVIEW_RATE times per minute, evenly spaced, so a large repository
+puts a steady, predictable load on the model instead of a burst; cached files
+and syntax errors never wait. Finally one more call turns the per-file
+results into a repository report.
+
+Events (same SSE framing as review_stream):
+  {type: 'files', total, files, skipped}
+  {type: 'file_start', path}
+  {type: 'file_done', path, issues, findings, errors, cached, usage, elapsed, done, total}
+  {type: 'file_error', path, error, done, total}
+  {type: 'stage', stage: 'report'} / {type: 'token', ...} / {type: 'stage_done', ...}
+  {type: 'done', report, files, totals, usage, elapsed}
+  {type: 'error', error}
+"""
+import os
+import time
+import asyncio
+import fnmatch
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from review_stream import message_text
+from prompt_budget import add_usage, build_prompt, usage_of, usage_totals
+
+BATCH_WORKERS = int(os.getenv("BATCH_REVIEW_WORKERS", "4"))
+BATCH_RATE = float(os.getenv("BATCH_REVIEW_RATE", "60"))     # file reviews started per minute
+MAX_FILES = int(os.getenv("BATCH_REVIEW_MAX_FILES", "500"))
+MAX_FILE_BYTES = int(os.getenv("BATCH_REVIEW_MAX_FILE_BYTES", str(256 * 1024)))
+# Workspace of clients without one of their own (same default as DeveloperPage)
+DEFAULT_WORKSPACE = os.path.abspath(os.getenv("WORKSPACE_DIR", os.getcwd()))
+REPORT_ISSUES_PER_FILE = 3
+
+DEFAULT_INCLUDE = ["*.py"]
+SKIP_DIRS = {".git", ".hg", ".svn", "node_modules", "__pycache__", ".venv", "venv", "env",
+             ".tox", ".mypy_cache", ".pytest_cache", "dist", "build", "site-packages"}
+_USAGE_KEYS = ("prompt_tokens", "completion_tokens", "latency", "estimated", "calls")
+
+
+# ─── File selection ──────────────────────────────────────────────────────────
+
+def matches(rel: str, patterns: List[str]) -> bool:
+    return any(fnmatch.fnmatch(rel, p) or (p.startswith("**/") and fnmatch.fnmatch(rel, p[3:]))
+               for p in patterns)
+
+
+def _inside(path: str, root: str) -> bool:
+    return os.path.commonpath([root, path]) == root
+
+
+def collect_files(workspace: str, root: Optional[str], files: Optional[List[str]],
+                  include: Optional[List[str]], exclude: Optional[List[str]]
+                  ) -> Tuple[List[Tuple[str, str]], List[Dict]]:
+    """(absolute path, path shown to the user) of the files to review, and the skipped ones.
+
+    ``root`` is relative to ``workspace`` (default: the workspace itself) and
+    ``files`` relative to ``root``. Raises ValueError for a root that is not
+    a folder inside the workspace, or a listed file outside the root.
+    """
+    include = include or DEFAULT_INCLUDE
+    exclude = exclude or []
+    workspace = os.path.realpath(workspace)
+    root = os.path.realpath(os.path.join(workspace, root or "."))
+    if not _inside(root, workspace):
+        raise ValueError(f"{root} is outside of the workspace {workspace}")
+    if not os.path.isdir(root):
+        raise ValueError(f"Not a directory: {root}")
+
+    candidates: List[Tuple[str, str]] = []   # (real path, path relative to root)
+    if files:
+        for name in files:
+            path = os.path.realpath(os.path.join(root, name))
+            if not _inside(path, root):
+                raise ValueError(f"{name} is outside of {root}")
+            candidates.append((path, os.path.relpath(path, root).replace(os.sep, "/")))
+    else:
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS and not d.startswith("."))
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                candidates.append((os.path.realpath(path), os.path.relpath(path, root).replace(os.sep, "/")))
+
+    selected, skipped = [], []
+    for path, rel in candidates:
+        if not matches(rel, include) or matches(rel, exclude):
+            continue
+        if not _inside(path, root):
+            skipped.append({"path": rel, "reason": "links outside of the root"})
+        elif not os.path.isfile(path):
+            skipped.append({"path": rel, "reason": "not found"})
+        elif os.path.getsize(path) > MAX_FILE_BYTES:
+            skipped.append({"path": rel, "reason": f"larger than {MAX_FILE_BYTES} bytes"})
+        elif len(selected) >= MAX_FILES:
+            skipped.append({"path": rel, "reason": f"over the {MAX_FILES} file limit"})
+        else:
+            selected.append((path, rel))
+    return selected, skipped
+
+
+def read_source(path: str) -> str:
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+# ─── Scheduling ──────────────────────────────────────────────────────────────
+
+class RateLimiter:
+    """At most ``rate`` acquisitions per ``per`` seconds, evenly spaced (no bursts)."""
+
+    def __init__(self, rate: float, per: float = 60.0):
+        self.interval = per / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def file_summary(rel: str, review: Dict) -> Dict:
+    findings = review.get("static", {}).get("findings", [])
+    return {
+        "path": rel,
+        "issues": review["issues"],
+        "findings": len(findings),
+        "errors": sum(f["severity"] == "error" for f in findings),
+        "cached": review.get("cached", False),
+        "usage": review.get("usage"),
+    }
+
+
+async def batch_review_events(llm, files: List[Tuple[str, str]], skipped: List[Dict],
+                              review_file: Callable[..., Awaitable[Dict]],
+                              workers: int = BATCH_WORKERS, rate: float = BATCH_RATE) -> AsyncIterator[Dict]:
+    """Review events for ``files``; ``review_file(code, path, throttle)`` reviews one file.
+
+    ``review_file`` awaits ``throttle()`` right before it calls the model (not
+    for cache hits) and returns the usual review dict (analysis, issues,
+    report, static, cached, usage) or raises; a failed file is reported and
+    skipped.
+    """
+    try:
+        async for event in _batch(llm, files, skipped, review_file, workers, rate):
+            yield event
+    except Exception as e:
+        yield {"type": "error", "error": str(e)}
+
+
+async def _batch(llm, files, skipped, review_file, workers, rate) -> AsyncIterator[Dict]:
+    t0 = time.monotonic()
+    yield {"type": "files", "total": len(files), "files": [rel for _, rel in files], "skipped": skipped}
+
+    pending: asyncio.Queue = asyncio.Queue()
+    for item in files:
+        pending.put_nowait(item)
+    out: asyncio.Queue = asyncio.Queue()
+    limiter = RateLimiter(rate)
+
+    async def worker():
+        while True:
+            try:
+                path, rel = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await out.put({"type": "file_start", "path": rel})
+            started = time.monotonic()
+            try:
+                code = await asyncio.to_thread(read_source, path)
+                review = await review_file(code, path, limiter.acquire)
+            except Exception as e:
+                await out.put({"type": "file_error", "path": rel, "error": str(e)})
+                continue
+            await out.put({"type": "file_done", **file_summary(rel, review),
+                           "elapsed": round(time.monotonic() - started, 3)})
+
+    results: List[Dict] = []
+    failed: List[Dict] = []
+    tasks = [asyncio.ensure_future(worker()) for _ in range(min(max(workers, 1), len(files)))]
+    try:
+        while len(results) + len(failed) < len(files):
+            event = await out.get()
+            if event["type"] == "file_done":
+                results.append({k: v for k, v in event.items() if k not in ("type", "elapsed")})
+            elif event["type"] == "file_error":
+                failed.append({"path": event["path"], "error": event["error"]})
+            if event["type"] != "file_start":
+                event = {**event, "done": len(results) + len(failed), "total": len(files)}
+            yield event
+    finally:
+        for task in tasks:
+            task.cancel()
+    results.sort(key=lambda r: (-r["errors"], -len(r["issues"]), r["path"]))
+
+    stages: Dict[str, Dict] = {}
+    for r in results:
+        if r["usage"] and r["usage"]["calls"]:
+            stages["files"] = add_usage(stages.get("files"), {k: r["usage"][k] for k in _USAGE_KEYS})
+
+    report = []
+    if results:
+        prompt = repo_report_prompt(results, failed, skipped)
+        started = time.monotonic()
+        full = None
+        yield {"type": "stage", "stage": "report"}
+        async for piece in llm.astream(prompt.text):
+            full = piece if full is None else full + piece
+            text = message_text(piece.content)
+            if text:
+                report.append(text)
+                yield {"type": "token", "stage": "report", "data": text}
+        stages["report"] = usage_of(full, prompt, time.monotonic() - started, "".join(report))
+        yield {"type": "stage_done", "stage": "report", "result": "".join(report),
+               "elapsed": round(time.monotonic() - t0, 3), "usage": stages["report"]}
+
+    yield {"type": "done", "report": "".join(report), "files": results,
+           "totals": {
+               "files": len(files),
+               "reviewed": len(results),
+               "failed": failed,
+               "skipped": len(skipped),
+               "cached": sum(r["cached"] for r in results),
+               "issues": sum(len(r["issues"]) for r in results),
+               "static_findings": sum(r["findings"] for r in results),
+               "syntax_errors": sum(r["errors"] > 0 for r in results),
+           },
+           "usage": usage_totals(stages, time.monotonic() - t0),
+           "elapsed": round(time.monotonic() - t0, 3)}
+
+
+# ─── Reduce ──────────────────────────────────────────────────────────────────
+
+def repo_report_prompt(results: List[Dict], failed: List[Dict], skipped: List[Dict]):
+    rows = []
+    for r in results:
+        head = f"- {r['path']}: {len(r['issues'])} issues, {r['findings']} static findings"
+        rows.append("\n".join([head] + [f"    - {i}" for i in r["issues"][:REPORT_ISSUES_PER_FILE]]))
+    files = "\n".join(rows)
+    problems = "\n".join([f"- {f['path']}: review failed ({f['error']})" for f in failed] +
+                         [f"- {s['path']}: skipped ({s['reason']})" for s in skipped]) or "none"
+    return build_prompt("repo_report", lambda files, problems: f"""Create a code review report for a repository reviewed file by file.
+
+        Files (most issues first, top issues of each):
+{files}
+
+        Not reviewed:
+{problems}
+
+        Format Summary, Most affected files, Recurring issues, and Recommendation.
+""", files=files, problems=problems)
@@ -0,0 +1,393 @@
+"""Map-reduce review of large files.
+
+The normal graph puts the whole file into every prompt. Here Python source is
+split with ``ast`` along top-level function and class boundaries (classes
+longer than CHUNK_MAX_LINES are split into their methods), and neighbouring
+small pieces are packed together up to CHUNK_TARGET_LINES. Code that does not
+parse is cut into fixed line windows instead.
+
+Map: each chunk gets one model call, with absolute line numbers in the prompt,
+returning a one-line summary and issues tagged with line ranges. At most
+CHUNK_WORKERS chunk calls run at once.
+Reduce: one more call turns the summaries and issues (not the code) into the
+final report.
+
+So a big file costs about (largest chunk + report) in latency instead of three
+passes over the whole file.
+
+Incremental: with a review cache, every definition's result is also stored
+under its own AST fingerprint. On the next submission only definitions whose
+fingerprint is new (added or edited) are sent to the model; the rest are
+taken from the cache with their line numbers shifted to where they are now.
+Given the file's path, the response also lists what was added, modified and
+removed since its last review.
+"""
+import os
+import re
+import ast
+import time
+import asyncio
+import textwrap
+from typing import AsyncIterator, Dict, List, Optional
+
+from review_stream import message_text
+from review_cache import ReviewCache, code_fingerprint
+from static_analysis import format_findings
+from prompt_budget import Prompt, add_usage, build_prompt, compact_lines, usage_of, usage_totals
+
+CHUNK_MAX_LINES = int(os.getenv("REVIEW_CHUNK_MAX_LINES", "300"))
+CHUNK_TARGET_LINES = int(os.getenv("REVIEW_CHUNK_TARGET_LINES", "120"))
+CHUNK_WORKERS = int(os.getenv("REVIEW_CHUNK_WORKERS", "4"))
+# /review switches to chunked mode by itself above this many lines
+CHUNK_THRESHOLD = int(os.getenv("REVIEW_CHUNK_THRESHOLD", "400"))
+
+_ISSUE = re.compile(r"^L(\d+)(?:\s*-\s*L?(\d+))?\s*[:\-]\s*(.+)$")
+
+
+class Chunk:
+    """Lines ``start``..``end`` (1-based, inclusive) of the file."""
+
+    def __init__(self, name: str, kind: str, start: int, end: int, lines: List[str],
+                 parts: Optional[List["Chunk"]] = None):
+        self.name = name
+        self.kind = kind          # function | class | method | module | lines | group
+        self.start = start
+        self.end = end
+        self.lines = lines
+        self.parts = parts or [self]    # the definitions a packed group is made of
+
+    def part_at(self, line: int) -> "Chunk":
+        return next((p for p in self.parts if p.start <= line <= p.end), self)
+
+    @property
+    def fingerprint(self) -> str:
+        # Dedented so a method fingerprints the same wherever it is nested
+        kind, digest = code_fingerprint(textwrap.dedent(self.source))
+        return f"{kind}:{digest}"
+
+    @property
+    def source(self) -> str:
+        return "\n".join(self.lines[self.start - 1:self.end])
+
+    def numbered(self, compact: bool = False) -> str:
+        """The lines prefixed with their numbers; ``compact`` drops comments and blank lines."""
+        width = len(str(self.end))
+        if compact:
+            rows = [(self.start + n - 1, line) for n, line in compact_lines(self.source)]
+        else:
+            rows = [(n, self.lines[n - 1]) for n in range(self.start, self.end + 1)]
+        return "\n".join(f"{n:>{width}}| {line}" for n, line in rows)
+
+    def info(self) -> Dict:
+        return {"name": self.name, "kind": self.kind, "start": self.start, "end": self.end}
+
+
+# ─── Splitting ───────────────────────────────────────────────────────────────
+
+def _node_start(node) -> int:
+    decorators = getattr(node, "decorator_list", None) or []
+    return min([node.lineno] + [d.lineno for d in decorators])
+
+
+def _defs(body, lines: List[str], prefix: str = "") -> List[Chunk]:
+    chunks = []
+    for node in body:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+        start, end = _node_start(node), node.end_lineno
+        name = prefix + node.name
+        methods = (_defs(node.body, lines, name + ".")
+                   if isinstance(node, ast.ClassDef) and end - start + 1 > CHUNK_MAX_LINES else [])
+        if methods:
+            # Class header and attributes, then each method on its own
+            chunks.append(Chunk(name, "class", start, max(methods[0].start - 1, start), lines))
+            chunks.extend(methods)
+        else:
+            kind = "class" if isinstance(node, ast.ClassDef) else ("method" if prefix else "function")
+            chunks.append(Chunk(name, kind, start, end, lines))
+    return chunks
+
+
+def split_code(code: str) -> List[Chunk]:
+    """Top-level definitions plus the module-level code between them."""
+    lines = code.split("\n")
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return [Chunk(f"lines {s}-{min(s + CHUNK_TARGET_LINES - 1, len(lines))}", "lines",
+                      s, min(s + CHUNK_TARGET_LINES - 1, len(lines)), lines)
+                for s in range(1, len(lines) + 1, CHUNK_TARGET_LINES)]
+
+    chunks = _defs(tree.body, lines)
+    # Module-level statements (imports, constants, main guard) between definitions
+    taken = set()
+    for chunk in chunks:
+        taken.update(range(chunk.start, chunk.end + 1))
+    gap = []
+    for n in range(1, len(lines) + 1):
+        if n not in taken and lines[n - 1].strip():
+            gap.append(n)
+            continue
+        if gap and n in taken:
+            chunks.append(Chunk("module", "module", gap[0], gap[-1], lines))
+            gap = []
+    if gap:
+        chunks.append(Chunk("module", "module", gap[0], gap[-1], lines))
+    return sorted(chunks, key=lambda c: c.start)
+
+
+def pack(chunks: List[Chunk], target: int = CHUNK_TARGET_LINES) -> List[Chunk]:
+    """Merge neighbouring chunks while the merged span stays under ``target`` lines."""
+    packed: List[Chunk] = []
+    for chunk in chunks:
+        last = packed[-1] if packed else None
+        if last is not None and chunk.end - last.start + 1 <= target:
+            parts = last.parts + chunk.parts
+            names = [p.name for p in parts if p.kind != "module"] or ["module"]
+            name = ", ".join(names[:3]) + (f" +{len(names) - 3} more" if len(names) > 3 else "")
+            packed[-1] = Chunk(name, "group", last.start, chunk.end, chunk.lines, parts)
+        else:
+            packed.append(chunk)
+    return packed
+
+
+# ─── Map ─────────────────────────────────────────────────────────────────────
+
+def chunk_prompt(chunk: Chunk, static: str = "") -> Prompt:
+    note = f"""
+        Static analysis already reported (do not repeat these):
+{static}
+""" if static else ""
+    # Compacting keeps the original line numbers, which the issues refer to
+    return build_prompt("chunk", lambda code, note: f"""Review this part of a larger file ({chunk.kind} {chunk.name}, lines {chunk.start}-{chunk.end}):
+{code}
+{note}
+        First line: "SUMMARY: <one sentence on what it does>".
+        Then list 0-5 specific issues, one per line, as "- L<start>-L<end>: issue".
+""", code=chunk.numbered(), strip=lambda _: chunk.numbered(compact=True), note=note)
+
+
+def parse_chunk_review(text: str, chunk: Chunk) -> Dict:
+    summary = ""
+    issues = []
+    for line in text.split("\n"):
+        line = line.strip()
+        if not line:
+            continue
+        if line.upper().startswith("SUMMARY:"):
+            summary = line[8:].strip()
+            continue
+        if not line.startswith(("-", "•", "*")):
+            continue
+        line = line.lstrip("-•* ").strip()
+        match = _ISSUE.match(line)
+        if match:
+            start = int(match.group(1))
+            end = int(match.group(2) or start)
+            text_ = match.group(3).strip()
+        else:
+            start, end, text_ = chunk.start, chunk.end, line
+        # Keep references inside the chunk the model was shown
+        start = min(max(start, chunk.start), chunk.end)
+        end = min(max(end, start), chunk.end)
+        issues.append({"line_start": start, "line_end": end, "issue": text_,
+                       "chunk": chunk.part_at(start).name if match else chunk.name})
+    return {**chunk.info(), "summary": summary, "issues": issues}
+
+
+async def review_chunk(llm, chunk: Chunk, limit: asyncio.Semaphore, findings: List[Dict]) -> Dict:
+    prompt = chunk_prompt(chunk, format_findings(findings, chunk.start, chunk.end))
+    async with limit:
+        t0 = time.monotonic()
+        response = await llm.ainvoke(prompt.text)
+    return {**parse_chunk_review(message_text(response.content), chunk),
+            "usage": usage_of(response, prompt, time.monotonic() - t0)}
+
+
+# ─── Incremental reuse ───────────────────────────────────────────────────────
+
+def split_result(result: Dict, chunk: Chunk) -> List[tuple]:
+    """(part, result relative to the part's first line) for each part of ``chunk``."""
+    pieces = []
+    for part in chunk.parts:
+        issues = [{"line_start": i["line_start"] - part.start,
+                   "line_end": min(i["line_end"], part.end) - part.start,
+                   "issue": i["issue"]}
+                  for i in result["issues"] if part.start <= i["line_start"] <= part.end]
+        pieces.append((part, {"summary": result["summary"], "issues": issues}))
+    return pieces
+
+
+def rebase(stored: Dict, chunk: Chunk) -> Dict:
+    """A stored per-definition result placed at ``chunk``'s current lines."""
+    issues = [{"line_start": chunk.start + i["line_start"],
+               "line_end": min(chunk.start + i["line_end"], chunk.end),
+               "issue": i["issue"], "chunk": chunk.name}
+              for i in stored["issues"]]
+    return {**chunk.info(), "summary": stored["summary"], "issues": issues, "reused": True}
+
+
+def part_names(chunks: List[Chunk]) -> List[str]:
+    """Unique names for diffing submissions (repeated names get #2, #3…)."""
+    seen: Dict[str, int] = {}
+    names = []
+    for chunk in chunks:
+        seen[chunk.name] = seen.get(chunk.name, 0) + 1
+        names.append(chunk.name if seen[chunk.name] == 1 else f"{chunk.name}#{seen[chunk.name]}")
+    return names
+
+
+def diff_parts(old: Optional[Dict[str, str]], new: Dict[str, str]) -> Dict[str, List[str]]:
+    old = old or {}
+    return {
+        "added": [n for n in new if n not in old],
+        "modified": [n for n in new if n in old and old[n] != new[n]],
+        "removed": [n for n in old if n not in new],
+        "unchanged": [n for n in new if old.get(n) == new[n]],
+    }
+
+
+# ─── Reduce ──────────────────────────────────────────────────────────────────
+
+def format_issue(issue: Dict) -> str:
+    lines = (f"L{issue['line_start']}" if issue["line_start"] == issue["line_end"]
+             else f"L{issue['line_start']}-{issue['line_end']}")
+    return f"{lines} ({issue['chunk']}): {issue['issue']}"
+
+
+def summarize(results: List[Dict]) -> str:
+    """One line per summary; reused parts of one packed group share theirs."""
+    rows: List[list] = []
+    for r in results:
+        if rows and rows[-1][3] == r["summary"]:
+            rows[-1][0].append(r["name"])
+            rows[-1][2] = r["end"]
+        else:
+            rows.append([[r["name"]], r["start"], r["end"], r["summary"]])
+    return "\n".join(f"- {', '.join(names)} (lines {start}-{end}): {summary}"
+                     for names, start, end, summary in rows)
+
+
+def report_prompt(results: List[Dict], findings: List[Dict]) -> Prompt:
+    parts = summarize(results)
+    static = format_findings(findings) or "none"
+    issues = "\n".join(f"- {format_issue(i)}" for r in results for i in r["issues"]) or "- none found"
+    return build_prompt("chunk_report", lambda parts, issues, static: f"""Create a code review report for a file reviewed in parts:
+
+        Parts:
+{parts}
+
+        Issues:
+{issues}
+
+        Static checks:
+{static}
+
+        Format Summary, Issues, and Recommendation.
+""", parts=parts, issues=issues, static=static)
+
+
+async def chunked_review_events(llm, code: str, cache: Optional[ReviewCache] = None,
+                                path: Optional[str] = None,
+                                findings: Optional[List[Dict]] = None) -> AsyncIterator[Dict]:
+    """Review events (see review_stream) for a map-reduce review of ``code``.
+
+    Adds ``{type: 'chunks', chunks, reused}`` up front (plus ``changes`` when
+    ``path`` is given) and one ``chunk_done`` per reviewed chunk as it
+    finishes; ``done`` also carries the per-chunk results. ``findings`` from
+    static_analysis are quoted in the prompts of the chunks they fall in.
+    """
+    try:
+        async for event in _map_reduce(llm, code, cache, path, findings or []):
+            yield event
+    except Exception as e:
+        yield {"type": "error", "error": str(e)}
+
+
+async def _map_reduce(llm, code: str, cache: Optional[ReviewCache],
+                      path: Optional[str], findings: List[Dict]) -> AsyncIterator[Dict]:
+    t0 = time.monotonic()
+    defs = split_code(code)
+    fingerprints = [d.fingerprint for d in defs]
+    results: List[Dict] = []
+
+    fresh = [True] * len(defs)
+    if cache is not None:
+        for i, (chunk, fingerprint) in enumerate(zip(defs, fingerprints)):
+            stored = await asyncio.to_thread(cache.get_chunk, fingerprint)
+            if stored is not None:
+                results.append(rebase(stored, chunk))
+                fresh[i] = False
+
+    changes = None
+    if path and cache is not None:
+        current = dict(zip(part_names(defs), fingerprints))
+        changes = diff_parts(await asyncio.to_thread(cache.file_parts, path), current)
+        await asyncio.to_thread(cache.set_file_parts, path, current)
+        yield {"type": "changes", **changes}
+
+    # Pack only runs of neighbouring fresh definitions, never across reused ones
+    chunks, run = [], []
+    for chunk, is_fresh in zip(defs, fresh):
+        if is_fresh:
+            run.append(chunk)
+        elif run:
+            chunks.extend(pack(run))
+            run = []
+    chunks.extend(pack(run))
+    yield {"type": "chunks", "chunks": [c.info() for c in chunks],
+           "reused": [r["name"] for r in results]}
+
+    usage: Dict[str, Dict] = {}
+    limit = asyncio.Semaphore(CHUNK_WORKERS)
+    tasks = {asyncio.ensure_future(review_chunk(llm, chunk, limit, findings)): chunk for chunk in chunks}
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            chunk_usage = result.pop("usage")
+            usage["chunks"] = add_usage(usage.get("chunks"), chunk_usage)
+            results.append(result)
+            yield {"type": "chunk_done", **result, "elapsed": round(time.monotonic() - t0, 3),
+                   "usage": chunk_usage}
+            if cache is not None:
+                chunk = next(c for c in chunks if c.start == result["start"])
+                for part, piece in split_result(result, chunk):
+                    await asyncio.to_thread(cache.put_chunk, part.fingerprint, piece)
+    finally:
+        for task in tasks:
+            task.cancel()
+    results.sort(key=lambda r: r["start"])
+
+    analysis = summarize(results)
+    issues = [format_issue(i) for r in results for i in r["issues"]]
+    yield {"type": "stage_done", "stage": "analysis", "result": analysis,
+           "elapsed": round(time.monotonic() - t0, 3)}
+    yield {"type": "stage_done", "stage": "issues", "result": issues,
+           "elapsed": round(time.monotonic() - t0, 3)}
+
+    report = []
+    prompt = report_prompt(results, findings)
+    t_report = time.monotonic()
+    full = None
+    yield {"type": "stage", "stage": "report"}
+    async for piece in llm.astream(prompt.text):
+        # Chunks add up to the whole message, usage metadata included
+        full = piece if full is None else full + piece
+        text = message_text(piece.content)
+        if text:
+            report.append(text)
+            yield {"type": "token", "stage": "report", "data": text}
+    usage["report"] = usage_of(full, prompt, time.monotonic() - t_report, "".join(report))
+    yield {"type": "stage_done", "stage": "report", "result": "".join(report),
+           "elapsed": round(time.monotonic() - t0, 3), "usage": usage["report"]}
+    yield {"type": "done", "analysis": analysis, "issues": issues, "report": "".join(report),
+           "chunks": results, "changes": changes, "reviewed": len(chunks),
+           "elapsed": round(time.monotonic() - t0, 3), "cached": False,
+           "usage": usage_totals(usage, time.monotonic() - t0)}
+
+
+def should_chunk(code: str, chunked: Optional[bool], path: Optional[str] = None) -> bool:
+    if chunked is not None:
+        return chunked
+    # A known file path asks for incremental re-review, which works on chunks
+    return bool(path) or code.count("\n") + 1 > CHUNK_THRESHOLD
@@ -0,0 +1,194 @@
+"""Token budgets for the review prompts, and per-call token accounting.
+
+Every prompt the reviewer sends is built through ``build_prompt``: the pieces
+that can grow without bound (the code, the analysis, issue lists, static
+findings) are passed separately from the template, their tokens are estimated
+locally and, while the rendered prompt is over its stage's budget, they are
+compacted step by step:
+
+  dedupe      repeated lines dropped, code blocks quoted in the analysis removed
+              (the code is in the prompt already)
+  strip       comment-only and blank lines removed from the code
+  truncate    the context pieces cut down to their share of what's left
+  truncate-code  the code itself cut, as a last resort
+
+Budgets are per stage (PROMPT_BUDGET_<STAGE>, in tokens). The estimate is
+about 4 characters per token, close enough to Gemini's tokenizer for code
+and English to size prompts without a network round trip.
+
+``usage_of`` turns a model response into ``{prompt_tokens, completion_tokens,
+latency, estimated}``, using the provider's usage metadata when the response
+has it and the local estimate otherwise; ``usage_totals`` sums those per stage
+for the history record.
+"""
+import os
+import io
+import re
+import tokenize
+from typing import Callable, Dict, List, Optional, Tuple
+
+CHARS_PER_TOKEN = 4
+BUDGETS = {
+    "analysis": int(os.getenv("PROMPT_BUDGET_ANALYSIS", "6000")),
+    "issues": int(os.getenv("PROMPT_BUDGET_ISSUES", "7000")),
+    "report": int(os.getenv("PROMPT_BUDGET_REPORT", "3000")),
+    "chunk": int(os.getenv("PROMPT_BUDGET_CHUNK", "3000")),
+    "chunk_report": int(os.getenv("PROMPT_BUDGET_CHUNK_REPORT", "6000")),
+    "repo_report": int(os.getenv("PROMPT_BUDGET_REPO_REPORT", "12000")),
+}
+_FENCED = re.compile(r"```.*?(?:```|\Z)", re.S)
+_TRUNCATED = "… (truncated)"
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+# ─── Compaction ──────────────────────────────────────────────────────────────
+
+def compact_lines(code: str) -> List[Tuple[int, str]]:
+    """(line number, line) for the lines of ``code`` left without comments and blanks."""
+    try:
+        comments = {tok.start[0]: tok.start[1]
+                    for tok in tokenize.generate_tokens(io.StringIO(code).readline)
+                    if tok.type == tokenize.COMMENT}
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        # Doesn't tokenize: only drop lines that are obviously comments
+        comments = {n: line.index("#") for n, line in enumerate(code.split("\n"), 1)
+                    if line.lstrip().startswith("#")}
+    lines = []
+    for n, line in enumerate(code.split("\n"), 1):
+        if n in comments:
+            line = line[:comments[n]]
+        line = line.rstrip()
+        if line:
+            lines.append((n, line))
+    return lines
+
+
+def strip_code(code: str) -> str:
+    """``code`` without comments, blank lines and trailing whitespace."""
+    return "\n".join(line for _, line in compact_lines(code))
+
+
+def dedupe_lines(text: str) -> str:
+    """``text`` with exact repeats of earlier non-blank lines removed."""
+    seen = set()
+    lines = []
+    for line in text.split("\n"):
+        key = line.strip()
+        if key and key in seen:
+            continue
+        seen.add(key)
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def dedupe_context(text: str) -> str:
+    return dedupe_lines(_FENCED.sub("[code omitted]", text))
+
+
+def truncate(text: str, tokens: int) -> str:
+    """``text`` cut at a line boundary to about ``tokens`` tokens."""
+    if estimate_tokens(text) <= tokens:
+        return text
+    limit = max(tokens - estimate_tokens(_TRUNCATED) - 1, 0) * CHARS_PER_TOKEN
+    cut = text[:limit]
+    if "\n" in cut:
+        cut = cut[:cut.rindex("\n")]
+    return f"{cut}\n{_TRUNCATED}"
+
+
+# ─── Prompts ─────────────────────────────────────────────────────────────────
+
+class Prompt:
+    def __init__(self, stage: str, text: str, budget: int, compacted: List[str]):
+        self.stage = stage
+        self.text = text
+        self.budget = budget
+        self.tokens = estimate_tokens(text)
+        self.compacted = compacted
+
+    def info(self) -> Dict:
+        return {"budget": self.budget, "estimated_tokens": self.tokens, "compacted": self.compacted}
+
+
+def build_prompt(stage: str, render: Callable[..., str], code: Optional[str] = None,
+                 budget: Optional[int] = None, strip: Callable[[str], str] = strip_code,
+                 **context: str) -> Prompt:
+    """``render(code=..., **context)`` compacted until it fits ``stage``'s budget.
+
+    ``code`` is optional (the report prompts have none); ``context`` holds the
+    other variable-length pieces, all strings. ``strip`` compacts the code,
+    for code that is shown with line numbers.
+    """
+    budget = budget or BUDGETS[stage]
+    parts = dict(context)
+    if code is not None:
+        parts["code"] = code
+    steps: List[str] = []
+
+    def fits() -> bool:
+        return estimate_tokens(render(**parts)) <= budget
+
+    if not fits():
+        steps.append("dedupe")
+        parts.update({k: dedupe_context(v) for k, v in context.items()})
+    if not fits() and code is not None:
+        steps.append("strip")
+        parts["code"] = strip(code)
+    if not fits() and context:
+        # Split what the code and template leave evenly, but keep at least a
+        # quarter of the budget for context even when the code alone overflows
+        steps.append("truncate")
+        fixed = estimate_tokens(render(**{**parts, **{k: "" for k in context}}))
+        share = max(budget - fixed, budget // 4) // len(context)
+        parts.update({k: truncate(parts[k], share) for k in context})
+    if not fits() and code is not None:
+        steps.append("truncate-code")
+        rest = estimate_tokens(render(**{**parts, "code": ""}))
+        parts["code"] = truncate(parts["code"], budget - rest)
+    return Prompt(stage, render(**parts), budget, steps)
+
+
+# ─── Usage ───────────────────────────────────────────────────────────────────
+
+def usage_of(response, prompt: Prompt, latency: float, text: str = "") -> Dict:
+    """Token counts of one model call; ``text`` is the answer when ``response`` has no content."""
+    meta = getattr(response, "usage_metadata", None) or {}
+    if meta.get("input_tokens"):
+        return {"prompt_tokens": meta["input_tokens"],
+                "completion_tokens": meta.get("output_tokens", 0),
+                "latency": round(latency, 3), "estimated": False, **prompt.info()}
+    if not text and response is not None:
+        content = response.content
+        text = content if isinstance(content, str) else str(content)
+    return {"prompt_tokens": prompt.tokens, "completion_tokens": estimate_tokens(text),
+            "latency": round(latency, 3), "estimated": True, **prompt.info()}
+
+
+def add_usage(total: Optional[Dict], usage: Dict) -> Dict:
+    """Two usages of the same stage added up (several chunk calls, streamed pieces)."""
+    if not total:
+        return dict(usage)
+    return {**total,
+            "prompt_tokens": total["prompt_tokens"] + usage["prompt_tokens"],
+            "completion_tokens": total["completion_tokens"] + usage["completion_tokens"],
+            "latency": round(total["latency"] + usage["latency"], 3),
+            "estimated": total["estimated"] or usage["estimated"],
+            "calls": total.get("calls", 1) + usage.get("calls", 1)}
+
+
+def usage_totals(stages: Dict[str, Dict], latency: float = 0.0) -> Dict:
+    """Per-request usage for history: totals, wall-clock latency and the stages."""
+    prompt_tokens = sum(s["prompt_tokens"] for s in stages.values())
+    completion_tokens = sum(s["completion_tokens"] for s in stages.values())
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "calls": sum(s.get("calls", 1) for s in stages.values()),
+        "latency": round(latency, 3),
+        "estimated": any(s["estimated"] for s in stages.values()),
+        "stages": stages,
+    }
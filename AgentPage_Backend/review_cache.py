@@ -0,0 +1,231 @@
+"""Persistent cache of code reviews keyed by a fingerprint of the code.
+
+The fingerprint is a hash of the code's AST (``ast.dump`` without positions),
+so re-indenting, reformatting or editing comments still hits. Code that does
+not parse falls back to a hash of its text with trailing whitespace and blank
+lines normalized away. The model name is part of the key.
+
+Entries live in SQLite (``~/.synnccit/review_cache.db``), so they survive
+restarts. Once the stored reviews exceed REVIEW_CACHE_MAX_BYTES, the least
+recently used ones are evicted. Triggers keep each table's total size in
+``cache_size``, so a store checks the limit without summing the table.
+
+The same database keeps the chunked reviewer's per-definition results (keyed
+by the definition's own fingerprint, line numbers stored relative to its
+first line) and, per file path, the definitions of the last submission, so a
+re-submitted file only has its changed functions reviewed again.
+"""
+import os
+import ast
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CACHE_DB = os.getenv("REVIEW_CACHE_DB",
+                     os.path.join(os.path.expanduser("~"), ".synnccit", "review_cache.db"))
+MAX_BYTES = int(os.getenv("REVIEW_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+MODEL_NAME = os.getenv("GOOGLE_MODEL", "gemini-1.5-flash")    # same default as agent.py
+
+
+def code_fingerprint(code: str) -> Tuple[str, str]:
+    """("ast" | "text", hex digest) for ``code``.
+
+    Whole submissions only get here once they parse, but the chunked reviewer
+    also fingerprints pieces of a file: a method whose multi-line string starts
+    at column 0 can't be dedented and won't parse alone, hence the text hash.
+    """
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        lines = [line.rstrip() for line in code.replace("\r\n", "\n").split("\n")]
+        text = "\n".join(line for line in lines if line)
+        return "text", hashlib.sha256(text.encode("utf-8")).hexdigest()
+    dump = ast.dump(tree, annotate_fields=False, include_attributes=False)
+    return "ast", hashlib.sha256(dump.encode("utf-8")).hexdigest()
+
+
+class ReviewCache:
+    def __init__(self, path: str = CACHE_DB, max_bytes: int = MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.chunk_hits = 0
+        self.chunk_misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS reviews (
+                    key       TEXT PRIMARY KEY,
+                    kind      TEXT NOT NULL,
+                    review    TEXT NOT NULL,
+                    size      INTEGER NOT NULL,
+                    created   REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS reviews_lru ON reviews(last_used)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunk_reviews (
+                    key       TEXT PRIMARY KEY,
+                    review    TEXT NOT NULL,
+                    size      INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS chunk_reviews_lru ON chunk_reviews(last_used)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS file_parts (
+                    path    TEXT PRIMARY KEY,
+                    parts   TEXT NOT NULL,
+                    updated REAL NOT NULL
+                )""")
+            # REPLACE deletes the old row; only fires its delete trigger with this on
+            conn.execute("PRAGMA recursive_triggers = ON")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("CREATE TABLE IF NOT EXISTS cache_size (tbl TEXT PRIMARY KEY, bytes INTEGER NOT NULL)")
+                for table in ("reviews", "chunk_reviews"):
+                    conn.execute(f"""
+                        CREATE TRIGGER IF NOT EXISTS {table}_size_add AFTER INSERT ON {table} BEGIN
+                            UPDATE cache_size SET bytes = bytes + new.size WHERE tbl = '{table}';
+                        END""")
+                    conn.execute(f"""
+                        CREATE TRIGGER IF NOT EXISTS {table}_size_remove AFTER DELETE ON {table} BEGIN
+                            UPDATE cache_size SET bytes = bytes - old.size WHERE tbl = '{table}';
+                        END""")
+                    # Databases from before the counter start from their current size
+                    conn.execute(f"INSERT OR IGNORE INTO cache_size SELECT '{table}', COALESCE(SUM(size), 0) "
+                                 f"FROM {table}")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def key_for(code: str, model: str = MODEL_NAME) -> Tuple[str, str]:
+        kind, digest = code_fingerprint(code)
+        return f"{kind}:{model}:{digest}", kind
+
+    def get(self, code: str, model: str = MODEL_NAME) -> Optional[Dict]:
+        """The stored ``{analysis, issues, report}`` for ``code``, if any."""
+        key, _ = self.key_for(code, model)
+        conn = self._connect()
+        row = conn.execute("SELECT review FROM reviews WHERE key = ?", (key,)).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        conn.execute("UPDATE reviews SET last_used = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, code: str, review: Dict, model: str = MODEL_NAME):
+        key, kind = self.key_for(code, model)
+        data = json.dumps(review)
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO reviews (key, kind, review, size, created, last_used) "
+            "VALUES (?, ?, ?, ?, ?, ?)", (key, kind, data, len(data), now, now))
+        with self._lock:
+            self.stores += 1
+        self._evict(conn, "reviews")
+
+    # ── Per-definition results for incremental chunked reviews ──
+    def get_chunk(self, fingerprint: str, model: str = MODEL_NAME) -> Optional[Dict]:
+        key = f"{model}:{fingerprint}"
+        conn = self._connect()
+        row = conn.execute("SELECT review FROM chunk_reviews WHERE key = ?", (key,)).fetchone()
+        with self._lock:
+            if row is None:
+                self.chunk_misses += 1
+                return None
+            self.chunk_hits += 1
+        conn.execute("UPDATE chunk_reviews SET last_used = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put_chunk(self, fingerprint: str, review: Dict, model: str = MODEL_NAME):
+        data = json.dumps(review)
+        conn = self._connect()
+        conn.execute("INSERT OR REPLACE INTO chunk_reviews (key, review, size, last_used) VALUES (?, ?, ?, ?)",
+                     (f"{model}:{fingerprint}", data, len(data), time.time()))
+        self._evict(conn, "chunk_reviews")
+
+    def file_parts(self, path: str) -> Optional[Dict[str, str]]:
+        """{definition name: fingerprint} of the last submission of ``path``."""
+        row = self._connect().execute("SELECT parts FROM file_parts WHERE path = ?", (path,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_file_parts(self, path: str, parts: Dict[str, str]):
+        self._connect().execute("INSERT OR REPLACE INTO file_parts (path, parts, updated) VALUES (?, ?, ?)",
+                                (path, json.dumps(parts), time.time()))
+
+    def _evict(self, conn: sqlite3.Connection, table: str):
+        total = conn.execute("SELECT bytes FROM cache_size WHERE tbl = ?", (table,)).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in conn.execute(f"SELECT key, size FROM {table} ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute(f"DELETE FROM {table} WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        with self._lock:
+            self.evictions += evicted
+        logger.info(f"Review cache evicted {evicted} entries")
+
+    def clear(self):
+        conn = self._connect()
+        for table in ("reviews", "chunk_reviews", "file_parts"):
+            conn.execute(f"DELETE FROM {table}")
+
+    def stats(self) -> Dict:
+        conn = self._connect()
+        entries = conn.execute("SELECT COUNT(*) FROM reviews").fetchone()[0]
+        size = conn.execute("SELECT bytes FROM cache_size WHERE tbl = 'reviews'").fetchone()[0]
+        chunk_entries = conn.execute("SELECT COUNT(*) FROM chunk_reviews").fetchone()[0]
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "bytes": size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "chunk_entries": chunk_entries,
+                "chunk_hits": self.chunk_hits,
+                "chunk_misses": self.chunk_misses,
+            }
+
+
+_cache: Optional[ReviewCache] = None
+_cache_guard = threading.Lock()
+
+
+def get_review_cache() -> ReviewCache:
+    global _cache
+    with _cache_guard:
+        if _cache is None:
+            _cache = ReviewCache()
+        return _cache
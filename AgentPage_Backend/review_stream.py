@@ -0,0 +1,100 @@
+"""Streaming code review for /review/stream and the /review/ws WebSocket.
+
+The graph is run with LangGraph's ``astream`` in "messages" + "updates" mode,
+so every model token is forwarded as soon as Gemini produces it, tagged with
+the stage (node) it belongs to. With ``fast`` the fast graph is used: the
+analysis and the issue list are generated concurrently and their tokens
+interleave.
+
+Events:
+  {type: 'static', ok, findings, stats}        local static analysis, before any model call
+  {type: 'stage', stage}                       first token of a stage
+  {type: 'token', stage, data}
+  {type: 'stage_done', stage, result, elapsed, usage}
+  {type: 'done', analysis, issues, report, elapsed, cached, usage}
+  {type: 'error', error}
+
+A review found in the review cache, or the model-free review of code with a
+syntax error, is replayed as its stage_done events and ``done`` straight away.
+
+``usage`` is the stage's token usage, and on ``done`` the request's totals
+(see prompt_budget.usage_totals); zero for replays, which call no model.
+"""
+import json
+import time
+from typing import AsyncIterator, Dict
+
+from prompt_budget import usage_totals
+
+STAGES = {"analyzer": "analysis", "issue_finder": "issues", "report_generator": "report"}
+RESULT_KEYS = {"analysis": "initial_analysis", "issues": "issues", "report": "final_report"}
+
+
+def initial_state(code: str, static_findings: str = "") -> Dict:
+    return {
+        "code": code,
+        "initial_analysis": "",
+        "issues": [],
+        "final_report": "",
+        "static_findings": static_findings,
+        "usage": {}
+    }
+
+
+def message_text(content) -> str:
+    # Chunk content is a string, or a list of parts for multi-part messages
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content or [])
+
+
+async def review_events(agent, code: str, fast: bool = False,
+                        static_findings: str = "") -> AsyncIterator[Dict]:
+    graph = agent.fast_graph if fast else agent.graph
+    state = initial_state(code, static_findings)
+    started = set()
+    t0 = time.monotonic()
+    try:
+        async for mode, chunk in graph.astream(state, stream_mode=["messages", "updates"]):
+            if mode == "messages":
+                message, meta = chunk
+                stage = STAGES.get(meta.get("langgraph_node"))
+                text = message_text(message.content)
+                if stage is None or not text:
+                    continue
+                if stage not in started:
+                    started.add(stage)
+                    yield {"type": "stage", "stage": stage}
+                yield {"type": "token", "stage": stage, "data": text}
+            else:
+                for node, update in chunk.items():
+                    stage = STAGES.get(node)
+                    if stage is None or not update:
+                        continue
+                    usage = update.get("usage", {})
+                    state.update({**update, "usage": {**state["usage"], **usage}})
+                    yield {"type": "stage_done", "stage": stage,
+                           "result": state[RESULT_KEYS[stage]],
+                           "elapsed": round(time.monotonic() - t0, 3),
+                           "usage": usage.get(stage)}
+    except Exception as e:
+        yield {"type": "error", "error": str(e)}
+        return
+    yield {"type": "done",
+           "analysis": state["initial_analysis"],
+           "issues": state["issues"],
+           "report": state["final_report"],
+           "elapsed": round(time.monotonic() - t0, 3),
+           "cached": False,
+           "usage": usage_totals(state["usage"], time.monotonic() - t0)}
+
+
+async def replay_events(review: Dict, cached: bool = True) -> AsyncIterator[Dict]:
+    for stage in ("analysis", "issues", "report"):
+        yield {"type": "stage_done", "stage": stage, "result": review[stage], "elapsed": 0, "usage": None}
+    yield {"type": "done", "chunks": None, **review, "elapsed": 0, "cached": cached,
+           "usage": usage_totals({})}
+
+
+def sse(event: Dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
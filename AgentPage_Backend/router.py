@@ -1,13 +1,28 @@
-from fastapi import APIRouter
-from schema import CodeReviewRequest, ExecuteCodeRequest
+from fastapi import APIRouter, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from schema import BatchReviewRequest, CodeReviewRequest, ExecuteCodeRequest
 from execution import execute_python_code
 from history import add_history_record, get_all_history
+from review_stream import review_events, replay_events, sse
+from review_cache import get_review_cache
+from chunked_review import chunked_review_events, should_chunk
+from static_analysis import analyze, format_findings, syntax_error_review
+from prompt_budget import usage_totals
+from batch_review import BATCH_WORKERS, DEFAULT_WORKSPACE, batch_review_events, collect_files
 import uuid
 from datetime import datetime
 import logging
 
 logger = logging.getLogger(__name__)
 
+try:
+    # Mounted in the DeveloperPage app: batch reviews stay inside the client's workspace
+    from workspace_state import get_cwd
+except ImportError:
+    def get_cwd(session_id):
+        return DEFAULT_WORKSPACE
+
 # Lazy-loaded agent — only created on first API call, not at import/startup.
 # This prevents a crash on module load when GEMINI_API_KEY is not set.
 _agent = None
@@ -29,33 +44,150 @@ agent_router = APIRouter()
 def root():
     return {"message": "Agent Backend is running 🚀"}
 
-@agent_router.post("/review")
-def review_code(request: CodeReviewRequest):
-    agent = _get_agent()
-    initial_state = {
-        "code": request.code,
-        "initial_analysis": "",
-        "issues": [],
-        "final_report": ""
-    }
-    result = agent.graph.invoke(initial_state)
-    record = {
+def _review_record(code, analysis, issues, report, usage=None, **extra):
+    # usage: prompt/completion tokens and latency of the model calls (none for cached reviews)
+    return {
         "id": str(uuid.uuid4()),
         "timestamp": datetime.utcnow().isoformat(),
-        "input_code": request.code,
+        "input_code": code,
         "review": {
-            "analysis": result["initial_analysis"],
-            "issues": result["issues"],
-            "report": result["final_report"]
+            "analysis": analysis,
+            "issues": issues,
+            "report": report,
+            **extra
         },
+        "usage": usage or usage_totals({}),
         "execution": None
     }
-    add_history_record(record)
-    return {
-        "analysis": record["review"]["analysis"],
-        "issues": record["review"]["issues"],
-        "report": record["review"]["report"]
-    }
+
+@agent_router.post("/review")
+async def review_code(request: CodeReviewRequest):
+    # Cache, history and the syntax-error short-circuit are all handled in
+    # _streamed_review; /review returns only its final event
+    static = await run_in_threadpool(analyze, request.code)
+    return await _review_response(request, static)
+
+async def _review_response(request: CodeReviewRequest, static):
+    """The /review response: the ``done`` event of ``_streamed_review``."""
+    async for event in _streamed_review(request, static):
+        if event["type"] == "error":
+            return JSONResponse(status_code=500, content={"error": event["error"]})
+        if event["type"] == "done":
+            return {**{key: event[key] for key in
+                       ("analysis", "issues", "report", "chunks", "changes", "reviewed", "cached", "usage")
+                       if key in event},
+                    "static": static}
+
+async def _streamed_review(request: CodeReviewRequest, static=None, throttle=None):
+    """Review events for ``request``, from the cache or the graph.
+
+    The one place reviews are cached and recorded: every review gets a history
+    record, cache hits and syntax-error reviews included. The static analysis
+    comes first; code with a syntax error never reaches the model. ``throttle``
+    is awaited only right before the model is called (batch rate limiting).
+    """
+    if static is None:
+        static = await run_in_threadpool(analyze, request.code)
+        yield {"type": "static", **static}
+    cache = get_review_cache()
+    cached = None if request.no_cache or not static["ok"] else await run_in_threadpool(cache.get, request.code)
+    if not static["ok"]:
+        events = replay_events(syntax_error_review(static), cached=False)
+    elif cached is not None:
+        events = replay_events(cached)
+    else:
+        if throttle is not None:
+            await throttle()
+        if should_chunk(request.code, request.chunked, request.path):
+            events = chunked_review_events((await run_in_threadpool(_get_agent)).llm, request.code,
+                                           cache, request.path, static["findings"])
+        else:
+            events = review_events(await run_in_threadpool(_get_agent), request.code, request.fast,
+                                   format_findings(static["findings"]))
+    async for event in events:
+        if event["type"] == "done":
+            review = {key: event[key] for key in ("analysis", "issues", "report", "chunks") if key in event}
+            await run_in_threadpool(add_history_record,
+                                    _review_record(request.code, usage=event.get("usage"), **review))
+            if not event["cached"] and static["ok"]:
+                await run_in_threadpool(cache.put, request.code, review)
+        yield event
+
+@agent_router.post("/review/stream")
+async def review_code_stream(request: CodeReviewRequest):
+    """Same review as /review, streamed as Server-Sent Events while it is generated."""
+    async def stream():
+        try:
+            async for event in _streamed_review(request):
+                yield sse(event)
+        except RuntimeError as e:
+            yield sse({"type": "error", "error": str(e)})
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+@agent_router.websocket("/review/ws")
+async def review_code_ws(websocket: WebSocket):
+    """Streamed reviews over a WebSocket: send {code, fast}, receive the review events."""
+    await websocket.accept()
+    try:
+        while True:
+            request = CodeReviewRequest(**await websocket.receive_json())
+            async for event in _streamed_review(request):
+                await websocket.send_json(event)
+    except WebSocketDisconnect:
+        pass
+    except (ValueError, RuntimeError) as e:
+        await websocket.send_json({"type": "error", "error": str(e)})
+        await websocket.close()
+
+@agent_router.post("/review/batch")
+async def review_batch(request: BatchReviewRequest, http: Request):
+    """Review a workspace or a list of files, streamed as Server-Sent Events."""
+    workspace = await run_in_threadpool(get_cwd, getattr(http.state, "session_id", None))
+    try:
+        files, skipped = await run_in_threadpool(collect_files, workspace, request.root, request.files,
+                                                 request.include, request.exclude)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    async def review_file(code, path, throttle):
+        # The usual single-file review; the path makes re-runs incremental
+        static = await run_in_threadpool(analyze, code)
+        file_request = CodeReviewRequest(code=code, path=path, fast=request.fast, no_cache=request.no_cache)
+        async for event in _streamed_review(file_request, static, throttle):
+            if event["type"] == "error":
+                raise RuntimeError(event["error"])
+            if event["type"] == "done":
+                return {**event, "static": static}
+        raise RuntimeError("Review ended without a result")
+
+    async def stream():
+        try:
+            llm = (await run_in_threadpool(_get_agent)).llm
+        except RuntimeError as e:
+            yield sse({"type": "error", "error": str(e)})
+            return
+        workers = min(request.workers or BATCH_WORKERS, BATCH_WORKERS)
+        async for event in batch_review_events(llm, files, skipped, review_file, workers):
+            yield sse(event)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+@agent_router.post("/review/static")
+def static_review(request: CodeReviewRequest):
+    """Only the local static analysis: findings and stats, no model call."""
+    return analyze(request.code)
+
+@agent_router.get("/review/cache")
+def review_cache_stats():
+    return get_review_cache().stats()
+
+@agent_router.delete("/review/cache")
+def clear_review_cache():
+    get_review_cache().clear()
+    return {"success": True}
 
 @agent_router.post("/execute")
 def execute_code(request: ExecuteCodeRequest):
@@ -1,8 +1,21 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 
 class CodeReviewRequest(BaseModel):
     code: str
+    fast: bool = False   # run analysis and issue finding concurrently
+    no_cache: bool = False   # ignore a cached review of the same code
+    chunked: Optional[bool] = None   # map-reduce review by function/class; auto for big files
+    path: Optional[str] = None   # file identity: re-submissions only re-review changed functions
+
+class BatchReviewRequest(BaseModel):
+    root: Optional[str] = None   # folder to walk, inside the workspace (default: the workspace)
+    files: Optional[List[str]] = None   # or these files, relative to root
+    include: Optional[List[str]] = None   # globs relative to root; default *.py
+    exclude: Optional[List[str]] = None
+    fast: bool = False
+    no_cache: bool = False
+    workers: Optional[int] = None   # concurrent file reviews, capped at BATCH_REVIEW_WORKERS
 
 class ExecuteCodeRequest(BaseModel):
     code: str
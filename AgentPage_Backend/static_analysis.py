@@ -0,0 +1,319 @@
+"""Static pre-analysis that runs before the LLM review.
+
+A single ``ast.NodeVisitor`` pass over the code collects what a linter would
+find, so the model neither has to rediscover it nor gets called at all for
+code that does not parse:
+
+  syntax-error        the code does not parse (the review stops here)
+  complexity          cyclomatic complexity above STATIC_MAX_COMPLEXITY
+  long-function       more than STATIC_MAX_FUNCTION_LINES lines
+  too-many-args       more than STATIC_MAX_ARGS parameters
+  unused-import       imported name never used (outside ``__all__``)
+  unused-variable     local assigned but never read
+  shadowed-builtin    assignment, parameter or definition named like a builtin
+  redefined           function or class defined twice in one scope, unused in between
+  unreachable         statements after return / raise / break / continue
+  bare-except         ``except:`` catching everything, including KeyboardInterrupt
+  swallowed-exception ``except …: pass``
+  mutable-default     list / dict / set literal as a default argument
+  none-comparison     ``== None`` / ``!= None``
+  range-len           ``for i in range(len(x))``
+  star-import         ``from x import *``
+
+Findings are kept compact (``format_findings``) for the review prompts.
+"""
+import os
+import ast
+import builtins
+from typing import Dict, List, Optional
+
+MAX_COMPLEXITY = int(os.getenv("STATIC_MAX_COMPLEXITY", "10"))
+MAX_FUNCTION_LINES = int(os.getenv("STATIC_MAX_FUNCTION_LINES", "50"))
+MAX_ARGS = int(os.getenv("STATIC_MAX_ARGS", "6"))
+PROMPT_FINDINGS = 25        # findings quoted in a prompt
+
+BUILTINS = {name for name in dir(builtins) if not name.startswith("_") and name.islower()}
+_BRANCHES = (ast.If, ast.For, ast.AsyncFor, ast.While, ast.IfExp, ast.ExceptHandler,
+             ast.Assert, ast.comprehension)
+_TERMINAL = (ast.Return, ast.Raise, ast.Break, ast.Continue)
+
+
+class _Scope:
+    def __init__(self, kind: str, name: str):
+        self.kind = kind              # module | function | class
+        self.name = name
+        self.assigned: Dict[str, int] = {}
+        self.imports: Dict[str, int] = {}
+        self.definitions: Dict[str, int] = {}
+        self.used = set()
+        self.declared = set()         # global / nonlocal names
+        self.complexity = 1
+
+
+class _Analyzer(ast.NodeVisitor):
+    def __init__(self):
+        self.findings: List[Dict] = []
+        self.scopes: List[_Scope] = []
+        self.exported = set()
+        self.functions = 0
+        self.classes = 0
+        self.max_complexity = 0
+
+    def add(self, node, severity: str, code: str, message: str):
+        self.findings.append({
+            "line": getattr(node, "lineno", 1),
+            "end_line": getattr(node, "end_lineno", None) or getattr(node, "lineno", 1),
+            "severity": severity,
+            "code": code,
+            "message": message,
+        })
+
+    @property
+    def scope(self) -> _Scope:
+        return self.scopes[-1]
+
+    # ── Scopes ──
+    def visit_Module(self, node):
+        self.scopes.append(_Scope("module", "<module>"))
+        self._block(node.body)
+        self.generic_visit(node)
+        self._close_scope(self.scopes.pop())
+
+    def _function(self, node):
+        self.functions += 1
+        args = node.args
+        params = args.posonlyargs + args.args + args.kwonlyargs
+        if args.vararg:
+            params.append(args.vararg)
+        if args.kwarg:
+            params.append(args.kwarg)
+        names = [a.arg for a in params if a.arg not in ("self", "cls")]
+        if len(names) > MAX_ARGS:
+            self.add(node, "info", "too-many-args", f"'{node.name}' takes {len(names)} parameters")
+        for default in args.defaults + [d for d in args.kw_defaults if d is not None]:
+            if isinstance(default, (ast.List, ast.Dict, ast.Set)):
+                self.add(default, "warning", "mutable-default",
+                         f"Mutable default argument in '{node.name}' is shared between calls")
+        length = (node.end_lineno or node.lineno) - node.lineno + 1
+        if length > MAX_FUNCTION_LINES:
+            self.add(node, "info", "long-function", f"'{node.name}' is {length} lines long")
+
+        # Decorators and defaults belong to the enclosing scope
+        for expr in node.decorator_list + args.defaults + [d for d in args.kw_defaults if d]:
+            self.visit(expr)
+        if node.returns:
+            self.visit(node.returns)
+        self._define(node, node.name)
+        scope = _Scope("function", node.name)
+        self.scopes.append(scope)
+        for a in params:
+            if a.arg in BUILTINS:
+                self.add(a, "warning", "shadowed-builtin", f"Parameter '{a.arg}' shadows a builtin")
+            if a.annotation:
+                self.visit(a.annotation)
+        self._block(node.body)
+        for stmt in node.body:
+            self.visit(stmt)
+        self.scopes.pop()
+        self._close_scope(scope)
+        self.max_complexity = max(self.max_complexity, scope.complexity)
+        if scope.complexity > MAX_COMPLEXITY:
+            self.add(node, "warning", "complexity",
+                     f"'{node.name}' has cyclomatic complexity {scope.complexity} (max {MAX_COMPLEXITY})")
+
+    visit_FunctionDef = _function
+    visit_AsyncFunctionDef = _function
+
+    def visit_ClassDef(self, node):
+        self.classes += 1
+        for expr in node.decorator_list + node.bases + [k.value for k in node.keywords]:
+            self.visit(expr)
+        self._define(node, node.name)
+        self.scopes.append(_Scope("class", node.name))
+        self._block(node.body)
+        for stmt in node.body:
+            self.visit(stmt)
+        self.scopes.pop()
+
+    def _define(self, node, name: str):
+        scope = self.scope
+        # Decorated redefinitions are usually deliberate (@x.setter, @overload)
+        if name in scope.definitions and name not in scope.used and not node.decorator_list:
+            self.add(node, "warning", "redefined",
+                     f"'{name}' redefines the definition on line {scope.definitions[name]}")
+        # Methods and class attributes are reached through the class: no shadowing
+        if name in BUILTINS and scope.kind != "class":
+            self.add(node, "warning", "shadowed-builtin", f"'{name}' shadows a builtin")
+        scope.definitions[name] = node.lineno
+        scope.assigned.setdefault(name, node.lineno)
+
+    def _close_scope(self, scope: _Scope):
+        if scope.kind == "module":
+            for name, line in scope.imports.items():
+                if name not in scope.used and name not in self.exported:
+                    self.findings.append({"line": line, "end_line": line, "severity": "warning",
+                                          "code": "unused-import", "message": f"'{name}' imported but unused"})
+        elif scope.kind == "function":
+            for name, line in scope.assigned.items():
+                if (name not in scope.used and name not in scope.declared and name not in scope.definitions
+                        and not name.startswith("_")):
+                    self.findings.append({"line": line, "end_line": line, "severity": "info",
+                                          "code": "unused-variable",
+                                          "message": f"'{name}' is assigned but never used"})
+
+    # ── Names ──
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load):
+            for scope in self.scopes:      # closures and globals read from inner scopes
+                scope.used.add(node.id)
+        else:
+            scope = self.scope
+            if node.id in BUILTINS and scope.kind != "class":
+                self.add(node, "warning", "shadowed-builtin", f"'{node.id}' shadows a builtin")
+            scope.assigned.setdefault(node.id, node.lineno)
+            if isinstance(node.ctx, ast.Del):
+                scope.used.add(node.id)
+
+    def visit_AugAssign(self, node):
+        # x += 1 reads x as well
+        if isinstance(node.target, ast.Name):
+            self.scope.used.add(node.target.id)
+        self.generic_visit(node)
+
+    def visit_Global(self, node):
+        self.scope.declared.update(node.names)
+
+    visit_Nonlocal = visit_Global
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            name = alias.asname or alias.name.split(".")[0]
+            self.scope.imports.setdefault(name, node.lineno)
+
+    def visit_ImportFrom(self, node):
+        if node.module == "__future__":
+            return
+        for alias in node.names:
+            if alias.name == "*":
+                self.add(node, "warning", "star-import", f"'from {node.module} import *' hides where names come from")
+                continue
+            self.scope.imports.setdefault(alias.asname or alias.name, node.lineno)
+
+    def visit_Assign(self, node):
+        # __all__ = [...] marks re-exported imports as used
+        if any(isinstance(t, ast.Name) and t.id == "__all__" for t in node.targets):
+            if isinstance(node.value, (ast.List, ast.Tuple)):
+                self.exported.update(e.value for e in node.value.elts
+                                     if isinstance(e, ast.Constant) and isinstance(e.value, str))
+        self.generic_visit(node)
+
+    # ── Control flow ──
+    def _block(self, body: List[ast.stmt]):
+        """Unreachable statements after a terminal one in ``body``."""
+        for stmt, following in zip(body, body[1:]):
+            if isinstance(stmt, _TERMINAL):
+                self.add(following, "warning", "unreachable", "Code after this point never runs")
+                break
+
+    def generic_visit(self, node):
+        if isinstance(node, _BRANCHES) and self.scopes:
+            self.scope.complexity += 1 + (len(node.ifs) if isinstance(node, ast.comprehension) else 0)
+        for field in ("body", "orelse", "finalbody"):
+            block = getattr(node, field, None)
+            if isinstance(block, list) and block and isinstance(block[0], ast.stmt) \
+                    and not isinstance(node, (ast.Module, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                self._block(block)
+        super().generic_visit(node)
+
+    def visit_BoolOp(self, node):
+        self.scope.complexity += len(node.values) - 1
+        self.generic_visit(node)
+
+    def visit_match_case(self, node):
+        self.scope.complexity += 1
+        self.generic_visit(node)
+
+    def visit_ExceptHandler(self, node):
+        if node.type is None:
+            self.add(node, "warning", "bare-except", "Bare 'except:' also catches KeyboardInterrupt and SystemExit")
+        if len(node.body) == 1 and isinstance(node.body[0], ast.Pass):
+            self.add(node, "warning", "swallowed-exception", "Exception is silently ignored")
+        if node.name:
+            self.scope.assigned.setdefault(node.name, node.lineno)
+            self.scope.used.add(node.name)
+        self.generic_visit(node)
+
+    def visit_Compare(self, node):
+        for op, right in zip(node.ops, node.comparators):
+            if isinstance(op, (ast.Eq, ast.NotEq)) and isinstance(right, ast.Constant) and right.value is None:
+                self.add(node, "info", "none-comparison", "Compare to None with 'is' / 'is not'")
+        self.generic_visit(node)
+
+    def _loop(self, node):
+        it = node.iter
+        if (isinstance(it, ast.Call) and isinstance(it.func, ast.Name) and it.func.id == "range"
+                and len(it.args) == 1 and isinstance(it.args[0], ast.Call)
+                and isinstance(it.args[0].func, ast.Name) and it.args[0].func.id == "len"):
+            self.add(node, "info", "range-len", "Iterate over the sequence (or enumerate) instead of range(len(...))")
+        self.generic_visit(node)
+
+    visit_For = _loop
+    visit_AsyncFor = _loop
+
+
+def analyze(code: str) -> Dict:
+    """``{ok, findings, stats}`` for ``code``; ``ok`` is False when it does not parse."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        line = e.lineno or 1
+        return {
+            "ok": False,
+            "findings": [{"line": line, "end_line": line, "severity": "error", "code": "syntax-error",
+                          "message": f"{e.msg} (line {line}, column {e.offset or 0})"}],
+            "stats": {},
+        }
+    except ValueError as e:          # e.g. NUL bytes
+        return {"ok": False,
+                "findings": [{"line": 1, "end_line": 1, "severity": "error", "code": "syntax-error",
+                              "message": str(e)}],
+                "stats": {}}
+    analyzer = _Analyzer()
+    analyzer.visit(tree)
+    findings = sorted(analyzer.findings, key=lambda f: (f["line"], f["code"]))
+    return {
+        "ok": True,
+        "findings": findings,
+        "stats": {
+            "lines": code.count("\n") + 1,
+            "functions": analyzer.functions,
+            "classes": analyzer.classes,
+            "max_complexity": analyzer.max_complexity,
+        },
+    }
+
+
+def format_finding(finding: Dict) -> str:
+    return f"L{finding['line']} {finding['severity']} {finding['code']}: {finding['message']}"
+
+
+def format_findings(findings: List[Dict], start: int = 1, end: Optional[int] = None,
+                    limit: int = PROMPT_FINDINGS) -> str:
+    """Compact findings within lines ``start``..``end`` for a prompt ('' if none)."""
+    picked = [f for f in findings if f["line"] >= start and (end is None or f["line"] <= end)]
+    lines = [format_finding(f) for f in picked[:limit]]
+    if len(picked) > limit:
+        lines.append(f"... and {len(picked) - limit} more")
+    return "\n".join(lines)
+
+
+def syntax_error_review(result: Dict) -> Dict:
+    """A complete review for code that does not parse, without any model call."""
+    errors = [format_finding(f) for f in result["findings"]]
+    return {
+        "analysis": "The code does not parse, so it was not sent for an AI review.",
+        "issues": errors,
+        "report": "Summary\nThe code has a syntax error and cannot run.\n\nIssues\n"
+                  + "\n".join(f"- {e}" for e in errors)
+                  + "\n\nRecommendation\nFix the syntax error and submit the code again.",
+    }
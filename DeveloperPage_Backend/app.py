@@ -1,10 +1,12 @@
 import os
+import re
 import json
+import uuid
 import asyncio
 import asyncio.subprocess
 import platform
 from fastapi import FastAPI, Request, UploadFile, File, Form, WebSocket, WebSocketDisconnect
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
@@ -15,7 +17,35 @@ env_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../.env'))
 load_dotenv(env_path)
 import subprocess
 from typing import List, Optional, Dict
-from watchfiles import awatch
+from terminal_io import FrameWriter, pump_output, wants_compression, wants_acks
+from terminal_sessions import (
+    TERMINAL_SESSIONS, SESSION_GRACE, TerminalSession, PtySession, PipeSession,
+)
+from terminal_pool import ShellPool, POOL_SIZE
+from file_tree import scan_folder, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from workspace_index import get_index, find_index, close_all as close_workspace_indexes
+from fs_watcher import get_hub, all_hubs
+from ignore_rules import get_rules, rules_for
+from file_io import (
+    STREAM_THRESHOLD, etag_for, last_modified, not_modified, is_binary,
+    parse_range, parse_lines, read_lines, iter_file,
+    content_hash, save_text, StaleBaseError,
+)
+from workspace_state import (
+    SessionMiddleware, DEFAULT_WORKSPACE, get_cwd, set_cwd, prune as prune_workspace_sessions,
+)
+from translation_cache import get_translation_cache
+from intent_translator import (
+    translate as translate_intent, translate_batch as translate_intents, local_answer, os_label,
+    stats as translator_stats,
+)
+from command_jobs import JobRunner, QueueFullError, collect
+from uploads import UploadError, save_upload, create_upload, get_upload
+from search_index import (
+    Query, ACTIVE_SEARCHES, DEFAULT_MAX_RESULTS, MAX_RESULTS,
+    get_search_index, run_search, warm as warm_search_index, all_search_indexes,
+    close_all as close_search_indexes,
+)
 
 # ─── System Detection ────────────────────────────────────────────────────────
 SYSTEM = platform.system()          # 'Windows', 'Linux', 'Darwin'
@@ -45,15 +75,38 @@ try:
 except ImportError:
     HAS_GENAI = False
 
+class FileEdit(BaseModel):
+    start: int          # UTF-16 offsets into the base text
+    end: int
+    text: str = ""
+
 class FileSaveRequest(BaseModel):
     path: str
-    content: str
+    content: Optional[str] = None
+    # Delta save: edits against the version whose hash is base_hash
+    patch: Optional[List[FileEdit]] = None
+    base_hash: Optional[str] = None
+
+class UploadStartRequest(BaseModel):
+    filename: str
+    size: int
+    path: Optional[str] = None
+    sha256: Optional[str] = None    # checked once the last chunk arrives
 
 class TerminalRequest(BaseModel):
     command: str
+    timeout: Optional[float] = None     # seconds; COMMAND_TIMEOUT_SECONDS by default
+    stream: Optional[str] = None        # 'ndjson' | 'sse' to stream output as it comes
 
 class AgentRequest(BaseModel):
     prompt: str
+    no_cache: bool = False      # skip the translation cache and refresh it
+
+class AgentBatchRequest(BaseModel):
+    prompts: List[str]
+    no_cache: bool = False
+
+MAX_BATCH_PROMPTS = 100
 
 app = FastAPI()
 
@@ -65,6 +118,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Workspace folder is per client session (see workspace_state)
+app.add_middleware(SessionMiddleware)
 
 import logging
 
@@ -112,7 +167,19 @@ except ImportError as e:
     logger.error(f"Failed to import AgentPage router: {e}")
 
 # Global state
-CURRENT_DIR = os.getcwd()
+USE_WORKSPACE_INDEX = os.getenv("WORKSPACE_INDEX", "1") != "0"
+SHELL_POOL: Optional[ShellPool] = None
+# Queue and concurrency cap for POST /api/terminal commands
+COMMAND_JOBS = JobRunner()
+
+
+def _cwd(conn) -> str:
+    """Workspace folder of the client behind a Request / WebSocket."""
+    return get_cwd(conn.state.session_id)
+
+
+def _set_cwd(conn, path: str) -> str:
+    return set_cwd(conn.state.session_id, path)
 
 # Configure GenAI
 model = None
@@ -140,396 +207,613 @@ async def terminal_websocket(websocket: WebSocket):
     • Windows  → spawns cmd.exe with asyncio subprocess + piped I/O
     • Unix/Mac → spawns bash/zsh via PTY for proper TTY support
 
+    Sessions outlive their WebSocket for TERMINAL_SESSION_GRACE_SECONDS.
+    Connecting with ``?session=<id>`` reattaches to that shell (replaying its
+    scrollback) or starts a new one under that id. The id is also announced
+    to the client as a private OSC sequence: ESC ] 6973 ; session=<id> BEL.
+
     Message protocol (JSON):
       client → server  { type: 'input',  data: '<chars>' }
       client → server  { type: 'resize', rows: N, cols: N }
+      client → server  { type: 'ack', frames: N }  (only with ?flow=ack)
       server → client  raw text / ANSI sequences
+      server → client  binary raw-deflate frames with ?compress=deflate
     """
-    global CURRENT_DIR
     await websocket.accept()
-    logger.info(f"Terminal WS connected | system={SYSTEM} | shell={SHELL_NAME} | cwd={CURRENT_DIR}")
-
-    # Send a welcome banner so the user knows what shell they got
-    await websocket.send_text(
-        f"\r\n\x1b[32m[SynnccIT Terminal]\x1b[0m "
-        f"\x1b[90m{SYSTEM} · {SHELL_NAME}\x1b[0m\r\n"
-    )
 
-    if IS_WINDOWS:
-        await _run_windows_terminal(websocket)
-    elif HAS_PTY:
-        await _run_pty_terminal(websocket)
+    cwd = _cwd(websocket)
+    requested = websocket.query_params.get("session")
+    session = TERMINAL_SESSIONS.get(requested) if requested else None
+    reattached = session is not None and not session.eof
+    if not reattached:
+        logger.info(f"Terminal WS connected | system={SYSTEM} | shell={SHELL_NAME} | cwd={cwd}")
+        try:
+            session = await _spawn_terminal_session(requested, cwd)
+        except Exception as e:
+            logger.error(f"Terminal spawn error: {e}")
+            try:
+                await websocket.send_text(f"\r\n\x1b[31m[ERROR] {e}\x1b[0m\r\n")
+            except Exception:
+                pass
+            return
     else:
-        await _run_pipe_terminal(websocket)
+        logger.info(f"Terminal WS reattached | session={session.id} | pid={session.pid}")
 
+    budget = session.attach(websocket, ack_mode=wants_acks(websocket))
+    writer = FrameWriter(websocket, compress=wants_compression(websocket))
 
-async def _run_windows_terminal(websocket: WebSocket):
-    """Windows terminal using asyncio subprocess with piped stdin/stdout."""
-    global CURRENT_DIR
-    proc = None
-    try:
-        proc = await asyncio.create_subprocess_exec(
-            *SHELL,
-            stdin=asyncio.subprocess.PIPE,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.STDOUT,  # merge stderr into stdout
-            cwd=CURRENT_DIR,
-            env=os.environ.copy(),
-        )
-        if proc is None:
-            raise RuntimeError("Failed to spawn Windows terminal process.")
-        
-        logger.info(f"Windows shell spawned (PID {proc.pid})")
-
-        async def read_stdout():
-            """Forward shell output → WebSocket."""
-            if proc.stdout is None: return
-            while True:
-                try:
-                    chunk = await proc.stdout.read(4096)
-                    if not chunk:
-                        break
-                    await websocket.send_text(chunk.decode('utf-8', errors='replace'))
-                except Exception as e:
-                    logger.error(f"stdout read error: {e}")
-                    break
-
-        read_task = asyncio.create_task(read_stdout())
+    # Send a welcome banner so the user knows what shell they got. It goes
+    # through the budget like any other output so acks stay in step.
+    status = "reattached" if reattached else f"{SYSTEM} · {SHELL_NAME}"
+    budget.push(
+        f"\x1b]6973;session={session.id}\x07"
+        f"\r\n\x1b[32m[SynnccIT Terminal]\x1b[0m "
+        f"\x1b[90m{status}\x1b[0m\r\n".encode()
+    )
+    if not session.started:
+        session.start()
 
-        try:
-            while True:
-                raw = await websocket.receive_text()
-                if proc.stdin is None: break
-                try:
-                    msg = json.loads(raw)
-                    msg_type = msg.get("type")
-                    if msg_type == "input":
-                        data = msg.get("data", "")
-                        # On Windows Ctrl+C comes as \x03 — send as-is
-                        proc.stdin.write(data.encode('utf-8', errors='replace'))
-                        await proc.stdin.drain()
-                    # resize has no effect on cmd.exe but we acknowledge it silently
-                except json.JSONDecodeError:
-                    # Raw fallback
-                    proc.stdin.write(raw.encode('utf-8', errors='replace'))
-                    await proc.stdin.drain()
-        except WebSocketDisconnect:
-            logger.info("Windows terminal WS disconnected")
-        finally:
-            read_task.cancel()
+    send_task = asyncio.create_task(pump_output(budget, writer))
+    try:
+        while True:
+            raw = await websocket.receive_text()
+            try:
+                msg = json.loads(raw)
+                msg_type = msg.get("type")
+                if msg_type == "input":
+                    # On Windows Ctrl+C comes as \x03 — send as-is
+                    await session.write(msg.get("data", "").encode('utf-8', errors='replace'))
+                elif msg_type == "resize":
+                    # resize has no effect on cmd.exe / pipes, so it is ignored there
+                    session.resize(int(msg.get('rows', 24)), int(msg.get('cols', 80)))
+                elif msg_type == "ack":
+                    budget.ack(int(msg.get("frames", 1)))
+            except json.JSONDecodeError:
+                # Raw fallback
+                await session.write(raw.encode('utf-8', errors='replace'))
+    except WebSocketDisconnect:
+        logger.info(f"Terminal WS disconnected | session={session.id} (kept for {SESSION_GRACE:.0f}s)")
     except Exception as e:
-        logger.error(f"Windows terminal error: {e}")
+        logger.error(f"Terminal error: {e}")
         try:
             await websocket.send_text(f"\r\n\x1b[31m[ERROR] {e}\x1b[0m\r\n")
         except Exception:
             pass
     finally:
-        if proc and proc.returncode is None:
-            try:
-                proc.kill()
-            except Exception:
-                pass
+        send_task.cancel()
+        session.detach(websocket)
 
 
-async def _run_pty_terminal(websocket: WebSocket):
-    """Unix PTY terminal (full TTY — handles colour, interactive programs)."""
-    global CURRENT_DIR
-    master_fd = None
-    proc = None
-    try:
-        master_fd, slave_fd = pty.openpty()
-        env = os.environ.copy()
-        env.update({'TERM': 'xterm-256color', 'LANG': 'en_US.UTF-8'})
+@app.get("/api/terminal/sessions")
+def list_terminal_sessions():
+    """Live terminal sessions with their flow-control counters."""
+    return [session.stats() for session in TERMINAL_SESSIONS.values()]
+
+
+@app.get("/api/terminal/pool")
+def terminal_pool_stats():
+    """Pre-warmed shell pool metrics (hits, misses, idle shells)."""
+    if SHELL_POOL is None:
+        return {"enabled": False}
+    return {"enabled": True, **SHELL_POOL.stats()}
+
 
+@app.on_event("startup")
+async def _start_shell_pool():
+    global SHELL_POOL
+    await asyncio.to_thread(prune_workspace_sessions)
+    if HAS_PTY and not IS_WINDOWS and POOL_SIZE > 0:
+        SHELL_POOL = ShellPool(_open_pty_shell, lambda: DEFAULT_WORKSPACE)
+        SHELL_POOL.refill()
+
+
+@app.on_event("shutdown")
+async def _shutdown_background_services():
+    if SHELL_POOL is not None:
+        SHELL_POOL.close()
+    for session in list(TERMINAL_SESSIONS.values()):
+        session.terminate()
+    COMMAND_JOBS.cancel_all()
+    close_workspace_indexes()
+    close_search_indexes()
+
+
+@app.delete("/api/terminal/sessions/{session_id}")
+def kill_terminal_session(session_id: str):
+    session = TERMINAL_SESSIONS.get(session_id)
+    if session is None:
+        return JSONResponse(status_code=404, content={"error": "Session not found"})
+    session.terminate()
+    return {"success": True}
+
+
+async def _spawn_terminal_session(session_id: Optional[str], cwd: str) -> TerminalSession:
+    if IS_WINDOWS:
+        return await _spawn_windows_terminal(session_id, cwd)
+    elif HAS_PTY:
+        return await _spawn_pty_terminal(session_id, cwd)
+    else:
+        return await _spawn_pipe_terminal(session_id, cwd)
+
+
+async def _spawn_windows_terminal(session_id: Optional[str], cwd: str) -> PipeSession:
+    """Windows terminal using asyncio subprocess with piped stdin/stdout."""
+    proc = await asyncio.create_subprocess_exec(
+        *SHELL,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,  # merge stderr into stdout
+        cwd=cwd,
+        env=os.environ.copy(),
+    )
+    if proc is None:
+        raise RuntimeError("Failed to spawn Windows terminal process.")
+    logger.info(f"Windows shell spawned (PID {proc.pid})")
+    return PipeSession(proc, session_id)
+
+
+def _open_pty_shell(cwd: str):
+    """Spawn the shell on a fresh PTY; returns (proc, non-blocking master fd)."""
+    master_fd, slave_fd = pty.openpty()
+    env = os.environ.copy()
+    env.update({'TERM': 'xterm-256color', 'LANG': 'en_US.UTF-8'})
+
+    try:
         proc = subprocess.Popen(
             SHELL,
             stdin=slave_fd, stdout=slave_fd, stderr=slave_fd,
-            cwd=CURRENT_DIR,
+            cwd=cwd,
             env=env,
             start_new_session=True,
         )
+    except Exception:
+        os.close(master_fd)
+        raise
+    finally:
         os.close(slave_fd)
 
-        fl = fcntl.fcntl(master_fd, fcntl.F_GETFL)
-        fcntl.fcntl(master_fd, fcntl.F_SETFL, fl | os.O_NONBLOCK)
-        logger.info(f"PTY shell spawned (PID {proc.pid}, fd {master_fd})")
+    fl = fcntl.fcntl(master_fd, fcntl.F_GETFL)
+    fcntl.fcntl(master_fd, fcntl.F_SETFL, fl | os.O_NONBLOCK)
+    logger.info(f"PTY shell spawned (PID {proc.pid}, fd {master_fd})")
+    return proc, master_fd
 
-        async def read_pty():
-            while True:
-                try:
-                    data = os.read(master_fd, 4096)
-                    if data:
-                        await websocket.send_text(data.decode('utf-8', errors='replace'))
-                except BlockingIOError:
-                    await asyncio.sleep(0.02)
-                    continue
-                except OSError:
-                    break
-                await asyncio.sleep(0.01)
 
-        read_task = asyncio.create_task(read_pty())
-        try:
-            while True:
-                raw = await websocket.receive_text()
-                try:
-                    msg = json.loads(raw)
-                    if msg.get("type") == "input":
-                        os.write(master_fd, msg.get("data", "").encode())
-                    elif msg.get("type") == "resize":
-                        s = struct.pack('HHHH',
-                                        int(msg.get('rows', 24)),
-                                        int(msg.get('cols', 80)), 0, 0)
-                        fcntl.ioctl(master_fd, termios.TIOCSWINSZ, s)
-                except json.JSONDecodeError:
-                    os.write(master_fd, raw.encode())
-        except WebSocketDisconnect:
-            logger.info("PTY terminal WS disconnected")
-        finally:
-            read_task.cancel()
-    except Exception as e:
-        logger.error(f"PTY terminal error: {e}")
-        try:
-            await websocket.send_text(f"\r\n\x1b[31m[ERROR] {e}\x1b[0m\r\n")
-        except Exception:
-            pass
-    finally:
-        if master_fd is not None:
-            try:
-                os.close(master_fd)
-            except Exception:
-                pass
-        if proc and proc.poll() is None:
-            proc.terminate()
+async def _spawn_pty_terminal(session_id: Optional[str], cwd: str) -> PtySession:
+    """Unix PTY terminal (full TTY — handles colour, interactive programs).
 
+    Takes a pre-warmed shell from the pool when one is ready and only spawns
+    (and waits for rc files) on a miss.
+    """
+    shell = await SHELL_POOL.acquire(cwd) if SHELL_POOL else None
+    if shell is not None:
+        logger.info(f"PTY shell taken from pool (PID {shell.proc.pid})")
+        return PtySession(shell.proc, shell.master_fd, session_id, initial_output=shell.output)
+    proc, master_fd = _open_pty_shell(cwd)
+    # The event loop wakes the reader only when the PTY is readable —
+    # no polling, so idle terminals cost nothing.
+    return PtySession(proc, master_fd, session_id)
 
-async def _run_pipe_terminal(websocket: WebSocket):
-    """Fallback pipe-based terminal for Unix systems without PTY."""
-    global CURRENT_DIR
-    proc = None
-    try:
-        proc = await asyncio.create_subprocess_exec(
-            *SHELL,
-            stdin=asyncio.subprocess.PIPE,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.STDOUT,
-            cwd=CURRENT_DIR,
-        )
-
-        async def read_stdout():
-            if proc.stdout is None: return
-            while True:
-                chunk = await proc.stdout.read(4096)
-                if not chunk:
-                    break
-                await websocket.send_text(chunk.decode('utf-8', errors='replace'))
 
-        read_task = asyncio.create_task(read_stdout())
-        try:
-            while True:
-                raw = await websocket.receive_text()
-                if proc.stdin is None: break
-                try:
-                    msg = json.loads(raw)
-                    if msg.get("type") == "input":
-                        proc.stdin.write(msg.get("data", "").encode())
-                        await proc.stdin.drain()
-                except json.JSONDecodeError:
-                    proc.stdin.write(raw.encode())
-                    await proc.stdin.drain()
-        except WebSocketDisconnect:
-            logger.info("Pipe terminal WS disconnected")
-        finally:
-            read_task.cancel()
-    except Exception as e:
-        logger.error(f"Pipe terminal error: {e}")
-    finally:
-        if proc and proc.returncode is None:
-            proc.kill()
+async def _spawn_pipe_terminal(session_id: Optional[str], cwd: str) -> PipeSession:
+    """Fallback pipe-based terminal for Unix systems without PTY."""
+    proc = await asyncio.create_subprocess_exec(
+        *SHELL,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        cwd=cwd,
+    )
+    return PipeSession(proc, session_id)
 
 # --- WebSocket File System Events ---
 
 @app.websocket("/ws/fs")
 async def fs_websocket(websocket: WebSocket):
-    global CURRENT_DIR
+    """File change notifications for the current workspace.
+
+    All clients of a root share one debounced watcher (fs_watcher.WatchHub).
+      server → client  { type: 'refresh', changes: [[change, path], …], version }
+      server → client  { type: 'refresh', full: true, changes: [] }  (reload everything)
+    """
     await websocket.accept()
-    
+    root = _cwd(websocket)
+    sub = get_hub(root).subscribe()
+
+    async def forward():
+        while True:
+            message = await sub.get()
+            index = find_index(root) if USE_WORKSPACE_INDEX else None
+            if index is not None:
+                message = {**message, "version": index.version}
+            await websocket.send_json(message)
+
+    send_task = asyncio.create_task(forward())
     try:
-        async for changes in awatch(CURRENT_DIR):
-            # Send a simple 'refresh' signal or more detailed info
-            await websocket.send_json({"type": "refresh", "changes": list(changes)})
+        # Nothing is expected from the client; this just notices the disconnect
+        while True:
+            await websocket.receive_text()
     except WebSocketDisconnect:
         pass
     except Exception as e:
-        print(f"FS Watcher error: {e}")
+        logger.error(f"FS websocket error: {e}")
+    finally:
+        send_task.cancel()
+        sub.close()
+
+
+@app.get("/api/fs/watchers")
+def list_fs_watchers():
+    return [hub.stats() for hub in all_hubs()]
 
 # --- REST Endpoints ---
 
 @app.get("/api/files")
-def list_files(path: Optional[str] = None):
-    global CURRENT_DIR
-    
-    # If a new path is provided, update the global CURRENT_DIR
+async def list_files(request: Request, path: Optional[str] = None, depth: Optional[int] = None,
+                     cursor: Optional[str] = None, limit: Optional[int] = None):
+    """Workspace tree. Without ``depth``/``cursor``/``limit`` the whole tree is
+    returned (legacy); with any of them it is depth-limited and paginated —
+    see ``file_tree.scan_folder``. Folders left unloaded can be expanded
+    through /api/files/children.
+
+    Served from the in-memory workspace index when enabled; the response then
+    carries ``version`` for /api/files/changes.
+    """
+    # If a new path is provided, it becomes this client's workspace
+    base = _cwd(request)
     if path and path != ".":
         target = os.path.abspath(path)
-        if os.path.exists(target) and os.path.isdir(target):
-            CURRENT_DIR = target
-    
-    base = CURRENT_DIR
+        if os.path.exists(target) and os.path.isdir(target) and target != base:
+            base = _set_cwd(request, target)
+
     if not os.path.exists(base):
         return JSONResponse(status_code=404, content={"error": f"Path not found: {base}"})
     
-    def build_tree(p):
-        try:
-            entries = os.listdir(p)
-        except PermissionError:
-            return None
-            
-        children = []
-        for f in entries:
-            # Skip hidden files
-            if f.startswith('.') and f not in ['.env', '.gitignore']:
-                continue
-            
-            full_path = os.path.join(p, f)
-            if os.path.isdir(full_path):
-                # Don't recurse too deep for the initial load if you want speed
-                # but for this app we'll do it. Maybe limit to node_modules/git?
-                if f in ['node_modules', '.git', '__pycache__', '.venv']:
-                    children.append({
-                        "id": full_path,
-                        "name": f,
-                        "type": "folder",
-                        "path": full_path,
-                        "children": [] # Lazy loading if needed, but here we just mark as opaque
-                    })
-                    continue
-                    
-                child_data = build_tree(full_path)
-                if child_data:
-                    children.append(child_data)
-                else:
-                    children.append({
-                        "id": full_path,
-                        "name": f,
-                        "type": "folder",
-                        "path": full_path,
-                        "children": []
-                    })
-            else:
-                children.append({
-                    "id": full_path,
-                    "name": f,
-                    "type": "file",
-                    "path": full_path
-                })
-        
-        return {
-            "id": p,
-            "name": os.path.basename(p) if os.path.basename(p) else p,
-            "type": "folder",
-            "path": p,
-            "children": sorted(children, key=lambda x: (x['type'] != 'folder', x['name'].lower()))
-        }
-
-    if os.path.isdir(base):
-        result = build_tree(base)
-        return result if result else JSONResponse(status_code=400, content={"error": "Cannot read directory"})
-    else:
+    if not os.path.isdir(base):
         return JSONResponse(status_code=400, content={"error": "Not a directory"})
 
+    lazy = depth is not None or cursor is not None or limit is not None
+    args = (max(depth or 1, 1), cursor, _page_size(limit)) if lazy else ()
+    if USE_WORKSPACE_INDEX:
+        index = await get_index(base)
+        result = index.tree(base, *args)
+    else:
+        result = await asyncio.to_thread(scan_folder, base, *args, rules=get_rules(base))
+    warm_search_index(base)
+    return result if result else JSONResponse(status_code=400, content={"error": "Cannot read directory"})
+
+
+@app.get("/api/files/changes")
+async def list_file_changes(request: Request, since: int):
+    """Tree nodes added, modified or deleted after index version ``since``.
+
+    ``full: true`` means the change log no longer reaches back that far and
+    the client should reload the tree.
+    """
+    if not USE_WORKSPACE_INDEX:
+        return JSONResponse(status_code=404, content={"error": "Workspace index disabled"})
+    index = await get_index(_cwd(request))
+    return index.changes_since(since)
+
+
+@app.get("/api/files/children")
+async def list_folder_children(request: Request, path: str, depth: int = 1,
+                               cursor: Optional[str] = None, limit: Optional[int] = None):
+    """One folder's children on demand; never changes the workspace root."""
+    cwd = _cwd(request)
+    target = path if os.path.isabs(path) else os.path.join(cwd, path)
+    target = os.path.abspath(target)
+    if not os.path.isdir(target):
+        return JSONResponse(status_code=404, content={"error": f"Folder not found: {path}"})
+    args = (max(depth, 1), cursor, _page_size(limit))
+    index = find_index(target) if USE_WORKSPACE_INDEX else None
+    if index is not None and index.contains(target):
+        result = index.tree(target, *args)
+    else:
+        # Ignored folders (node_modules, build output, …) are not indexed
+        result = await asyncio.to_thread(scan_folder, target, *args,
+                                         rules=rules_for(target, cwd))
+    return result if result else JSONResponse(status_code=400, content={"error": "Cannot read directory"})
+
+
+def _page_size(limit: Optional[int]) -> int:
+    if not limit or limit <= 0:
+        return DEFAULT_PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE)
+
+
+@app.get("/api/search")
+async def search_workspace(request: Request, q: str, regex: bool = False, case: bool = False,
+                           path: Optional[str] = None, max_results: int = DEFAULT_MAX_RESULTS,
+                           timeout: Optional[float] = None):
+    """Search the workspace's text files; results stream back as NDJSON.
+
+    One ``{type: 'match', path, line, column, length, text}`` line per matching
+    line, then ``{type: 'done', reason, matches, …}``. ``path`` limits the
+    search to a folder; the ``X-Search-Id`` header can be passed to
+    DELETE /api/search/{id} to stop it early (closing the request does too).
+    """
+    if not q:
+        return JSONResponse(status_code=400, content={"error": "Empty query"})
+    try:
+        query = Query(q, regex=regex, case_sensitive=case)
+    except re.error as e:
+        return JSONResponse(status_code=400, content={"error": f"Invalid regex: {e}"})
+
+    cwd = _cwd(request)
+    index = await get_search_index(cwd)
+    prefix = None
+    if path:
+        folder = os.path.abspath(path if os.path.isabs(path) else os.path.join(cwd, path))
+        prefix = folder + os.sep
+    limit = min(max(max_results, 1), MAX_RESULTS)
+    search_id = uuid.uuid4().hex
+
+    async def stream():
+        events = run_search(index, query, prefix, limit, timeout, search_id)
+        try:
+            async for event in events:
+                yield json.dumps(event) + "\n"
+                if event["type"] == "match" and await request.is_disconnected():
+                    break
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson",
+                             headers={"X-Search-Id": search_id})
+
+
+@app.delete("/api/search/{search_id}")
+def cancel_search(search_id: str):
+    cancel = ACTIVE_SEARCHES.get(search_id)
+    if cancel is None:
+        return JSONResponse(status_code=404, content={"error": "Search not found"})
+    cancel.set()
+    return {"status": "cancelled"}
+
+
+@app.get("/api/search/stats")
+def search_index_stats():
+    return [index.stats() for index in all_search_indexes()]
+
 @app.get("/api/file")
-def read_file(path: str):
+def read_file(request: Request, path: str, lines: Optional[str] = None, raw: bool = False):
+    """File contents for the editor.
+
+    Small text files come back as JSON ``{path, content, size}``. Responses
+    carry ETag / Last-Modified and answer conditional requests with 304.
+      Range: bytes=a-b   → 206 with those raw bytes
+      ?lines=10-20       → JSON with just those lines (1-based, inclusive)
+      ?raw=true          → the file itself, streamed
+    Binary files are refused with 415 unless asked for raw; files above
+    FILE_STREAM_THRESHOLD_BYTES are always streamed instead of JSON-encoded.
+    """
     if not os.path.exists(path):
-        # Try relative to CURRENT_DIR
-        path = os.path.join(CURRENT_DIR, path)
+        # Try relative to the workspace
+        path = os.path.join(_cwd(request), path)
         if not os.path.exists(path):
             return JSONResponse(status_code=404, content={"error": "File not found"})
+    if os.path.isdir(path):
+        return JSONResponse(status_code=400, content={"error": "Is a directory"})
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            content = f.read()
-        return {"path": path, "content": content}
+        st = os.stat(path)
+        etag = etag_for(st)
+        headers = {"ETag": etag, "Last-Modified": last_modified(st),
+                   "Cache-Control": "no-cache", "Accept-Ranges": "bytes"}
+        if not_modified(request.headers, etag, st):
+            return Response(status_code=304, headers=headers)
+
+        range_header = request.headers.get("range")
+        if range_header:
+            span = parse_range(range_header, st.st_size)
+            if span is None:
+                return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{st.st_size}"})
+            start, end = span
+            return StreamingResponse(iter_file(path, start, end + 1), status_code=206,
+                                     media_type="application/octet-stream",
+                                     headers={**headers, "Content-Length": str(end - start + 1),
+                                              "Content-Range": f"bytes {start}-{end}/{st.st_size}"})
+
+        binary = is_binary(path)
+        if raw or (st.st_size > STREAM_THRESHOLD and not lines):
+            media_type = "application/octet-stream" if binary else "text/plain; charset=utf-8"
+            return StreamingResponse(iter_file(path), media_type=media_type,
+                                     headers={**headers, "Content-Length": str(st.st_size)})
+        if binary:
+            return JSONResponse(status_code=415, headers=headers,
+                                content={"error": "Binary file", "binary": True, "size": st.st_size})
+
+        if lines:
+            span = parse_lines(lines)
+            if span is None:
+                return JSONResponse(status_code=400, content={"error": f"Invalid line range: {lines}"})
+            result = read_lines(path, *span)
+            return JSONResponse(headers=headers, content={"path": path, "size": st.st_size, **result})
+
+        with open(path, "rb") as f:
+            data = f.read()
+        # Newlines are left as they are on disk so ``hash`` matches the content
+        # the editor holds, which is what delta saves are checked against
+        return JSONResponse(headers=headers, content={"path": path, "content": data.decode("utf-8"),
+                                                      "size": st.st_size, "hash": content_hash(data)})
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 @app.post("/api/file")
-def save_file(req: FileSaveRequest):
+def save_file(req: FileSaveRequest, request: Request):
+    """Save a file atomically, either whole (``content``) or as a ``patch``
+    against ``base_hash``. A stale base gets 409 with the current hash; the
+    response carries the new ``hash`` for the next delta save."""
     path = req.path
     if not os.path.isabs(path):
-        path = os.path.join(CURRENT_DIR, path)
+        path = os.path.join(_cwd(request), path)
+    if req.content is None and req.patch is None:
+        return JSONResponse(status_code=400, content={"error": "Either content or patch is required"})
+    if req.patch is not None and req.base_hash is None:
+        return JSONResponse(status_code=400, content={"error": "A patch needs base_hash"})
     
     try:
-        # Create directories if they don't exist
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        with open(path, "w", encoding="utf-8") as f:
-            f.write(req.content)
-        return {"success": True}
+        patch = [edit.model_dump() for edit in req.patch] if req.patch is not None else None
+        result = save_text(path, req.content, patch, req.base_hash)
+        return {"success": True, **result}
+    except StaleBaseError as e:
+        return JSONResponse(status_code=409, content={"error": str(e), "hash": e.current_hash})
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": f"Cannot apply patch: {e}"})
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 @app.post("/api/terminal")
-def run_terminal(req: TerminalRequest):
-    """Fallback for non-ws terminal or specific scripts"""
-    global CURRENT_DIR
+async def run_terminal(req: TerminalRequest, request: Request):
+    """Fallback for non-ws terminal or specific scripts.
+
+    Commands run as async jobs (see ``command_jobs``): at most
+    MAX_CONCURRENT_COMMANDS at once, the rest queued, each with a timeout and
+    cancellable through DELETE /api/terminal/jobs/{id}. Without ``stream``
+    the reply is one JSON object once the command exits; with
+    ``stream: 'ndjson'`` (or ``'sse'``) the job's events are streamed.
+    """
+    cwd = _cwd(request)
     command = req.command.strip()
     
     # Handle cd command specifically for the tracked dir
     if command.startswith("cd "):
         target_dir = command[3:].strip()
-        new_dir = os.path.abspath(os.path.join(CURRENT_DIR, target_dir))
+        new_dir = os.path.abspath(os.path.join(cwd, target_dir))
         if os.path.exists(new_dir) and os.path.isdir(new_dir):
-            CURRENT_DIR = new_dir
+            cwd = _set_cwd(request, new_dir)
             return {
                 "stdout": "",
                 "stderr": "",
                 "returncode": 0,
-                "cwd": CURRENT_DIR
+                "cwd": cwd
             }
         else:
             return {
                 "stdout": "",
                 "stderr": f"cd: no such file or directory: {target_dir}\n",
                 "returncode": 1,
-                "cwd": CURRENT_DIR
+                "cwd": cwd
             }
 
     try:
-        result = subprocess.run(
-            req.command, 
-            shell=True, 
-            capture_output=True, 
-            text=True,
-            cwd=CURRENT_DIR
-        )
-        return {
-            "stdout": result.stdout,
-            "stderr": result.stderr,
-            "returncode": result.returncode,
-            "cwd": CURRENT_DIR
-        }
+        job = COMMAND_JOBS.submit(req.command, cwd, req.timeout)
+    except QueueFullError as e:
+        return JSONResponse(status_code=429, content={"error": f"Too many commands queued: {e}"})
+
+    if req.stream not in ("ndjson", "sse"):
+        try:
+            return await collect(job)
+        finally:
+            # Client went away mid-command: stop it, and its unread events
+            if not job.done:
+                job.cancel()
+            job.detach()
+
+    sse = req.stream == "sse"
+
+    async def stream():
+        try:
+            async for event in job.events():
+                if sse:
+                    yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                else:
+                    yield json.dumps(event) + "\n"
+        finally:
+            # Client went away mid-command: stop it
+            if not job.done:
+                job.cancel()
+            job.detach()
+
+    return StreamingResponse(stream(), media_type="text/event-stream" if sse else "application/x-ndjson",
+                             headers={"X-Job-Id": job.id, "Cache-Control": "no-cache"})
+
+
+@app.get("/api/terminal/jobs")
+def list_command_jobs():
+    return COMMAND_JOBS.stats()
+
+
+@app.get("/api/terminal/jobs/{job_id}")
+def command_job_status(job_id: str):
+    job = COMMAND_JOBS.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+    return job.info()
+
+
+@app.delete("/api/terminal/jobs/{job_id}")
+def cancel_command_job(job_id: str):
+    job = COMMAND_JOBS.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+    job.cancel()
+    return {"status": "cancelling" if not job.done else job.state, "id": job_id}
+
+@app.post("/api/upload")
+async def upload_file(request: Request, file: UploadFile = File(...), path: Optional[str] = Form(None)):
+    """One-shot multipart upload, streamed to disk off the event loop.
+    Large files should use the resumable /api/uploads protocol instead."""
+    target_dir = _upload_dir(request, path)
+    try:
+        file_path = await save_upload(file, target_dir)
+        return {"success": True, "path": file_path}
+    except UploadError as e:
+        return JSONResponse(status_code=e.status, content={"error": str(e), **e.extra})
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
-@app.post("/api/upload")
-async def upload_file(file: UploadFile = File(...), path: Optional[str] = Form(None)):
-    global CURRENT_DIR
-    target_dir = path if path else CURRENT_DIR
+
+def _upload_dir(request: Request, path: Optional[str]) -> str:
+    cwd = _cwd(request)
+    target_dir = path if path else cwd
     if not os.path.isabs(target_dir):
-        target_dir = os.path.join(CURRENT_DIR, target_dir)
-    
-    if not os.path.exists(target_dir):
-        os.makedirs(target_dir, exist_ok=True)
-        
-    file_path = os.path.join(target_dir, file.filename)
+        target_dir = os.path.join(cwd, target_dir)
+    return target_dir
+
+
+@app.post("/api/uploads")
+def start_upload(req: UploadStartRequest, request: Request):
+    """Start a resumable upload; see ``uploads`` for the protocol."""
     try:
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        return {"success": True, "path": file_path}
+        upload = create_upload(_upload_dir(request, req.path), req.filename, req.size, req.sha256)
+        return upload.status()
+    except UploadError as e:
+        return JSONResponse(status_code=e.status, content={"error": str(e), **e.extra})
+
+
+@app.api_route("/api/uploads/{upload_id}", methods=["GET", "HEAD"])
+def upload_status(upload_id: str):
+    """Where to resume, or the finished upload if it already completed."""
+    try:
+        return get_upload(upload_id).status()
+    except UploadError as e:
+        return JSONResponse(status_code=e.status, content={"error": str(e), **e.extra})
+
+
+@app.put("/api/uploads/{upload_id}")
+async def upload_chunk(upload_id: str, offset: int, request: Request):
+    """Append the raw request body at ``offset``. A mismatched offset gets 409
+    with the offset to resume from; X-Chunk-SHA256 is checked when sent."""
+    try:
+        upload = get_upload(upload_id)
+        return await upload.write(offset, request.stream(), request.headers.get("x-chunk-sha256"))
+    except UploadError as e:
+        return JSONResponse(status_code=e.status, content={"error": str(e), **e.extra})
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
+
+@app.delete("/api/uploads/{upload_id}")
+def abort_upload(upload_id: str):
+    try:
+        upload = get_upload(upload_id)
+    except UploadError as e:
+        return JSONResponse(status_code=e.status, content={"error": str(e), **e.extra})
+    upload.discard()
+    return {"status": "aborted"}
+
 @app.post("/api/select-workspace-folder")
-def select_workspace_folder():
+def select_workspace_folder(request: Request):
     """Opens a native OS folder selection dialog."""
     try:
         import platform
@@ -575,12 +859,11 @@ def select_workspace_folder():
                     logger.error("No folder selection tool found on Linux (Zenity or Kdialog required)")
         
         if path:
-            global CURRENT_DIR
-            CURRENT_DIR = os.path.abspath(path)
-            logger.info(f"Workspace root changed to: {CURRENT_DIR}")
-            # Each WebSocket terminal spawns its own subprocess, so the new
-            # CURRENT_DIR will be picked up automatically on the next connection.
-            return {"path": CURRENT_DIR, "success": True}
+            cwd = _set_cwd(request, path)
+            logger.info(f"Workspace root changed to: {cwd}")
+            # Every new terminal session spawns its own shell, so the new
+            # workspace is picked up automatically; reattached sessions keep theirs.
+            return {"path": cwd, "success": True}
         
         return {"error": "Folder selection cancelled or failed"}
     except Exception as e:
@@ -588,13 +871,14 @@ def select_workspace_folder():
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 @app.post("/api/open-folder")
-def open_folder(req: Dict[str, str]):
+def open_folder(req: Dict[str, str], request: Request):
     """Opens a directory in the native file explorer."""
     path = req.get("path")
+    cwd = _cwd(request)
     if not path or path == ".":
-        path = CURRENT_DIR
+        path = cwd
     elif not os.path.isabs(path):
-        path = os.path.join(CURRENT_DIR, path)
+        path = os.path.join(cwd, path)
         
     if not os.path.exists(path):
         return JSONResponse(status_code=404, content={"error": "Path not found"})
@@ -615,29 +899,29 @@ def open_folder(req: Dict[str, str]):
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 @app.post("/api/open-terminal")
-def open_terminal():
+def open_terminal(request: Request):
     """Opens a native OS terminal in the current directory."""
-    global CURRENT_DIR
+    cwd = _cwd(request)
     try:
         import platform
         system = platform.system()
-        logger.info(f"Opening terminal in: {CURRENT_DIR} on {system}")
+        logger.info(f"Opening terminal in: {cwd} on {system}")
         
         if system == "Darwin":  # macOS
             # Use AppleScript to open Terminal and CD to the directory, ensuring it works even if already open
-            script = f'tell application "Terminal" to do script "cd \'{CURRENT_DIR}\' && clear"'
+            script = f'tell application "Terminal" to do script "cd \'{cwd}\' && clear"'
             subprocess.run(["osascript", "-e", script])
             # Also bring Terminal to front
             subprocess.run(["osascript", "-e", 'tell application "Terminal" to activate'])
         elif system == "Windows":
-            subprocess.run(["start", "cmd", "/K", f"cd /d {CURRENT_DIR}"], shell=True)
+            subprocess.run(["start", "cmd", "/K", f"cd /d {cwd}"], shell=True)
         else:  # Linux
             # Try common terminals
             terminals = ["x-terminal-emulator", "gnome-terminal", "konsole", "xterm", "termite", "alacritty"]
             opened = False
             for term in terminals:
                 try:
-                    subprocess.Popen([term], cwd=CURRENT_DIR, start_new_session=True)
+                    subprocess.Popen([term], cwd=cwd, start_new_session=True)
                     opened = True
                     break
                 except FileNotFoundError:
@@ -650,35 +934,62 @@ def open_terminal():
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 @app.post("/api/agent")
-def run_agent(req: AgentRequest):
+async def run_agent(req: AgentRequest):
+    # Routine intents and repeats are answered locally, even without a model
+    cache = get_translation_cache()
+    local = await local_answer(req.prompt, os_label(), SHELL_NAME, cache, use_cache=not req.no_cache)
+    if local is not None:
+        return {**local, "cached": local["source"] == "cache"}
+
     if not HAS_GENAI:
         return JSONResponse(status_code=503, content={"error": "Google Generative AI library not installed"})
     if not model:
         return JSONResponse(status_code=503, content={"error": "Gemini API Key not configured"})
 
     try:
-        context = "You are a terminal expert. Translate natural language to shell commands."
-        prompt = f"""
-        {context}
-        User Intent: {req.prompt}
-        OS: {os.name}
-        
-        Return the result in this exact format:
-        COMMAND: [single line command]
-        EXPLANATION: [briefly explain what it does]
-        SAFE: [YES/NO] (NO if it deletes files or changes system settings)
-        """
-        
-        response = model.generate_content(prompt)
-        lines = response.text.strip().split('\n')
-        
-        result = {}
-        for line in lines:
-            if line.startswith("COMMAND:"): result['cmd'] = line.replace("COMMAND:", "").strip()
-            if line.startswith("EXPLANATION:"): result['desc'] = line.replace("EXPLANATION:", "").strip()
-            if line.startswith("SAFE:"): result['safe'] = line.replace("SAFE:", "").strip()
-            
-        return result
+        result = await translate_intent(model, req.prompt, os_label(), SHELL_NAME, cache,
+                                        use_cache=False)
+        return {**result, "cached": False}
+    except asyncio.TimeoutError:
+        return JSONResponse(status_code=504, content={"error": "Model call timed out"})
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
+
+@app.post("/api/agent/batch")
+async def run_agent_batch(req: AgentBatchRequest):
+    """Translate many intents at once; results are in request order."""
+    if len(req.prompts) > MAX_BATCH_PROMPTS:
+        return JSONResponse(status_code=400,
+                            content={"error": f"At most {MAX_BATCH_PROMPTS} prompts per batch"})
+    cache = get_translation_cache()
+    local = await asyncio.gather(*(local_answer(p, os_label(), SHELL_NAME, cache, use_cache=not req.no_cache)
+                                   for p in req.prompts))
+    if all(local):
+        return {"results": [{**r, "cached": r["source"] == "cache"} for r in local]}
+    if not HAS_GENAI:
+        return JSONResponse(status_code=503, content={"error": "Google Generative AI library not installed"})
+    if not model:
+        return JSONResponse(status_code=503, content={"error": "Gemini API Key not configured"})
+
+    try:
+        remote = iter(await translate_intents(model, [p for p, r in zip(req.prompts, local) if r is None],
+                                              os_label(), SHELL_NAME, cache, use_cache=False))
+        results = [r if r is not None else next(remote) for r in local]
+        return {"results": [{**r, "cached": r["source"] == "cache"} for r in results]}
+    except asyncio.TimeoutError:
+        return JSONResponse(status_code=504, content={"error": "Model call timed out"})
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+
+@app.get("/api/agent/cache")
+def agent_cache_stats():
+    return {**get_translation_cache().stats(), "llm": translator_stats()}
+
+
+@app.delete("/api/agent/cache")
+def clear_agent_cache():
+    get_translation_cache().clear()
+    return {"success": True}
+
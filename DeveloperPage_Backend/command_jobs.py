@@ -0,0 +1,331 @@
+"""Async, streaming, cancellable command jobs for POST /api/terminal.
+
+Each command becomes a ``CommandJob`` run on the event loop instead of
+blocking a threadpool worker in ``subprocess.run``. At most
+MAX_CONCURRENT_COMMANDS run at once; further jobs wait in a bounded queue.
+
+stdout and stderr are read through the terminal's OutputBudget / FdReader, so
+a consumer that falls behind stops the reads and the kernel pipe then blocks
+the command itself. Every job has a wall-clock timeout and can be cancelled by
+id; on Unix it runs in its own session, so killing it takes its whole process
+group down. The child is reaped with ``os.wait4`` to report its CPU time.
+
+Events, in order:
+  {type: 'queued', id, position}            (only when it has to wait)
+  {type: 'start', id, pid, cwd}
+  {type: 'stdout' | 'stderr', data}
+  {type: 'exit', id, state, returncode, wall_time, cpu_time}
+"""
+import os
+import time
+import uuid
+import codecs
+import signal
+import asyncio
+import logging
+import subprocess
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional
+
+from terminal_io import OutputBudget, FdReader, read_stream
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT = int(os.getenv("MAX_CONCURRENT_COMMANDS", "4"))
+MAX_QUEUED = int(os.getenv("MAX_QUEUED_COMMANDS", "32"))
+DEFAULT_TIMEOUT = float(os.getenv("COMMAND_TIMEOUT_SECONDS", "600"))
+KILL_GRACE = 2.0          # SIGTERM → SIGKILL
+DRAIN_GRACE = 1.0         # output still arriving after exit (background children)
+EVENT_QUEUE = 64
+FINISHED_KEPT = 100
+
+IS_POSIX = os.name == "posix"
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class CommandJob:
+    """One shell command, from queueing to exit."""
+
+    def __init__(self, command: str, cwd: str, timeout: Optional[float] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.command = command
+        self.cwd = cwd
+        self.timeout = timeout if timeout and timeout > 0 else DEFAULT_TIMEOUT
+        self.state = "queued"     # → running → exited | timeout | cancelled | failed
+        self.pid = None
+        self.returncode = None
+        self.cpu_time = None
+        self.created_at = time.time()
+        self.started = None
+        self.wall_time = None
+        self.error = None
+        self._events: asyncio.Queue = asyncio.Queue(maxsize=EVENT_QUEUE)
+        self._cancel = asyncio.Event()
+        self._detached = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def done(self) -> bool:
+        return self.state not in ("queued", "running")
+
+    # ── Consumer side ──
+    async def events(self) -> AsyncIterator[dict]:
+        while True:
+            event = await self._events.get()
+            if event is None:
+                return
+            yield event
+
+    def cancel(self):
+        self._cancel.set()
+
+    def detach(self):
+        """The consumer went away: stop queueing events nobody will read."""
+        self._detached = True
+        while not self._events.empty():
+            self._events.get_nowait()
+
+    async def _emit(self, event: Optional[dict]):
+        if not self._detached:
+            await self._events.put(event)
+
+    # ── Running ──
+    async def _run(self, runner: "JobRunner"):
+        try:
+            if runner.semaphore.locked():
+                await self._emit({"type": "queued", "id": self.id, "position": runner.queued})
+            acquire = asyncio.create_task(runner.semaphore.acquire())
+            cancelled = asyncio.create_task(self._cancel.wait())
+            await asyncio.wait({acquire, cancelled}, return_when=asyncio.FIRST_COMPLETED)
+            cancelled.cancel()
+            if not acquire.done() or self._cancel.is_set():
+                acquire.cancel()
+                if acquire.done() and not acquire.cancelled():
+                    runner.semaphore.release()
+                self.state = "cancelled"
+                return
+            try:
+                await self._execute()
+            finally:
+                runner.semaphore.release()
+        except Exception as e:
+            logger.error(f"Command job {self.id} failed: {e}")
+            self.state, self.error = "failed", str(e)
+        finally:
+            await self._emit({
+                "type": "exit", "id": self.id, "state": self.state,
+                "returncode": self.returncode, "error": self.error,
+                "wall_time": self.wall_time,
+                "cpu_time": round(self.cpu_time, 3) if self.cpu_time is not None else None,
+            })
+            await self._emit(None)
+            runner.finished(self)
+
+    async def _execute(self):
+        self.state = "running"
+        self.started = time.monotonic()
+        out, err = OutputBudget(), OutputBudget()
+        if IS_POSIX:
+            proc = subprocess.Popen(self.command, shell=True, cwd=self.cwd,
+                                    stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE, start_new_session=True)
+            readers = []
+            for pipe, budget in ((proc.stdout, out), (proc.stderr, err)):
+                os.set_blocking(pipe.fileno(), False)
+                reader = FdReader(pipe.fileno(), budget)
+                reader.start()
+                readers.append(reader)
+            exited = asyncio.ensure_future(_wait_posix(proc))
+        else:
+            proc = await asyncio.create_subprocess_shell(
+                self.command, cwd=self.cwd, stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+            readers = [asyncio.create_task(read_stream(proc.stdout, out)),
+                       asyncio.create_task(read_stream(proc.stderr, err))]
+            exited = asyncio.ensure_future(_wait_other(proc))
+        self.pid = proc.pid
+        await self._emit({"type": "start", "id": self.id, "pid": proc.pid, "cwd": self.cwd})
+
+        pumps = [asyncio.create_task(self._pump(out, "stdout")),
+                 asyncio.create_task(self._pump(err, "stderr"))]
+        cancelled = asyncio.create_task(self._cancel.wait())
+        await asyncio.wait({exited, cancelled}, timeout=self.timeout,
+                           return_when=asyncio.FIRST_COMPLETED)
+        cancelled.cancel()
+        if not exited.done():
+            self.state = "cancelled" if self._cancel.is_set() else "timeout"
+            await _kill(proc, exited)
+        else:
+            self.state = "exited"
+        self.returncode, self.cpu_time = await exited
+        self.wall_time = round(time.monotonic() - self.started, 3)
+
+        # Let buffered output reach the consumer; a background child that
+        # still holds the pipes open is not waited for.
+        _, pending = await asyncio.wait(pumps, timeout=DRAIN_GRACE)
+        for reader in readers:
+            if isinstance(reader, FdReader):
+                reader.stop()
+            else:
+                reader.cancel()
+        out.close()
+        err.close()
+        if pending:
+            # A consumer that stopped reading would leave the pumps blocked on
+            # the event queue, and this job holding its slot, for good
+            _, pending = await asyncio.wait(pending, timeout=DRAIN_GRACE)
+            for pump in pending:
+                pump.cancel()
+        if IS_POSIX:
+            proc.stdout.close()
+            proc.stderr.close()
+
+    async def _pump(self, budget: OutputBudget, name: str):
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        while True:
+            frame = await budget.next_frame()
+            text = decoder.decode(frame, final=not frame)
+            if text:
+                # Blocks while the consumer is behind, which throttles the reader
+                await self._emit({"type": name, "data": text})
+            if not frame:
+                return
+
+    def info(self) -> dict:
+        return {
+            "id": self.id,
+            "command": self.command,
+            "cwd": self.cwd,
+            "state": self.state,
+            "pid": self.pid,
+            "returncode": self.returncode,
+            "created_at": self.created_at,
+            "timeout": self.timeout,
+            "wall_time": self.wall_time if self.done or self.started is None
+            else round(time.monotonic() - self.started, 3),
+            "cpu_time": self.cpu_time,
+        }
+
+
+# ─── Process helpers ─────────────────────────────────────────────────────────
+
+async def _wait_posix(proc: subprocess.Popen):
+    """(exit code, CPU seconds) of ``proc``, reaped with wait4 without a thread."""
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+    pidfd = None
+    try:
+        pidfd = os.pidfd_open(proc.pid)
+        loop.add_reader(pidfd, ready.set)
+    except (AttributeError, OSError):
+        pidfd = None
+    try:
+        while True:
+            pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+            if pid:
+                break
+            if pidfd is not None:
+                ready.clear()
+                await ready.wait()
+            else:
+                await asyncio.sleep(0.05)
+    finally:
+        if pidfd is not None:
+            loop.remove_reader(pidfd)
+            os.close(pidfd)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return proc.returncode, usage.ru_utime + usage.ru_stime
+
+
+async def _wait_other(proc):
+    return await proc.wait(), None
+
+
+async def _kill(proc, exited: asyncio.Future):
+    def send(sig):
+        try:
+            if IS_POSIX:
+                os.killpg(proc.pid, sig)
+            elif sig == signal.SIGTERM:
+                proc.terminate()
+            else:
+                proc.kill()
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    send(signal.SIGTERM)
+    done, _ = await asyncio.wait({exited}, timeout=KILL_GRACE)
+    if not done:
+        send(signal.SIGKILL if IS_POSIX else signal.SIGTERM)
+
+
+# ─── Runner ──────────────────────────────────────────────────────────────────
+
+class JobRunner:
+    """Concurrency cap, queue bound and job registry."""
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT, max_queued: int = MAX_QUEUED):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.jobs: "OrderedDict[str, CommandJob]" = OrderedDict()
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:   # created inside the running loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        return self._semaphore
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for job in self.jobs.values() if job.state == "queued")
+
+    def submit(self, command: str, cwd: str, timeout: Optional[float] = None) -> CommandJob:
+        if self.queued >= self.max_queued:
+            raise QueueFullError(f"{self.queued} commands already waiting")
+        job = CommandJob(command, cwd, timeout)
+        self.jobs[job.id] = job
+        job._task = asyncio.create_task(job._run(self))
+        return job
+
+    def finished(self, job: CommandJob):
+        done = [j for j in self.jobs.values() if j.done]
+        for old in done[:max(len(done) - FINISHED_KEPT, 0)]:
+            self.jobs.pop(old.id, None)
+
+    def get(self, job_id: str) -> Optional[CommandJob]:
+        return self.jobs.get(job_id)
+
+    def cancel_all(self):
+        for job in self.jobs.values():
+            job.cancel()
+
+    def stats(self) -> List[dict]:
+        return [job.info() for job in self.jobs.values()]
+
+
+async def collect(job: CommandJob) -> dict:
+    """Run ``job`` to completion and return the legacy /api/terminal shape."""
+    stdout: List[str] = []
+    stderr: List[str] = []
+    final: Dict = {}
+    async for event in job.events():
+        if event["type"] == "stdout":
+            stdout.append(event["data"])
+        elif event["type"] == "stderr":
+            stderr.append(event["data"])
+        elif event["type"] == "exit":
+            final = event
+    return {
+        "stdout": "".join(stdout),
+        "stderr": "".join(stderr),
+        "returncode": final.get("returncode"),
+        "cwd": job.cwd,
+        "job_id": job.id,
+        "state": final.get("state"),
+        "wall_time": final.get("wall_time"),
+        "cpu_time": final.get("cpu_time"),
+    }
@@ -0,0 +1,259 @@
+"""File reads and saves for /api/file.
+
+Reads: responses carry an ETag (mtime + size, like most static servers) and
+Last-Modified so the editor can revalidate with a 304 instead of reloading.
+Line and byte ranges are cut out of a memory-mapped file, so asking for the
+last 100 lines of a 200 MB log touches those pages only. Files that are binary
+or too big to JSON-encode are streamed back raw in fixed-size chunks.
+
+Saves: the client may send a patch against the content hash it last saw
+instead of the whole file. Stale bases are rejected, and every write goes to a
+temp file in the same folder that is then renamed over the target, so a crash
+mid-save never leaves a truncated file behind.
+"""
+import os
+import mmap
+import codecs
+import hashlib
+import tempfile
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+STREAM_THRESHOLD = int(os.getenv("FILE_STREAM_THRESHOLD_BYTES", str(4 * 1024 * 1024)))
+STREAM_CHUNK = 256 * 1024
+SNIFF_BYTES = 8192
+MAX_LINES = 100000
+
+
+# ─── Validators ──────────────────────────────────────────────────────────────
+
+def etag_for(st: os.stat_result) -> str:
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def last_modified(st: os.stat_result) -> str:
+    return formatdate(st.st_mtime, usegmt=True)
+
+
+def not_modified(headers, etag: str, st: os.stat_result) -> bool:
+    """Whether the request's conditional headers match the file's current state."""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(st.st_mtime) <= since
+    return False
+
+
+# ─── Sniffing ────────────────────────────────────────────────────────────────
+
+def is_binary(path: str) -> bool:
+    """NUL bytes or invalid UTF-8 in the first few KB."""
+    with open(path, "rb") as f:
+        sample = f.read(SNIFF_BYTES)
+    if b"\0" in sample:
+        return True
+    try:
+        # final=False: a multi-byte character cut at the sample edge is fine
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+    except UnicodeDecodeError:
+        return True
+    return False
+
+
+# ─── Ranges ──────────────────────────────────────────────────────────────────
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """First span of a ``Range: bytes=…`` header as inclusive (start, end).
+
+    None when the header is malformed or the span lies outside the file.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+    first, _, last = spec.split(",")[0].strip().partition("-")
+    try:
+        if not first:   # suffix: the last N bytes
+            length = int(last)
+            if length <= 0:
+                return None
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def parse_lines(spec: str) -> Optional[Tuple[int, Optional[int]]]:
+    """``"10-20"``, ``"10-"`` or ``"10"`` → 1-based inclusive (start, end)."""
+    first, sep, last = spec.partition("-")
+    try:
+        start = int(first)
+        end = (int(last) if last else None) if sep else start
+    except ValueError:
+        return None
+    if start < 1 or (end is not None and end < start):
+        return None
+    return start, end
+
+
+def read_lines(path: str, start: int, end: Optional[int]) -> dict:
+    """Lines ``start``..``end`` (1-based, inclusive) located through mmap."""
+    if end is None or end - start + 1 > MAX_LINES:
+        end = start + MAX_LINES - 1
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return {"content": "", "start_line": start, "end_line": start - 1, "has_more": False}
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos, line = 0, 1
+            while line < start:
+                nl = mm.find(b"\n", pos)
+                if nl == -1:
+                    return {"content": "", "start_line": start, "end_line": start - 1,
+                            "has_more": False}
+                pos, line = nl + 1, line + 1
+            stop = pos
+            while line <= end:
+                nl = mm.find(b"\n", stop)
+                if nl == -1:
+                    stop = len(mm)
+                    break
+                stop, line = nl + 1, line + 1
+            has_more = stop < len(mm)
+            data = mm[pos:stop]
+    last = start + data.count(b"\n") - (1 if data.endswith(b"\n") else 0)
+    return {
+        "content": data.decode("utf-8", errors="replace"),
+        "start_line": start,
+        "end_line": last,
+        "has_more": has_more,
+    }
+
+
+def iter_file(path: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+    """Bytes ``start``..``end`` (exclusive) of ``path`` in STREAM_CHUNK pieces."""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        end = size if end is None else min(end, size)
+        if end <= start:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for offset in range(start, end, STREAM_CHUNK):
+                yield mm[offset:min(offset + STREAM_CHUNK, end)]
+
+
+# ─── Saving ──────────────────────────────────────────────────────────────────
+
+class StaleBaseError(Exception):
+    """The file changed since the version the client's patch is based on."""
+
+    def __init__(self, current_hash: Optional[str]):
+        super().__init__("File changed since base version")
+        self.current_hash = current_hash
+
+
+_save_locks: Dict[str, threading.Lock] = {}
+_save_locks_guard = threading.Lock()
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def apply_patch(base: str, edits: List[dict]) -> str:
+    """Apply ``[{start, end, text}]`` edits to ``base``.
+
+    Offsets are UTF-16 code units into the base text (what the browser's
+    string indices count) and must not overlap.
+    """
+    units = base.encode("utf-16-le")
+    out, pos = [], 0
+    for edit in sorted(edits, key=lambda e: e["start"]):
+        start, end = edit["start"], edit["end"]
+        if start < pos or end < start or end * 2 > len(units):
+            raise ValueError(f"Bad edit range {start}-{end}")
+        out.append(units[pos * 2:start * 2])
+        out.append(edit.get("text", "").encode("utf-16-le"))
+        pos = end
+    out.append(units[pos * 2:])
+    return b"".join(out).decode("utf-16-le")
+
+
+def atomic_write(path: str, data: bytes):
+    """Write ``data`` to a temp file next to ``path`` and rename it into place.
+
+    A symlink is followed and its target replaced, and the target keeps its
+    mode and (where permitted) owner. A file with other hard links is
+    rewritten in place instead, since a rename would split it from them.
+    """
+    path = os.path.realpath(path)
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        st = None
+    if st is not None and st.st_nlink > 1:
+        with open(path, "r+b") as f:
+            f.write(data)
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+        return
+    fd, tmp = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=folder)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if st is not None:
+            os.chmod(tmp, st.st_mode & 0o7777)
+            if hasattr(os, "chown"):
+                try:
+                    os.chown(tmp, st.st_uid, st.st_gid)
+                except PermissionError:
+                    pass
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def save_text(path: str, content: Optional[str] = None, patch: Optional[List[dict]] = None,
+              base_hash: Optional[str] = None) -> dict:
+    """Save full ``content`` or a ``patch`` against ``base_hash``; returns the new version.
+
+    Raises StaleBaseError when ``base_hash`` no longer matches the file on disk
+    and ValueError for a malformed patch.
+    """
+    with _save_locks_guard:
+        lock = _save_locks.setdefault(path, threading.Lock())
+    with lock:
+        if base_hash is not None or patch is not None:
+            try:
+                with open(path, "rb") as f:
+                    current = f.read()
+            except FileNotFoundError:
+                current = None
+            current_hash = content_hash(current) if current is not None else None
+            if base_hash != current_hash or (patch is not None and current is None):
+                raise StaleBaseError(current_hash)
+            if patch is not None:
+                content = apply_patch(current.decode("utf-8"), patch)
+        data = content.encode("utf-8")
+        atomic_write(path, data)
+        st = os.stat(path)
+    return {"hash": content_hash(data), "size": st.st_size, "etag": etag_for(st)}
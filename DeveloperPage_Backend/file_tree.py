@@ -0,0 +1,138 @@
+"""Workspace tree listing for GET /api/files.
+
+Built on ``os.scandir`` so the file type comes from the directory entry itself
+instead of an extra ``os.path.isdir`` stat per child. ``scan_folder`` can walk
+the whole tree (legacy behaviour) or stop at ``depth`` and page through big
+folders with ``cursor``/``limit``, so the explorer only pays for what it shows.
+
+Given ``ignore_rules.IgnoreRules`` for the workspace, entries matched by the
+.gitignore files are still listed (flagged ``ignored``) but never expanded, so
+build output and virtualenvs cost one directory entry instead of a subtree.
+"""
+import os
+import bisect
+from typing import Optional, Tuple
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+# Always shown even though they are dot-files
+VISIBLE_DOTFILES = {'.env', '.gitignore'}
+# Listed but never expanded when no ignore rules are given
+OPAQUE_DIRS = {'node_modules', '.git', '__pycache__', '.venv'}
+
+
+def is_visible(root: str, path: str, rules=None) -> bool:
+    """Whether ``path`` shows up in the tree under ``root``: no hidden parts and
+    not below an ignored (or, without ``rules``, opaque) folder."""
+    rel = os.path.relpath(path, root)
+    if rel == "." or rel.startswith(".."):
+        return False
+    parts = rel.split(os.sep)
+    for part in parts:
+        if part.startswith('.') and part not in VISIBLE_DOTFILES:
+            return False
+    if rules is not None:
+        return not rules.inside_ignored(path)
+    return not any(part in OPAQUE_DIRS for part in parts[:-1])
+
+
+def _sort_key(name: str, is_dir: bool) -> Tuple[int, str, str]:
+    return (0 if is_dir else 1, name.lower(), name)
+
+
+def _encode_cursor(key: Tuple[int, str, str]) -> str:
+    return f"{key[0]}:{key[2]}"
+
+
+def _decode_cursor(cursor: str) -> Optional[Tuple[int, str, str]]:
+    kind, sep, name = cursor.partition(":")
+    if not sep or kind not in ("0", "1"):
+        return None
+    return (int(kind), name.lower(), name)
+
+
+def _folder(path: str, name: str) -> dict:
+    return {"id": path, "name": name, "type": "folder", "path": path, "children": []}
+
+
+def make_entry(name: str, path: str, is_dir: bool, ignored: bool = False):
+    return (_sort_key(name, is_dir), name, path, is_dir, ignored)
+
+
+def list_entries(path: str, rules=None):
+    """Visible children of ``path`` as sorted (key, name, full_path, is_dir, ignored)."""
+    entries = []
+    with os.scandir(path) as it:
+        for entry in it:
+            name = entry.name
+            # Skip hidden files
+            if name.startswith('.') and name not in VISIBLE_DOTFILES:
+                continue
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if rules is not None:
+                ignored = rules.is_ignored(entry.path, is_dir)
+            else:
+                ignored = is_dir and name in OPAQUE_DIRS
+            entries.append(make_entry(name, entry.path, is_dir, ignored))
+    entries.sort(key=lambda e: e[0])
+    return entries
+
+
+def scan_folder(path: str, depth: Optional[int] = None, cursor: Optional[str] = None,
+                limit: Optional[int] = None, entries_of=None, rules=None) -> Optional[dict]:
+    """Folder node for ``path``, or None if it cannot be read.
+
+    depth      — levels of children to load (None = everything, 1 = direct children).
+                 Folders beyond it are returned with ``loaded: false``.
+    cursor     — ``next_cursor`` from a previous page of the same folder.
+    limit      — max children per folder; when more exist ``next_cursor`` is set.
+    entries_of — where listings come from; defaults to the disk, the workspace
+                 index passes its in-memory copy.
+    rules      — ignore rules for disk listings (see ignore_rules).
+    """
+    if entries_of is None:
+        entries_of = lambda folder: list_entries(folder, rules)
+    try:
+        entries = entries_of(path)
+    except (PermissionError, FileNotFoundError, NotADirectoryError):
+        return None
+
+    total = len(entries)
+    start = 0
+    if cursor:
+        key = _decode_cursor(cursor)
+        if key is not None:
+            start = bisect.bisect_right([e[0] for e in entries], key)
+    page = entries[start:start + limit] if limit else entries[start:]
+
+    children = []
+    for key, name, full_path, is_dir, ignored in page:
+        if not is_dir:
+            node = {"id": full_path, "name": name, "type": "file", "path": full_path}
+            if ignored:
+                node["ignored"] = True
+            children.append(node)
+            continue
+        if ignored or depth == 1:
+            # Not expanded here; the client loads it on demand
+            node = _folder(full_path, name)
+            node["loaded"] = False
+            if ignored:
+                node["ignored"] = True
+            children.append(node)
+            continue
+        child = scan_folder(full_path, None if depth is None else depth - 1, None, limit, entries_of)
+        children.append(child if child else _folder(full_path, name))
+
+    node = _folder(path, os.path.basename(path) if os.path.basename(path) else path)
+    node["children"] = children
+    node["loaded"] = True
+    if limit is not None or cursor:
+        node["total"] = total
+        end = start + len(page)
+        node["next_cursor"] = _encode_cursor(page[-1][0]) if page and end < total else None
+    return node
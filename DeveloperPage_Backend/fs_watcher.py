@@ -0,0 +1,194 @@
+"""Shared, debounced file watcher for a workspace root.
+
+One ``WatchHub`` (one recursive ``awatch``) per root, however many /ws/fs
+clients and indexes are interested in it. Each raw batch is coalesced over a
+short window, deduplicated per path and filtered through the tree's
+visibility and ignore rules (events below ignored folders are dropped by the
+watch filter, before any coalescing) before it is fanned out:
+
+  • listeners   — async callbacks (the workspace index) awaited in order
+  • subscribers — bounded queues drained by WebSocket senders; a subscriber
+                  that falls behind gets a single "full refresh" message
+                  instead of an ever-growing backlog
+"""
+import os
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional
+
+from watchfiles import awatch, Change
+
+from file_tree import is_visible
+from ignore_rules import get_rules, IGNORE_FILES
+
+logger = logging.getLogger(__name__)
+
+DEBOUNCE_MS = int(os.getenv("FS_WATCH_DEBOUNCE_MS", "200"))
+SUBSCRIBER_QUEUE = int(os.getenv("FS_WATCH_QUEUE", "16"))
+# Batches bigger than this (git checkout, npm install) are sent as a full refresh
+MAX_BATCH_PATHS = int(os.getenv("FS_WATCH_MAX_BATCH", "500"))
+
+FULL_REFRESH = {"type": "refresh", "full": True, "changes": []}
+
+
+def coalesce(raw) -> Dict[str, Change]:
+    """One change per path: the last state on disk wins."""
+    seen: Dict[str, set] = {}
+    for change, path in raw:
+        seen.setdefault(path, set()).add(change)
+    merged = {}
+    for path, changes in seen.items():
+        if not os.path.lexists(path):
+            if Change.added in changes and Change.deleted not in changes:
+                continue  # created and removed inside the window
+            merged[path] = Change.deleted
+        elif Change.added in changes:
+            merged[path] = Change.added
+        else:
+            merged[path] = Change.modified
+    return merged
+
+
+class Subscription:
+    def __init__(self, hub: "WatchHub"):
+        self.hub = hub
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE)
+        self.overflowed = False
+        self.dropped = 0
+
+    def offer(self, message: dict):
+        if self.overflowed:
+            self.dropped += 1
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Too far behind — replace the backlog with a single full refresh
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.dropped += 1
+            self.queue.put_nowait(FULL_REFRESH)
+            self.overflowed = True
+
+    async def get(self) -> dict:
+        message = await self.queue.get()
+        if message is FULL_REFRESH:
+            self.overflowed = False
+        return message
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class WatchHub:
+    """One recursive watcher for ``root`` shared by every interested party."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.rules = get_rules(root)
+        self.subscribers: List[Subscription] = []
+        self.listeners: List[Callable] = []
+        self.error_handlers: List[Callable] = []
+        self.batches = 0
+        self._task: Optional[asyncio.Task] = None
+        self._stop: Optional[asyncio.Event] = None
+
+    def subscribe(self) -> Subscription:
+        sub = Subscription(self)
+        self.subscribers.append(sub)
+        self._ensure_running()
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        if sub in self.subscribers:
+            self.subscribers.remove(sub)
+        self._stop_if_idle()
+
+    def add_listener(self, callback: Callable, on_error: Optional[Callable] = None):
+        self.listeners.append(callback)
+        if on_error:
+            self.error_handlers.append(on_error)
+        self._ensure_running()
+
+    def remove_listener(self, callback: Callable, on_error: Optional[Callable] = None):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+        if on_error in self.error_handlers:
+            self.error_handlers.remove(on_error)
+        self._stop_if_idle()
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._stop = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    def _stop_if_idle(self):
+        if not self.subscribers and not self.listeners:
+            if self._stop is not None:
+                self._stop.set()
+            _hubs.pop(self.root, None)
+
+    def _accepts(self, change: Change, path: str) -> bool:
+        if os.path.basename(path) in IGNORE_FILES:
+            return not self.rules.inside_ignored(path)
+        return is_visible(self.root, path, self.rules)
+
+    async def _run(self):
+        logger.info(f"FS watcher started for {self.root}")
+        try:
+            async for raw in awatch(self.root, watch_filter=self._accepts, debounce=DEBOUNCE_MS,
+                                    step=50, stop_event=self._stop):
+                merged = coalesce(raw)
+                rule_files = [path for path in merged if os.path.basename(path) in IGNORE_FILES]
+                if rule_files:
+                    self.rules.invalidate()
+                changes = {path: change for path, change in merged.items()
+                           if is_visible(self.root, path, self.rules)}
+                if not changes and not rule_files:
+                    continue
+                self.batches += 1
+                paths = list(changes) + [path for path in rule_files if path not in changes]
+                for listener in list(self.listeners):
+                    try:
+                        await listener(paths)
+                    except Exception as e:
+                        logger.error(f"FS watch listener error: {e}")
+                if rule_files or len(changes) > MAX_BATCH_PATHS:
+                    message = FULL_REFRESH
+                else:
+                    message = {"type": "refresh",
+                               "changes": [[int(change), path] for path, change in changes.items()]}
+                for sub in list(self.subscribers):
+                    sub.offer(message)
+        except Exception as e:
+            logger.error(f"FS Watcher error ({self.root}): {e}")
+            for handler in list(self.error_handlers):
+                handler()
+            for sub in list(self.subscribers):
+                sub.offer(FULL_REFRESH)
+        finally:
+            logger.info(f"FS watcher stopped for {self.root}")
+
+    def stats(self) -> dict:
+        return {
+            "root": self.root,
+            "subscribers": len(self.subscribers),
+            "listeners": len(self.listeners),
+            "batches": self.batches,
+            "dropped": sum(sub.dropped for sub in self.subscribers),
+        }
+
+
+_hubs: Dict[str, WatchHub] = {}
+
+
+def get_hub(root: str) -> WatchHub:
+    root = os.path.abspath(root)
+    hub = _hubs.get(root)
+    if hub is None:
+        hub = _hubs[root] = WatchHub(root)
+    return hub
+
+
+def all_hubs() -> List[WatchHub]:
+    return list(_hubs.values())
@@ -0,0 +1,221 @@
+"""Compiled .gitignore-aware ignore rules for a workspace root.
+
+Sources, lowest to highest precedence:
+  1. built-in defaults (node_modules, .git, __pycache__, .venv) plus any folder
+     holding a ``pyvenv.cfg`` — virtualenvs whatever they are called
+  2. every ``.gitignore`` from the root down to the path's folder (deeper wins)
+  3. the project override file ``.synnccitignore`` at the root
+
+Patterns are compiled to regular expressions once per file, and the verdict
+for every folder is cached, so checking a path costs one dict lookup for its
+parent plus a few regex matches for its own name. As in git, nothing below an
+ignored folder can be re-included, which is what lets the tree listing, the
+workspace index and the watcher skip ignored subtrees without visiting them.
+"""
+import os
+import re
+import logging
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+GITIGNORE = ".gitignore"
+OVERRIDE_FILE = os.getenv("WORKSPACE_IGNORE_FILE", ".synnccitignore")
+IGNORE_FILES = {GITIGNORE, OVERRIDE_FILE}
+DEFAULT_PATTERNS = ["node_modules/", ".git/", "__pycache__/", ".venv/"]
+
+
+def _translate(pattern: str) -> str:
+    """gitignore glob → regex body (without anchors)."""
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            if pattern.startswith("**", i):
+                at_start = i == 0 or pattern[i - 1] == "/"
+                i += 2
+                if at_start and i < n and pattern[i] == "/":
+                    out.append("(?:.*/)?")   # "**/" — zero or more folders
+                    i += 1
+                else:
+                    out.append(".*")
+                continue
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            j = pattern.find("]", i + 1)
+            if j == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:j]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                i = j
+        elif c == "\\" and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+class RuleSet:
+    """Patterns from one ignore file, matched against paths relative to ``base``."""
+
+    def __init__(self, base: str, lines: List[str]):
+        self.base = base
+        # (regex, negated, dir_only), in file order — the last match wins
+        self.rules: List[Tuple[re.Pattern, bool, bool]] = []
+        for line in lines:
+            line = line.rstrip("\n").rstrip("\r")
+            if not line.endswith("\\ "):
+                line = line.rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negated = line.startswith("!")
+            if negated:
+                line = line[1:]
+            elif line.startswith("\\!") or line.startswith("\\#"):
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            if not line:
+                continue
+            anchored = "/" in line
+            line = line.lstrip("/")
+            body = _translate(line)
+            regex = f"^{body}$" if anchored else f"^(?:.*/)?{body}$"
+            try:
+                self.rules.append((re.compile(regex), negated, dir_only))
+            except re.error:
+                logger.warning(f"Skipping bad ignore pattern in {base}: {line!r}")
+        # Fast path: without negations any match is a verdict, so one
+        # alternation per kind replaces the per-rule loop.
+        self._combined = None
+        if self.rules and not any(neg for _, neg, _ in self.rules):
+            any_kind = [r.pattern for r, _, d in self.rules if not d]
+            dirs = [r.pattern for r, _, d in self.rules if d]
+            self._combined = (
+                re.compile("|".join(any_kind)) if any_kind else None,
+                re.compile("|".join(dirs)) if dirs else None,
+            )
+
+    @classmethod
+    def load(cls, path: str) -> Optional["RuleSet"]:
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                return cls(os.path.dirname(path), f.readlines())
+        except OSError:
+            return None
+
+    def match(self, rel: str, is_dir: bool) -> Optional[bool]:
+        """True = ignored, False = re-included, None = no opinion."""
+        if self._combined is not None:
+            any_re, dir_re = self._combined
+            if (any_re and any_re.match(rel)) or (is_dir and dir_re and dir_re.match(rel)):
+                return True
+            return None
+        for regex, negated, dir_only in reversed(self.rules):
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel):
+                return not negated
+        return None
+
+
+class IgnoreRules:
+    """Ignore verdicts for paths under ``root``, cached per folder."""
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self._defaults = RuleSet(self.root, DEFAULT_PATTERNS)
+        self._override: Optional[RuleSet] = None
+        self._rulesets: Dict[str, Optional[RuleSet]] = {}   # folder → its .gitignore
+        self._dir_ignored: Dict[str, bool] = {}              # folder → verdict
+        self.invalidate()
+
+    def invalidate(self):
+        """Forget everything; call after an ignore file changed."""
+        self._override = RuleSet.load(os.path.join(self.root, OVERRIDE_FILE))
+        self._rulesets.clear()
+        self._dir_ignored.clear()
+
+    def _ruleset(self, folder: str) -> Optional[RuleSet]:
+        if folder not in self._rulesets:
+            self._rulesets[folder] = RuleSet.load(os.path.join(folder, GITIGNORE))
+        return self._rulesets[folder]
+
+    def _chain(self, folder: str) -> List[RuleSet]:
+        """Rule sets that apply inside ``folder``, highest precedence first."""
+        chain = []
+        if self._override:
+            chain.append(self._override)
+        current = folder
+        while True:
+            ruleset = self._ruleset(current)
+            if ruleset:
+                chain.append(ruleset)
+            if current == self.root or len(current) <= len(self.root):
+                break
+            current = os.path.dirname(current)
+        chain.append(self._defaults)
+        return chain
+
+    def _verdict(self, path: str, is_dir: bool) -> bool:
+        parent = os.path.dirname(path)
+        for ruleset in self._chain(parent):
+            rel = os.path.relpath(path, ruleset.base).replace(os.sep, "/")
+            result = ruleset.match(rel, is_dir)
+            if result is not None:
+                return result
+        if is_dir and os.path.isfile(os.path.join(path, "pyvenv.cfg")):
+            return True
+        return False
+
+    def dir_ignored(self, folder: str) -> bool:
+        """Whether ``folder`` or any folder above it (up to the root) is ignored."""
+        if folder in self._dir_ignored:
+            return self._dir_ignored[folder]
+        if folder == self.root or not folder.startswith(self.root + os.sep):
+            return False
+        parent = os.path.dirname(folder)
+        verdict = self.dir_ignored(parent) or self._verdict(folder, True)
+        self._dir_ignored[folder] = verdict
+        return verdict
+
+    def is_ignored(self, path: str, is_dir: Optional[bool] = None) -> bool:
+        path = os.path.abspath(path)
+        if is_dir is None:
+            is_dir = os.path.isdir(path)
+        if is_dir:
+            return self.dir_ignored(path)
+        parent = os.path.dirname(path)
+        return self.dir_ignored(parent) or self._verdict(path, False)
+
+    def inside_ignored(self, path: str) -> bool:
+        """Whether ``path`` sits somewhere below an ignored folder."""
+        return self.dir_ignored(os.path.dirname(os.path.abspath(path)))
+
+
+_rules: Dict[str, IgnoreRules] = {}
+
+
+def get_rules(root: str) -> IgnoreRules:
+    root = os.path.abspath(root)
+    rules = _rules.get(root)
+    if rules is None:
+        rules = _rules[root] = IgnoreRules(root)
+    return rules
+
+
+def rules_for(path: str, default_root: str) -> IgnoreRules:
+    """Rules of the known root containing ``path``, else of ``default_root``."""
+    path = os.path.abspath(path)
+    for root, rules in _rules.items():
+        if path == root or path.startswith(root + os.sep):
+            return rules
+    return get_rules(default_root)
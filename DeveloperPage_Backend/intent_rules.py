@@ -0,0 +1,143 @@
+"""Local fast path for routine terminal intents.
+
+Listing files, disk usage, finding a process, git status… most agent prompts
+are one of a few dozen everyday tasks, and each used to wait seconds for
+Gemini (or fail outright without an API key). Every rule is a full-match
+pattern over the normalized prompt plus command templates per platform; a
+prompt that matches is answered locally in the usual ``{cmd, desc, safe}``
+shape, anything else goes to the model.
+
+Patterns are anchored and parameters are restricted to plain names, paths and
+numbers (and quoted on POSIX), so a prompt can never smuggle extra shell
+syntax into a template.
+"""
+import re
+import shlex
+import platform
+from typing import Dict, List, Optional
+
+from translation_cache import normalize_prompt
+
+_FILLER = re.compile(
+    r"^(?:(?:please|pls|can you|could you|would you|how do i|how to|i want to|i need to|"
+    r"help me|let me|show me how to)\s+)+")
+_NAME = r"(?P<name>[\w.\-*/~]+)"
+_PORT = r"(?P<port>\d{1,5})"
+
+
+class Rule:
+    def __init__(self, patterns: List[str], desc: str, templates: Dict[str, str], safe: bool = True):
+        self.patterns = [re.compile(p) for p in patterns]
+        self.desc = desc
+        self.templates = templates      # keys: a shell name, or linux / darwin / posix / windows
+        self.safe = safe
+
+    def template_for(self, system: str, shell: str) -> Optional[str]:
+        if shell in self.templates:
+            return self.templates[shell]
+        if system == "windows":
+            return self.templates.get("windows")
+        return self.templates.get(system) or self.templates.get("posix")
+
+
+RULES = [
+    Rule([r"(?:list|show|ls)(?: all)?(?: the)? files(?: here| in (?:this|the current) (?:folder|directory))?",
+          r"what(?:'s| is) in (?:this|the current) (?:folder|directory)"],
+         "Lists the files in the current directory with details",
+         {"posix": "ls -la", "windows": "dir"}),
+    Rule([r"(?:list|show)(?: all)?(?: the)? hidden files"],
+         "Lists all files including hidden ones",
+         {"posix": "ls -la", "windows": "dir /a"}),
+    Rule([r"(?:show|print|what is|what's)(?: the)? (?:current|working) (?:directory|folder|path)",
+          r"where am i", r"pwd"],
+         "Prints the current working directory",
+         {"posix": "pwd", "windows": "cd"}),
+    Rule([r"(?:show|check|get)?(?: the)? ?(?:free )?disk (?:usage|space)",
+          r"how much (?:free )?(?:disk )?space (?:is )?(?:left|free|available)"],
+         "Shows used and free space on each mounted drive",
+         {"posix": "df -h", "windows": "wmic logicaldisk get caption,freespace,size"}),
+    Rule([r"(?:show|get|check)?(?: the)? ?size of (?:this|the current) (?:folder|directory)",
+          r"how big is (?:this|the current) (?:folder|directory)"],
+         "Shows the total size of the current directory",
+         {"posix": "du -sh .",
+          "powershell": "(Get-ChildItem -Recurse -File | Measure-Object Length -Sum).Sum / 1MB"}),
+    Rule([r"(?:list|show|find)(?: the)? (?:large|big|biggest|largest) files(?: here)?"],
+         "Lists the 20 largest files and folders under the current directory",
+         {"posix": "du -ah . | sort -rh | head -n 20",
+          "powershell": "Get-ChildItem -Recurse -File | Sort-Object Length -Descending | "
+                        "Select-Object -First 20 FullName, Length"}),
+    Rule([r"(?:show|check)?(?: the)? ?(?:memory|ram) usage", r"how much (?:memory|ram) is (?:free|used)"],
+         "Shows memory usage",
+         {"linux": "free -h", "darwin": "vm_stat", "windows": "systeminfo | findstr /C:\"Memory\""}),
+    Rule([r"(?:list|show)(?: all)?(?: the)? (?:running )?processes"],
+         "Lists running processes",
+         {"posix": "ps aux", "windows": "tasklist"}),
+    Rule([rf"(?:find|show|search for|look for)(?: the)? process(?:es)?(?: named| called| for)? {_NAME}",
+          rf"is {_NAME} running"],
+         "Finds running processes matching the name",
+         {"posix": "ps aux | grep -i {name}", "windows": "tasklist | findstr /i {name}"}),
+    Rule([rf"(?:what|which process) is (?:using|running on|listening on) port {_PORT}",
+          rf"(?:who is using|check|show) port {_PORT}"],
+         "Shows which process is using the port",
+         {"posix": "lsof -i :{port}", "windows": "netstat -ano | findstr :{port}"}),
+    Rule([rf"(?:kill|stop|free)(?: the)?(?: process(?:es)?)?(?: on| using| running on)? port {_PORT}"],
+         "Kills the process listening on the port",
+         {"posix": "lsof -ti tcp:{port} | xargs kill",
+          "windows": "for /f \"tokens=5\" %a in ('netstat -ano ^| findstr :{port}') do taskkill /PID %a /F"},
+         safe=False),
+    Rule([r"(?:show|get|what is|what's)?(?: my)? ?ip(?: address)?"],
+         "Shows the network interfaces and their IP addresses",
+         {"linux": "ip addr", "darwin": "ifconfig", "windows": "ipconfig"}),
+    Rule([rf"(?:find|search for|locate)(?: all)?(?: the)? files? (?:named|called) {_NAME}"],
+         "Searches the current directory tree for files with that name",
+         {"posix": "find . -name {name}", "windows": "dir /s /b {name}"}),
+    Rule([rf"(?:count|how many) lines (?:are )?in {_NAME}"],
+         "Counts the lines in the file",
+         {"posix": "wc -l {name}", "windows": "find /c /v \"\" {name}"}),
+    Rule([rf"(?:make|create)(?: a)?(?: new)? (?:directory|folder)(?: named| called)? {_NAME}",
+          rf"mkdir {_NAME}"],
+         "Creates the directory",
+         {"posix": "mkdir -p {name}", "windows": "mkdir {name}"}),
+    Rule([r"(?:show|list|print)(?: all)?(?: the)? environment(?: variables)?", r"(?:show|list) env(?: vars)?"],
+         "Prints the environment variables",
+         {"posix": "env", "windows": "set"}),
+    Rule([r"(?:show |check )?(?:the )?git status", r"what (?:has|files have) changed(?: in git)?"],
+         "Shows changed, staged and untracked files",
+         {"posix": "git status", "windows": "git status"}),
+    Rule([r"(?:show |list )?(?:the )?git (?:log|history)", r"(?:show|list)(?: the)? (?:recent |last )?commits"],
+         "Shows recent commits, one per line",
+         {"posix": "git log --oneline -n 20", "windows": "git log --oneline -n 20"}),
+    Rule([r"(?:show |list )?(?:the )?git branch(?:es)?", r"(?:show|list)(?: all)?(?: the)? branches",
+          r"what branch am i on"],
+         "Lists branches and marks the current one",
+         {"posix": "git branch", "windows": "git branch"}),
+    Rule([r"(?:show |see )?(?:the )?git diff", r"(?:show|see)(?: my)?(?: the)? (?:unstaged )?changes"],
+         "Shows unstaged changes",
+         {"posix": "git diff", "windows": "git diff"}),
+]
+
+
+def _system(system: Optional[str] = None) -> str:
+    system = (system or platform.system()).lower()
+    return "windows" if system.startswith(("windows", "cygwin", "msys")) else system
+
+
+def match_intent(prompt: str, shell: str = "", system: Optional[str] = None) -> Optional[Dict[str, str]]:
+    """``{cmd, desc, safe}`` for a confidently recognized prompt, else None."""
+    text = _FILLER.sub("", normalize_prompt(prompt))
+    system = _system(system)
+    shell = shell.lower().removesuffix(".exe")
+    for rule in RULES:
+        for pattern in rule.patterns:
+            match = pattern.fullmatch(text)
+            if not match:
+                continue
+            template = rule.template_for(system, shell)
+            if template is None:
+                return None       # known intent, but no local command here: ask the model
+            params = match.groupdict()
+            if system != "windows" and shell not in ("cmd", "powershell", "pwsh"):
+                params = {k: shlex.quote(v) if k == "name" else v for k, v in params.items()}
+            return {"cmd": template.format(**params), "desc": rule.desc,
+                    "safe": "YES" if rule.safe else "NO"}
+    return None
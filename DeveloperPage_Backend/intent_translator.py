@@ -0,0 +1,247 @@
+"""Natural-language → shell command translation for /api/agent.
+
+Routine intents are answered by the local rules in intent_rules, repeats by
+the translation cache; only the rest reach the model.
+
+Model calls are made without holding a threadpool worker: the async Gemini
+API is used when the SDK has it, otherwise the blocking call runs in a
+thread. At most MAX_CONCURRENT_LLM_CALLS calls are in flight at once, so a
+burst of agent traffic waits its turn instead of starving the file and
+terminal endpoints of threads.
+
+Identical concurrent requests (same cache key, i.e. normalized prompt + OS +
+shell) share one in-flight call. The call runs in its own task, so a client
+that disconnects does not cancel it for the others waiting on it.
+
+Lists of intents (``translate_batch``) are packed into numbered multi-intent
+prompts of at most BATCH_TOKEN_BUDGET estimated tokens each, so N intents
+cost a handful of model calls instead of N.
+"""
+import os
+import re
+import asyncio
+import logging
+import platform
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from translation_cache import TranslationCache, cache_key
+from intent_rules import match_intent
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT = int(os.getenv("MAX_CONCURRENT_LLM_CALLS", "4"))
+CALL_TIMEOUT = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+BATCH_TOKEN_BUDGET = int(os.getenv("BATCH_TOKEN_BUDGET", "1500"))
+MAX_BATCH_SIZE = 25
+ANSWER_TOKENS = 48          # allowance for one COMMAND/EXPLANATION/SAFE block
+
+AGENT_CONTEXT = "You are a terminal expert. Translate natural language to shell commands."
+_ITEM_HEADER = re.compile(r"^\W*#+\s*(\d+)")
+
+
+@lru_cache(maxsize=1)
+def os_label() -> str:
+    """OS description for prompts and cache keys, detected once per process."""
+    return f"{os.name} (Platform: {platform.system() or 'unknown'})"
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def build_prompt(intent: str, os_name: str) -> str:
+    return f"""
+        {AGENT_CONTEXT}
+        User Intent: {intent}
+        OS: {os_name}
+
+        Return the result in this exact format:
+        COMMAND: [single line command]
+        EXPLANATION: [briefly explain what it does]
+        SAFE: [YES/NO] (NO if it deletes files or changes system settings)
+        """
+
+
+def parse_translation(text: str) -> Dict[str, str]:
+    result = {}
+    for line in text.strip().split('\n'):
+        line = line.strip()
+        if line.startswith("COMMAND:"): result['cmd'] = line.replace("COMMAND:", "").strip()
+        if line.startswith("EXPLANATION:"): result['desc'] = line.replace("EXPLANATION:", "").strip()
+        if line.startswith("SAFE:"): result['safe'] = line.replace("SAFE:", "").strip()
+    return result
+
+
+def build_batch_prompt(intents: List[str], os_name: str) -> str:
+    numbered = "\n".join(f"        {i}. {intent}" for i, intent in enumerate(intents, 1))
+    return f"""
+        {AGENT_CONTEXT}
+        OS: {os_name}
+        Translate each of these numbered intents independently:
+{numbered}
+
+        For every intent, in order, return exactly:
+        ### [number]
+        COMMAND: [single line command]
+        EXPLANATION: [briefly explain what it does]
+        SAFE: [YES/NO] (NO if it deletes files or changes system settings)
+        """
+
+
+def parse_batch(text: str, count: int) -> List[Optional[Dict[str, str]]]:
+    """Per-intent results of a batch answer; None where an item is missing."""
+    blocks: Dict[int, List[str]] = {}
+    current = None
+    for line in text.split('\n'):
+        header = _ITEM_HEADER.match(line)
+        if header:
+            current = int(header.group(1))
+            blocks[current] = []
+        elif current is not None:
+            blocks[current].append(line)
+    results = []
+    for i in range(1, count + 1):
+        result = parse_translation("\n".join(blocks.get(i, [])))
+        results.append(result if result.get("cmd") else None)
+    return results
+
+
+def pack_batches(intents: List[str], budget: int = BATCH_TOKEN_BUDGET) -> List[List[str]]:
+    """Split ``intents`` into groups whose prompt + answers fit ``budget`` tokens."""
+    base = estimate_tokens(build_batch_prompt([], os_label()))
+    batches, current, used = [], [], base
+    for intent in intents:
+        cost = estimate_tokens(intent) + ANSWER_TOKENS
+        if current and (used + cost > budget or len(current) >= MAX_BATCH_SIZE):
+            batches.append(current)
+            current, used = [], base
+        current.append(intent)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+# ─── Model calls ─────────────────────────────────────────────────────────────
+
+_semaphore: Optional[asyncio.Semaphore] = None
+_in_flight: Dict[str, asyncio.Future] = {}
+_stats = {"calls": 0, "coalesced": 0, "waiting": 0, "batched_intents": 0, "rules": 0}
+
+
+def _limit() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:   # created inside the running loop
+        _semaphore = asyncio.Semaphore(MAX_CONCURRENT)
+    return _semaphore
+
+
+async def generate(model, prompt: str) -> str:
+    """Response text for ``prompt``, within the global concurrency limit."""
+    _stats["waiting"] += 1
+    try:
+        await _limit().acquire()
+    finally:
+        _stats["waiting"] -= 1
+    try:
+        _stats["calls"] += 1
+        if hasattr(model, "generate_content_async"):
+            call = model.generate_content_async(prompt)
+        else:
+            call = asyncio.to_thread(model.generate_content, prompt)
+        response = await asyncio.wait_for(call, CALL_TIMEOUT)
+        return response.text
+    finally:
+        _limit().release()
+
+
+async def single_flight(key: str, make_call: Callable[[], Awaitable]) -> Tuple[object, bool]:
+    """Run ``make_call()`` once per ``key`` at a time; returns (result, shared)."""
+    future = _in_flight.get(key)
+    shared = future is not None
+    if shared:
+        _stats["coalesced"] += 1
+    else:
+        future = asyncio.ensure_future(make_call())
+        _in_flight[key] = future
+        future.add_done_callback(lambda _: _in_flight.pop(key, None))
+    return await asyncio.shield(future), shared
+
+
+async def local_answer(intent: str, os_name: str, shell: str, cache: TranslationCache,
+                       use_cache: bool = True) -> Optional[Dict]:
+    """Rule-based or cached answer with its ``source``; None if the model is needed."""
+    matched = match_intent(intent, shell)
+    if matched is not None:
+        _stats["rules"] += 1
+        return {**matched, "source": "rules"}
+    if use_cache:
+        cached = await cache.aget(cache_key(intent, os_name, shell))
+        if cached is not None:
+            return {**cached, "source": "cache"}
+    return None
+
+
+async def translate(model, intent: str, os_name: str, shell: str,
+                    cache: TranslationCache, use_cache: bool = True) -> Dict:
+    """``{cmd, desc, safe}`` plus ``source``.
+
+    ``source`` is 'rules', 'cache', 'model' or 'shared' (joined another
+    request's call).
+    """
+    local = await local_answer(intent, os_name, shell, cache, use_cache)
+    if local is not None:
+        return local
+    key = cache_key(intent, os_name, shell)
+
+    async def call():
+        result = parse_translation(await generate(model, build_prompt(intent, os_name)))
+        await asyncio.to_thread(cache.put, key, intent, result)
+        return result
+
+    result, shared = await single_flight(key, call)
+    return {**result, "source": "shared" if shared else "model"}
+
+
+async def translate_batch(model, intents: List[str], os_name: str, shell: str,
+                          cache: TranslationCache, use_cache: bool = True) -> List[Dict]:
+    """Translate ``intents`` with as few model calls as the token budget allows.
+
+    Results come back in input order, each with a ``source`` like translate().
+    Rule matches, cache hits and duplicates never reach the model; an item
+    the batch answer leaves out is retried on its own.
+    """
+    keys = [cache_key(intent, os_name, shell) for intent in intents]
+    results: List[Optional[Dict]] = [None] * len(intents)
+    pending: Dict[str, str] = {}       # key → first intent text with that key
+    for i, (intent, key) in enumerate(zip(intents, keys)):
+        results[i] = await local_answer(intent, os_name, shell, cache, use_cache)
+        if results[i] is None:
+            pending.setdefault(key, intent)
+
+    fresh: Dict[str, Dict] = {}
+
+    async def run(group: List[str]):
+        answers = parse_batch(await generate(model, build_batch_prompt(group, os_name)), len(group))
+        for intent, answer in zip(group, answers):
+            key = cache_key(intent, os_name, shell)
+            if answer is None:
+                answer = await translate(model, intent, os_name, shell, cache, use_cache=False)
+                answer.pop("source", None)
+            else:
+                await asyncio.to_thread(cache.put, key, intent, answer)
+            fresh[key] = answer
+
+    if pending:
+        await asyncio.gather(*(run(group) for group in pack_batches(list(pending.values()))))
+        _stats["batched_intents"] += len(pending)
+
+    for i, key in enumerate(keys):
+        if results[i] is None:
+            results[i] = {**fresh[key], "source": "model"}
+    return results
+
+
+def stats() -> dict:
+    return {"max_concurrent": MAX_CONCURRENT, "in_flight": len(_in_flight), **_stats}
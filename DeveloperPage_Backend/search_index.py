@@ -0,0 +1,484 @@
+"""Trigram-filtered full-text / regex search over a workspace root.
+
+Every indexed text file gets a small fingerprint: a bitmap (sized to the file,
+256 bits to 64 Kbit) with one bit set per distinct lower-cased byte trigram.
+A query is reduced to the literal runs any match must contain; their trigrams
+become a mask, and only files whose fingerprint covers the mask are opened and
+run through the real regex. Checking a file is one big-int AND, so narrowing
+100k files takes milliseconds, and a fingerprint costs a few hundred bytes
+instead of a posting list per trigram.
+
+The index is persisted under SEARCH_INDEX_DIR and reused across restarts —
+files whose mtime and size did not change are not re-read — and it is kept
+current from the root's shared watcher (fs_watcher.WatchHub).
+"""
+import os
+import re
+import time
+import uuid
+import struct
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+try:
+    from re import _parser as sre_parse   # Python 3.11+
+except ImportError:
+    import sre_parse
+
+from file_tree import list_entries, is_visible
+from fs_watcher import get_hub
+from ignore_rules import get_rules, IGNORE_FILES
+
+logger = logging.getLogger(__name__)
+
+SEARCH_INDEX_DIR = os.getenv("SEARCH_INDEX_DIR",
+                             os.path.join(os.path.expanduser("~"), ".synnccit", "search"))
+MAX_FILE_BYTES = int(os.getenv("SEARCH_MAX_FILE_BYTES", str(1024 * 1024)))
+MAX_INDEXES = int(os.getenv("SEARCH_INDEX_MAX_ROOTS", "2"))
+SAVE_DELAY = float(os.getenv("SEARCH_INDEX_SAVE_DELAY", "30"))
+DEFAULT_MAX_RESULTS = 1000
+MAX_RESULTS = 10000
+MAX_LINE_CHARS = 400
+VERIFY_BATCH = 64   # candidate files checked per worker-thread hop
+
+_MAGIC = b"SYNIDX1\n"
+_RECORD = struct.Struct("<HqqB")   # path length, mtime_ns, size, bits log2 (0 = not indexed)
+_MIX = 0x9E3779B1
+_MIN_BITS_LOG, _MAX_BITS_LOG = 8, 16
+
+# search id → cancel event, for DELETE /api/search/{id}
+ACTIVE_SEARCHES: Dict[str, asyncio.Event] = {}
+
+
+# ─── Fingerprints ────────────────────────────────────────────────────────────
+
+def _bit(gram: bytes, shift: int) -> int:
+    return ((int.from_bytes(gram, "little") * _MIX) & 0xFFFFFFFF) >> shift
+
+
+def fingerprint(data: bytes) -> Tuple[int, int]:
+    """(bits log2, bitmap) for the lower-cased trigrams of ``data``."""
+    data = data.lower()
+    grams = {data[i:i + 3] for i in range(len(data) - 2)}
+    k = max(_MIN_BITS_LOG, min(_MAX_BITS_LOG, (2 * len(grams)).bit_length()))
+    shift = 32 - k
+    buf = bytearray(1 << (k - 3))
+    for gram in grams:
+        bit = _bit(gram, shift)
+        buf[bit >> 3] |= 1 << (bit & 7)
+    return k, int.from_bytes(buf, "little")
+
+
+def _mask(grams, k: int) -> int:
+    mask = 0
+    for gram in grams:
+        mask |= 1 << _bit(gram, 32 - k)
+    return mask
+
+
+# ─── Query planning ──────────────────────────────────────────────────────────
+
+def _literal_runs(parsed, ignore_case: bool) -> List[str]:
+    """Literal strings every match of the parsed pattern must contain."""
+    runs, current = [], []
+
+    def flush():
+        if len(current) >= 3:
+            runs.append("".join(current))
+        current.clear()
+
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            ch = chr(av)
+            if ignore_case and not ch.isascii():
+                flush()  # case folding outside ASCII does not map byte-for-byte
+            else:
+                current.append(ch)
+        elif op is sre_parse.AT:
+            continue  # anchors are zero-width
+        elif op is sre_parse.SUBPATTERN:
+            flush()
+            runs.extend(_literal_runs(av[-1], ignore_case))
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) or op.name == "POSSESSIVE_REPEAT":
+            flush()
+            low, _, sub = av
+            if low >= 1:
+                runs.extend(_literal_runs(sub, ignore_case))
+        else:
+            flush()
+    flush()
+    return runs
+
+
+class Query:
+    """A compiled search plus the trigrams a candidate file must contain."""
+
+    def __init__(self, text: str, regex: bool = False, case_sensitive: bool = False):
+        flags = re.MULTILINE | (0 if case_sensitive else re.IGNORECASE)
+        source = text if regex else re.escape(text)
+        self.pattern = re.compile(source, flags)   # re.error on a bad regex
+        ignore_case = bool(self.pattern.flags & re.IGNORECASE)
+        if regex:
+            runs = _literal_runs(sre_parse.parse(source, flags), ignore_case)
+        else:
+            runs = [text] if not (ignore_case and not text.isascii()) else []
+        self.grams = set()
+        for run in runs:
+            data = run.encode("utf-8").lower()
+            self.grams.update(data[i:i + 3] for i in range(len(data) - 2))
+        self._masks: Dict[int, int] = {}
+
+    def mask(self, k: int) -> int:
+        if k not in self._masks:
+            self._masks[k] = _mask(self.grams, k)
+        return self._masks[k]
+
+
+def search_file(path: str, query: Query, limit: int) -> List[dict]:
+    """Matching lines of one file (first match per line), at most ``limit``."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read(MAX_FILE_BYTES + 1)
+    except OSError:
+        return []
+    text = data.decode("utf-8", errors="replace")
+    matches = []
+    line, counted_to, last_line = 1, 0, 0
+    for m in query.pattern.finditer(text):
+        line += text.count("\n", counted_to, m.start())
+        counted_to = m.start()
+        if line == last_line:
+            continue
+        last_line = line
+        start = text.rfind("\n", 0, m.start()) + 1
+        end = text.find("\n", m.start())
+        content = text[start:end if end != -1 else len(text)].rstrip("\r")
+        matches.append({"type": "match", "path": path, "line": line,
+                        "column": m.start() - start + 1,
+                        "length": m.end() - m.start(),
+                        "text": content[:MAX_LINE_CHARS]})
+        if len(matches) >= limit:
+            break
+    return matches
+
+
+# ─── Index ───────────────────────────────────────────────────────────────────
+
+def _store_path(root: str) -> str:
+    digest = hashlib.sha1(root.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(SEARCH_INDEX_DIR, f"{digest}.idx")
+
+
+class SearchIndex:
+    """Trigram fingerprints of the text files under one workspace root."""
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.rules = get_rules(self.root)
+        self.store = _store_path(self.root)
+        self.ready = False
+        self.dirty = False
+        # path → (mtime_ns, size, bits log2 or 0 when binary / too big, bitmap)
+        self._files: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._building = asyncio.Lock()
+        self._hub = None
+        self._save_handle = None
+        self.queries = 0
+        self.build_seconds = 0.0
+
+    # ── Persistence ──
+    def load(self) -> Dict[str, tuple]:
+        files = {}
+        try:
+            with open(self.store, "rb") as f:
+                if f.readline() != _MAGIC or f.readline().rstrip(b"\n").decode("utf-8") != self.root:
+                    return {}
+                while True:
+                    head = f.read(_RECORD.size)
+                    if len(head) < _RECORD.size:
+                        break
+                    plen, mtime, size, k = _RECORD.unpack(head)
+                    path = f.read(plen).decode("utf-8")
+                    bits = int.from_bytes(f.read(1 << (k - 3)), "little") if k else 0
+                    files[path] = (mtime, size, k, bits)
+        except (OSError, ValueError, UnicodeDecodeError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.warning(f"Discarding search index {self.store}: {e}")
+            return {}
+        return files
+
+    def save(self):
+        with self._lock:
+            items = list(self._files.items())
+            self.dirty = False
+        os.makedirs(SEARCH_INDEX_DIR, exist_ok=True)
+        tmp = f"{self.store}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(_MAGIC + self.root.encode("utf-8") + b"\n")
+                for path, (mtime, size, k, bits) in items:
+                    raw = path.encode("utf-8")
+                    f.write(_RECORD.pack(len(raw), mtime, size, k) + raw)
+                    if k:
+                        f.write(bits.to_bytes(1 << (k - 3), "little"))
+            os.replace(tmp, self.store)
+        except OSError as e:
+            logger.error(f"Could not save search index {self.store}: {e}")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    # ── Building ──
+    def build(self):
+        started = time.monotonic()
+        previous = self._files if self.ready else self.load()
+        files, reused = {}, 0
+        stack = [self.root]
+        while stack:
+            folder = stack.pop()
+            try:
+                entries = list_entries(folder, self.rules)
+            except (PermissionError, FileNotFoundError, NotADirectoryError):
+                continue
+            for _, _, path, is_dir, ignored in entries:
+                if ignored:
+                    continue
+                if is_dir:
+                    stack.append(path)
+                    continue
+                record = self._record(path, previous.get(path))
+                if record is not None:
+                    files[path] = record
+                    reused += record is previous.get(path)
+        with self._lock:
+            self._files = files
+            self.ready = True
+            self.dirty = True
+        self.build_seconds = time.monotonic() - started
+        logger.info(f"Search index for {self.root}: {len(files)} files "
+                    f"({reused} unchanged) in {self.build_seconds:.2f}s")
+
+    def _record(self, path: str, old: Optional[tuple] = None) -> Optional[tuple]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if old is not None and old[0] == st.st_mtime_ns and old[1] == st.st_size:
+            return old
+        if st.st_size > MAX_FILE_BYTES:
+            return (st.st_mtime_ns, st.st_size, 0, 0)
+        try:
+            with open(path, "rb") as f:
+                data = f.read(MAX_FILE_BYTES + 1)
+        except OSError:
+            return None
+        if b"\0" in data[:8192]:
+            return (st.st_mtime_ns, st.st_size, 0, 0)  # binary
+        k, bits = fingerprint(data)
+        return (st.st_mtime_ns, st.st_size, k, bits)
+
+    # ── Incremental updates ──
+    def apply(self, paths):
+        if any(os.path.basename(path) in IGNORE_FILES for path in paths):
+            self.build()
+            return
+        for path in set(paths):
+            if not os.path.exists(path) or not is_visible(self.root, path, self.rules) \
+                    or self.rules.is_ignored(path):
+                self._drop(path)
+            elif os.path.isdir(path):
+                self._add_tree(path)
+            else:
+                record = self._record(path, self._files.get(path))
+                with self._lock:
+                    if record is None:
+                        self._files.pop(path, None)
+                    else:
+                        self._files[path] = record
+                    self.dirty = True
+
+    def _drop(self, path: str):
+        prefix = path + os.sep
+        with self._lock:
+            for name in [p for p in self._files if p == path or p.startswith(prefix)]:
+                del self._files[name]
+                self.dirty = True
+
+    def _add_tree(self, path: str):
+        stack = [path]
+        while stack:
+            folder = stack.pop()
+            try:
+                entries = list_entries(folder, self.rules)
+            except (PermissionError, FileNotFoundError, NotADirectoryError):
+                continue
+            for _, _, child, is_dir, ignored in entries:
+                if ignored:
+                    continue
+                if is_dir:
+                    stack.append(child)
+                    continue
+                record = self._record(child, self._files.get(child))
+                if record is not None:
+                    with self._lock:
+                        self._files[child] = record
+                        self.dirty = True
+
+    # ── Queries ──
+    def candidates(self, query: Query, prefix: Optional[str] = None) -> Tuple[List[str], int]:
+        """(files that may match, number of files considered)."""
+        with self._lock:
+            items = list(self._files.items())
+        if prefix:
+            items = [(p, r) for p, r in items if p.startswith(prefix)]
+        if not query.grams:
+            return [p for p, r in items if r[2]], len(items)
+        found = []
+        for path, (_, _, k, bits) in items:
+            if k:
+                mask = query.mask(k)
+                if bits & mask == mask:
+                    found.append(path)
+        return found, len(items)
+
+    # ── Watching ──
+    def start_watching(self):
+        if self._hub is None:
+            self._hub = get_hub(self.root)
+            self._hub.add_listener(self._on_changes, self._on_watch_error)
+
+    async def _on_changes(self, paths):
+        await asyncio.to_thread(self.apply, paths)
+        if self.dirty and self._save_handle is None:
+            loop = asyncio.get_running_loop()
+            self._save_handle = loop.call_later(SAVE_DELAY, self._save_later)
+
+    def _save_later(self):
+        self._save_handle = None
+        asyncio.get_running_loop().run_in_executor(None, self.save)
+
+    def _on_watch_error(self):
+        # Events may have been missed; the next search re-stats everything
+        self.ready = False
+        self.close()
+
+    def close(self):
+        if self._hub is not None:
+            self._hub.remove_listener(self._on_changes, self._on_watch_error)
+            self._hub = None
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            records = list(self._files.values())
+        return {
+            "root": self.root,
+            "ready": self.ready,
+            "files": len(records),
+            "indexed": sum(1 for r in records if r[2]),
+            "fingerprint_bytes": sum(1 << (r[2] - 3) for r in records if r[2]),
+            "build_seconds": round(self.build_seconds, 3),
+            "queries": self.queries,
+        }
+
+
+_indexes: "OrderedDict[str, SearchIndex]" = OrderedDict()
+
+
+async def get_search_index(root: str) -> SearchIndex:
+    """Search index for ``root``, loaded / refreshed off the event loop on first use."""
+    root = os.path.abspath(root)
+    index = _indexes.get(root)
+    if index is None:
+        index = SearchIndex(root)
+        _indexes[root] = index
+        while len(_indexes) > MAX_INDEXES:
+            _, evicted = _indexes.popitem(last=False)
+            evicted.close()
+            if evicted.dirty:
+                await asyncio.to_thread(evicted.save)
+    _indexes.move_to_end(root)
+    async with index._building:
+        if not index.ready:
+            await asyncio.to_thread(index.build)
+            index.start_watching()
+            asyncio.get_running_loop().run_in_executor(None, index.save)
+    return index
+
+
+def warm(root: str):
+    """Start loading ``root``'s index in the background so the first search is fast."""
+    if os.path.abspath(root) not in _indexes:
+        asyncio.create_task(get_search_index(root))
+
+
+def all_search_indexes() -> List[SearchIndex]:
+    return list(_indexes.values())
+
+
+def close_all():
+    """Stop watching and flush unsaved changes (called on shutdown)."""
+    for index in _indexes.values():
+        index.close()
+        if index.dirty:
+            index.save()
+    _indexes.clear()
+
+
+# ─── Running a search ────────────────────────────────────────────────────────
+
+async def run_search(index: SearchIndex, query: Query, prefix: Optional[str] = None,
+                     max_results: int = DEFAULT_MAX_RESULTS, timeout: Optional[float] = None,
+                     search_id: Optional[str] = None) -> AsyncIterator[dict]:
+    """Yield match events as they are found, then one ``done`` summary.
+
+    Stops early when ``max_results`` is reached, ``timeout`` seconds pass or
+    the search is cancelled through ``ACTIVE_SEARCHES[search_id]``.
+    """
+    search_id = search_id or uuid.uuid4().hex
+    cancel = ACTIVE_SEARCHES[search_id] = asyncio.Event()
+    started = time.monotonic()
+    deadline = started + timeout if timeout else None
+    index.queries += 1
+    matches = scanned = 0
+    reason = "complete"
+    try:
+        candidates, considered = index.candidates(query, prefix)
+        for i in range(0, len(candidates), VERIFY_BATCH):
+            if cancel.is_set():
+                reason = "cancelled"
+                break
+            if deadline and time.monotonic() > deadline:
+                reason = "timeout"
+                break
+            batch = candidates[i:i + VERIFY_BATCH]
+            remaining = max_results - matches
+            found = await asyncio.to_thread(
+                lambda: [m for path in batch for m in search_file(path, query, remaining)])
+            scanned += len(batch)
+            for match in found[:remaining]:
+                matches += 1
+                yield match
+            if matches >= max_results:
+                reason = "limit"
+                break
+        yield {
+            "type": "done",
+            "id": search_id,
+            "reason": reason,
+            "matches": matches,
+            "candidates": len(candidates),
+            "files_scanned": scanned,
+            "files_considered": considered,
+            "elapsed_ms": round((time.monotonic() - started) * 1000, 1),
+        }
+    finally:
+        ACTIVE_SEARCHES.pop(search_id, None)
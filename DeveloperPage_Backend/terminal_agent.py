@@ -4,9 +4,15 @@
 #   - POST /api/file            (save file content)
 #   - POST /api/terminal        (execute terminal command)
 import os
+import sys
+import asyncio
 import subprocess
 import google.generativeai as genai
-from typing import Dict, Union
+from typing import Dict, List, Union
+
+from translation_cache import get_translation_cache, cache_key
+from intent_rules import match_intent
+from intent_translator import build_prompt, parse_translation, translate_batch, os_label
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -26,32 +32,40 @@ model = genai.GenerativeModel(model_name)
 class TerminalAgent:
     def __init__(self):
         self.context = "You are a terminal expert. Translate natural language to shell commands."
+        self.os_label = os_label()      # platform detected once, not per prompt
+        self.shell = os.path.basename(os.getenv("SHELL") or os.getenv("COMSPEC") or "sh")
+        self.cache = get_translation_cache()
 
-    def translate_intent(self, user_prompt: str) -> Dict[str, str]:
-        """Translates user intent into a shell command and explanation."""
-        prompt = f"""
-        {self.context}
-        User Intent: {user_prompt}
-        OS: {os.name} (Platform: {subprocess.check_output('uname -s', shell=True).decode().strip()})
-        
-        Return the result in this exact format:
-        COMMAND: [single line command]
-        EXPLANATION: [briefly explain what it does]
-        SAFE: [YES/NO] (NO if it deletes files or changes system settings)
+    def translate_intent(self, user_prompt: str, use_cache: bool = True) -> Dict[str, str]:
+        """Translates user intent into a shell command and explanation.
+
+        Routine intents are answered by the local rules and repeated ones
+        from the translation cache; pass ``use_cache=False`` to ask the model
+        again and refresh the cache entry.
         """
-        
-        response = model.generate_content(prompt)
-        lines = response.text.strip().split('\n')
-        
-        # Simple parsing logic
-        result = {}
-        for line in lines:
-            if line.startswith("COMMAND:"): result['cmd'] = line.replace("COMMAND:", "").strip()
-            if line.startswith("EXPLANATION:"): result['desc'] = line.replace("EXPLANATION:", "").strip()
-            if line.startswith("SAFE:"): result['safe'] = line.replace("SAFE:", "").strip()
-        
+        matched = match_intent(user_prompt, self.shell)
+        if matched is not None:
+            return matched
+
+        key = cache_key(user_prompt, self.os_label, self.shell)
+        if use_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        response = model.generate_content(build_prompt(user_prompt, self.os_label))
+        result = parse_translation(response.text)
+        self.cache.put(key, user_prompt, result)
         return result
 
+    def translate_intents(self, user_prompts: List[str], use_cache: bool = True) -> List[Dict[str, str]]:
+        """Translates a list of intents in as few model calls as possible, in order."""
+        results = asyncio.run(translate_batch(model, user_prompts, self.os_label, self.shell,
+                                              self.cache, use_cache))
+        for result in results:
+            result.pop("source", None)
+        return results
+
     def execute_command(self, command: str):
         """Executes the command and returns output."""
         try:
@@ -65,6 +79,17 @@ class TerminalAgent:
 
 def main():
     agent = TerminalAgent()
+
+    # Non-interactive: `python terminal_agent.py "intent one" "intent two" ...`
+    if len(sys.argv) > 1:
+        for intent, parsed in zip(sys.argv[1:], agent.translate_intents(sys.argv[1:])):
+            print(f"\n> {intent}")
+            print(f"✨ Suggested Command: {parsed.get('cmd')}")
+            print(f"📝 Info: {parsed.get('desc')}")
+            if parsed.get('safe') == "NO":
+                print("⚠️ WARNING: This command is potentially destructive.")
+        return
+
     print("🤖 AI Terminal Ready. What do you want to do?")
     
     while True:
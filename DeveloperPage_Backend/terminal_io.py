@@ -0,0 +1,319 @@
+"""Event-driven output pump and flow control for the /ws/terminal WebSocket.
+
+The PTY master fd is registered with the event loop (``loop.add_reader``) so an
+idle shell costs nothing: we only wake up when the kernel says there is output.
+Output is coalesced into frames on a small time/size budget before it is sent,
+either as UTF-8 text frames (default) or as compressed binary frames.
+
+Every session owns an ``OutputBudget``. Once the bytes buffered for (or sent
+to but not yet acknowledged by) the client reach the high watermark, the
+producers stop reading from the shell until the backlog drains below the low
+watermark — the kernel then blocks the shell itself, so a runaway ``yes``
+cannot pile output up in the server.
+"""
+import os
+import time
+import zlib
+import codecs
+import asyncio
+import logging
+import threading
+import subprocess
+from collections import deque
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# ─── Configuration ───────────────────────────────────────────────────────────
+# Minimum gap between two frames while output is streaming. The first chunk
+# after an idle period is sent immediately so keystroke echo is not delayed.
+FRAME_INTERVAL = float(os.getenv("TERMINAL_FRAME_INTERVAL_MS", "8")) / 1000
+# Upper bound on a single frame; bigger bursts are split across frames.
+FRAME_MAX_BYTES = int(os.getenv("TERMINAL_FRAME_MAX_BYTES", str(64 * 1024)))
+READ_CHUNK = 64 * 1024
+COMPRESSION_LEVEL = int(os.getenv("TERMINAL_COMPRESSION_LEVEL", "1"))
+
+# Flow control: stop reading the shell at HIGH, resume once back under LOW.
+HIGH_WATERMARK = int(os.getenv("TERMINAL_HIGH_WATERMARK", str(256 * 1024)))
+LOW_WATERMARK = int(os.getenv("TERMINAL_LOW_WATERMARK", str(64 * 1024)))
+# Producers stop at HIGH and read at most READ_CHUNK at a time, so unsent
+# output stays under HIGH + READ_CHUNK. That is also the hard cap: only a
+# bigger one-off push (a scrollback replay longer than HIGH) goes over it, and
+# its oldest part is replaced by a "dropped" marker.
+# Time a terminated shell gets to exit before it is killed.
+KILL_GRACE = 2.0
+
+
+def _dropped_marker(count: int) -> bytes:
+    return f"\r\n\x1b[33m[… {count} bytes of output dropped …]\x1b[0m\r\n".encode()
+
+
+class OutputBudget:
+    """Per-session output buffer with high/low watermarks and counters.
+
+    Producers ``push`` shell output and ``await wait_writable()`` before each
+    read; the sender pulls coalesced frames with ``next_frame``. In ack mode
+    (``?flow=ack``) frames count against the budget until the client confirms
+    it has rendered them with ``{ type: 'ack', frames: N }``.
+    """
+
+    def __init__(self, ack_mode: bool = False, high: int = HIGH_WATERMARK,
+                 low: int = LOW_WATERMARK, max_buffered: Optional[int] = None):
+        self.ack_mode = ack_mode
+        self.high = high
+        self.low = min(low, high)
+        self.max_buffered = max(max_buffered or high + READ_CHUNK, FRAME_MAX_BYTES)
+        self.buffer = bytearray()
+        self.eof = False
+
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.bytes_dropped = 0
+        self.frames_out = 0
+        self._unacked = deque()
+        self._unacked_bytes = 0
+        self._pending_drop = 0
+        self._throttled_since = None
+        self._throttled_total = 0.0
+        self._last_frame = 0.0
+
+        self._data = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+        self._acked = asyncio.Event()
+        self.on_resume = None  # optional callback, used by FdReader
+
+    # ── State ──
+    @property
+    def pending(self) -> int:
+        return len(self.buffer) + self._unacked_bytes
+
+    @property
+    def throttled(self) -> bool:
+        return self._throttled_since is not None
+
+    def _update(self):
+        if not self.throttled and self.pending >= self.high:
+            self._throttled_since = time.monotonic()
+            self._writable.clear()
+        elif self.throttled and self.pending <= self.low:
+            self._throttled_total += time.monotonic() - self._throttled_since
+            self._throttled_since = None
+            self._writable.set()
+            if self.on_resume:
+                self.on_resume()
+
+    # ── Producer side ──
+    def push(self, data: bytes):
+        if not data:
+            return
+        self.bytes_in += len(data)
+        self.buffer += data
+        overflow = len(self.buffer) - self.max_buffered
+        if overflow > 0:
+            del self.buffer[:overflow]
+            self._pending_drop += overflow
+            self.bytes_dropped += overflow
+        self._update()
+        self._data.set()
+
+    def close(self):
+        self.eof = True
+        self._data.set()
+        self._acked.set()
+        self._writable.set()
+
+    async def wait_writable(self):
+        await self._writable.wait()
+
+    # ── Consumer side ──
+    async def next_frame(self) -> bytes:
+        """Wait for output and return one coalesced frame (b'' on EOF)."""
+        while not self.buffer and not self.eof:
+            self._data.clear()
+            await self._data.wait()
+
+        # A client that has not acknowledged enough output gets nothing more.
+        while self.ack_mode and self._unacked_bytes >= self.high and not self.eof:
+            self._acked.clear()
+            await self._acked.wait()
+
+        # While streaming, hold the frame until the interval has elapsed so
+        # bursts are merged instead of sent as thousands of tiny messages.
+        wait = self._last_frame + FRAME_INTERVAL - time.monotonic()
+        if wait > 0 and not self.eof and len(self.buffer) < FRAME_MAX_BYTES:
+            await asyncio.sleep(wait)
+
+        frame = bytes(self.buffer[:FRAME_MAX_BYTES])
+        del self.buffer[:FRAME_MAX_BYTES]
+        if self._pending_drop:
+            frame = _dropped_marker(self._pending_drop) + frame
+            self._pending_drop = 0
+        self._last_frame = time.monotonic()
+        if frame and self.ack_mode:
+            self._unacked.append(len(frame))
+            self._unacked_bytes += len(frame)
+        self._update()
+        return frame
+
+    def sent(self, size: int):
+        self.bytes_out += size
+        self.frames_out += 1
+
+    def ack(self, frames: int = 1):
+        for _ in range(min(max(frames, 0), len(self._unacked))):
+            self._unacked_bytes -= self._unacked.popleft()
+        self._acked.set()
+        self._update()
+
+    def stats(self) -> dict:
+        throttled = self._throttled_total
+        if self.throttled:
+            throttled += time.monotonic() - self._throttled_since
+        return {
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "bytes_dropped": self.bytes_dropped,
+            "frames_out": self.frames_out,
+            "pending": self.pending,
+            "throttled": self.throttled,
+            "throttled_seconds": round(throttled, 3),
+            "ack_mode": self.ack_mode,
+        }
+
+
+class FdReader:
+    """Feeds a non-blocking fd into a sink from readiness callbacks.
+
+    The sink is an OutputBudget or anything with the same producer interface
+    (``push``, ``close``, ``eof``, ``throttled``, ``on_resume``).
+    """
+
+    def __init__(self, fd: int, sink):
+        self.fd = fd
+        self.sink = sink
+        self.loop = asyncio.get_running_loop()
+        self._reading = False
+        sink.on_resume = self.start
+
+    def start(self):
+        if not self._reading and not self.sink.eof:
+            self.loop.add_reader(self.fd, self._on_readable)
+            self._reading = True
+
+    def stop(self):
+        if self._reading:
+            self.loop.remove_reader(self.fd)
+            self._reading = False
+
+    def _on_readable(self):
+        try:
+            data = os.read(self.fd, READ_CHUNK)
+        except BlockingIOError:
+            return
+        except OSError:
+            # EIO: the shell exited and the slave side is gone
+            data = b""
+        if not data:
+            self.stop()
+            self.sink.close()
+            return
+        self.sink.push(data)
+        # Client is behind — let the kernel hold the rest (and block the
+        # shell) until the budget drops back under the low watermark.
+        if self.sink.throttled:
+            self.stop()
+
+
+async def read_stream(stream, sink):
+    """Producer for asyncio pipe back-ends (Windows / no-PTY fallback)."""
+    try:
+        while True:
+            await sink.wait_writable()
+            chunk = await stream.read(READ_CHUNK)
+            if not chunk:
+                break
+            sink.push(chunk)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"stdout read error: {e}")
+    finally:
+        sink.close()
+
+
+def reap(proc: subprocess.Popen):
+    """Terminate a shell and collect its exit status in the background.
+
+    Without the wait an exited shell stays a zombie for the server's lifetime.
+    Shells that ignore SIGTERM are killed after KILL_GRACE seconds.
+    """
+    if proc is None or proc.poll() is not None:
+        return
+    try:
+        proc.terminate()
+    except ProcessLookupError:
+        pass
+
+    def wait():
+        try:
+            proc.wait(timeout=KILL_GRACE)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+    try:
+        asyncio.get_running_loop().run_in_executor(None, wait)
+    except RuntimeError:
+        threading.Thread(target=wait, daemon=True).start()   # no loop (shutdown)
+
+
+async def pump_output(budget: OutputBudget, writer: "FrameWriter"):
+    """Sender task: drain the budget into the WebSocket frame by frame."""
+    while True:
+        frame = await budget.next_frame()
+        if not frame:
+            break
+        await writer.send(frame)
+        budget.sent(len(frame))
+    await writer.flush()
+
+
+class FrameWriter:
+    """Sends output frames to the client as text or deflate-compressed binary.
+
+    Text mode decodes incrementally so multi-byte UTF-8 sequences split across
+    reads are not turned into replacement characters. Binary mode sends the raw
+    bytes through one raw-deflate stream per connection (``Z_SYNC_FLUSH`` after
+    every frame), so the client keeps a single inflate context and repeated
+    output compresses against everything sent before it.
+    """
+
+    def __init__(self, websocket, compress: bool = False):
+        self.websocket = websocket
+        self.compress = compress
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._deflate = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, -15) if compress else None
+
+    async def send(self, data: bytes, final: bool = False):
+        if self._deflate is not None:
+            payload = self._deflate.compress(data) + self._deflate.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                await self.websocket.send_bytes(payload)
+        else:
+            text = self._decoder.decode(data, final)
+            if text:
+                await self.websocket.send_text(text)
+
+    async def flush(self):
+        await self.send(b"", final=True)
+
+
+def wants_compression(websocket) -> bool:
+    """Clients opt in to binary frames with ``/ws/terminal?compress=deflate``."""
+    return websocket.query_params.get("compress") == "deflate"
+
+
+def wants_acks(websocket) -> bool:
+    """Clients that acknowledge rendered frames connect with ``?flow=ack``."""
+    return websocket.query_params.get("flow") == "ack"
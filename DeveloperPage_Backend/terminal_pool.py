@@ -0,0 +1,192 @@
+"""Pool of pre-spawned, idle PTY shells for /ws/terminal.
+
+Spawning a shell and waiting for zsh/bash rc files to load is the slow part of
+opening a terminal, so we do it ahead of time. Each pooled shell is spawned in
+the background and "synced" — we wait until it has executed a marker command,
+which proves the rc files are loaded and the shell is reading input. When a
+connection takes a shell it is switched to the current workspace (``cd``) and
+synced again, so the client sees a clean prompt in the right directory.
+"""
+import os
+import time
+import uuid
+import shlex
+import asyncio
+import logging
+from typing import Callable, List, Optional, Tuple
+
+from terminal_io import READ_CHUNK, reap
+
+logger = logging.getLogger(__name__)
+
+# Idle shells kept ready; grows by one on every miss, up to the idle cap.
+POOL_SIZE = int(os.getenv("TERMINAL_POOL_SIZE", "2"))
+POOL_MAX_IDLE = int(os.getenv("TERMINAL_POOL_MAX_IDLE", "4"))
+# Shells must finish loading rc files within this budget to enter the pool.
+WARMUP_TIMEOUT = float(os.getenv("TERMINAL_POOL_WARMUP_SECONDS", "10"))
+HANDOUT_TIMEOUT = 1.0
+
+
+class WarmShell:
+    def __init__(self, proc, master_fd: int, cwd: str):
+        self.proc = proc
+        self.master_fd = master_fd
+        self.cwd = cwd
+        self.output = b""  # what the shell printed after the last sync (its prompt)
+        self.spawned_at = time.time()
+
+    @property
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def kill(self):
+        try:
+            os.close(self.master_fd)
+        except Exception:
+            pass
+        reap(self.proc)
+
+
+async def _read_until(fd: int, marker: bytes, timeout: float) -> Tuple[bool, bytes]:
+    """Read a non-blocking fd until ``marker`` shows up; returns (found, data)."""
+    loop = asyncio.get_running_loop()
+    buf = bytearray()
+    done = loop.create_future()
+
+    def on_readable():
+        try:
+            data = os.read(fd, READ_CHUNK)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            if not done.done():
+                done.set_result(False)
+            return
+        buf.extend(data)
+        if marker in buf and not done.done():
+            done.set_result(True)
+
+    loop.add_reader(fd, on_readable)
+    try:
+        found = await asyncio.wait_for(done, timeout)
+    except asyncio.TimeoutError:
+        found = False
+    finally:
+        loop.remove_reader(fd)
+    return found, bytes(buf)
+
+
+async def sync_shell(shell: WarmShell, timeout: float, cwd: Optional[str] = None) -> bool:
+    """Optionally ``cd`` the shell, then wait until it has run a marker command.
+
+    Everything printed up to the marker (rc noise, the echoed command line) is
+    discarded; what follows it — the fresh prompt — is kept in ``shell.output``.
+    The command starts with a space so bash/zsh keep it out of the history, and
+    the marker is assembled by printf so the echoed line never matches it.
+    """
+    nonce = uuid.uuid4().hex[:12]
+    marker = f"__synnccit_ready_{nonce}".encode()
+    command = f" printf '__synnccit_ready_%s\\n' {nonce}\n"
+    if cwd and cwd != shell.cwd:
+        command = f" cd -- {shlex.quote(cwd)};{command}"
+    os.write(shell.master_fd, command.encode())
+    found, data = await _read_until(shell.master_fd, marker, timeout)
+    if not found:
+        shell.output += data
+        return False
+    shell.output = data[data.index(marker) + len(marker):].lstrip(b"\r\n")
+    if cwd:
+        shell.cwd = cwd
+    return True
+
+
+class ShellPool:
+    """Keeps ``target`` warm shells ready and refills in the background."""
+
+    def __init__(self, spawn: Callable[[str], Tuple[object, int]], cwd: Callable[[], str],
+                 size: int = POOL_SIZE, max_idle: int = POOL_MAX_IDLE):
+        self.spawn = spawn
+        self.cwd = cwd
+        self.max_idle = max(0, max_idle)
+        self.target = min(max(0, size), self.max_idle)
+        self.idle: List[WarmShell] = []
+        self.hits = 0
+        self.misses = 0
+        self.spawned = 0
+        self.discarded = 0
+        self._warming = 0
+        self._fill_task = None
+        self._closed = False
+
+    async def acquire(self, cwd: str) -> Optional[WarmShell]:
+        """Hand out a warm shell switched to ``cwd``, or None on a miss."""
+        shell = None
+        while self.idle:
+            candidate = self.idle.pop(0)
+            if candidate.alive:
+                shell = candidate
+                break
+            candidate.kill()
+            self.discarded += 1
+
+        if shell is None:
+            self.misses += 1
+            # Demand outran the pool — keep one more ready next time
+            if self.target < self.max_idle:
+                self.target += 1
+        else:
+            self.hits += 1
+            if not await sync_shell(shell, HANDOUT_TIMEOUT, cwd=cwd):
+                logger.warning(f"Pooled shell {shell.proc.pid} slow to switch to {cwd}")
+        self.refill()
+        return shell
+
+    def refill(self):
+        if self._closed or self.target == 0:
+            return
+        if self._fill_task is None or self._fill_task.done():
+            self._fill_task = asyncio.create_task(self._fill())
+
+    async def _fill(self):
+        while not self._closed and len(self.idle) + self._warming < self.target:
+            self._warming += 1
+            try:
+                cwd = self.cwd()
+                proc, master_fd = self.spawn(cwd)
+                self.spawned += 1
+                shell = WarmShell(proc, master_fd, cwd)
+                if await sync_shell(shell, WARMUP_TIMEOUT) and not self._closed \
+                        and len(self.idle) < self.max_idle:
+                    self.idle.append(shell)
+                else:
+                    shell.kill()
+                    self.discarded += 1
+            except Exception as e:
+                logger.error(f"Shell pool refill failed: {e}")
+                return
+            finally:
+                self._warming -= 1
+
+    def close(self):
+        self._closed = True
+        if self._fill_task is not None:
+            self._fill_task.cancel()
+        for shell in self.idle:
+            shell.kill()
+        self.idle.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "idle": len(self.idle),
+            "warming": self._warming,
+            "target": self.target,
+            "max_idle": self.max_idle,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else None,
+            "spawned": self.spawned,
+            "discarded": self.discarded,
+        }
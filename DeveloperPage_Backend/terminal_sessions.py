@@ -0,0 +1,308 @@
+"""Persistent, reattachable terminal sessions for /ws/terminal.
+
+A session owns the shell process and keeps reading its output whether or not a
+WebSocket is attached. Output goes into a fixed-size scrollback ring and, while
+a client is attached, into that client's OutputBudget. When the WebSocket drops
+the session lingers for a grace period; reconnecting with the same session id
+replays the scrollback and reattaches to the running shell without spawning
+anything.
+"""
+import os
+import abc
+import time
+import uuid
+import errno
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from terminal_io import OutputBudget, FdReader, read_stream, reap
+
+try:
+    import fcntl, termios, struct
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+SCROLLBACK_BYTES = int(os.getenv("TERMINAL_SCROLLBACK_BYTES", str(256 * 1024)))
+SESSION_GRACE = float(os.getenv("TERMINAL_SESSION_GRACE_SECONDS", "300"))
+
+# session id → live session (attached or inside its grace period)
+TERMINAL_SESSIONS: Dict[str, "TerminalSession"] = {}
+
+
+class ScrollbackRing:
+    """Fixed-capacity byte ring; memory use never exceeds ``capacity``."""
+
+    def __init__(self, capacity: int = SCROLLBACK_BYTES):
+        self.capacity = capacity
+        self._buf = bytearray(capacity)
+        self._pos = 0   # next write offset
+        self._size = 0
+
+    def append(self, data: bytes):
+        if len(data) >= self.capacity:
+            self._buf[:] = data[-self.capacity:]
+            self._pos, self._size = 0, self.capacity
+            return
+        end = self._pos + len(data)
+        if end <= self.capacity:
+            self._buf[self._pos:end] = data
+        else:
+            first = self.capacity - self._pos
+            self._buf[self._pos:] = data[:first]
+            self._buf[:end - self.capacity] = data[first:]
+        self._pos = end % self.capacity
+        self._size = min(self._size + len(data), self.capacity)
+
+    def snapshot(self) -> bytes:
+        if self._size < self.capacity:
+            return bytes(self._buf[:self._size])
+        data = bytes(self._buf[self._pos:] + self._buf[:self._pos])
+        # The oldest line was cut by the wrap — start the replay on a line boundary
+        nl = data.find(b"\n")
+        return data[nl + 1:] if nl != -1 else data
+
+
+class TerminalSession(abc.ABC):
+    """Shell process + scrollback, with at most one attached WebSocket.
+
+    Also acts as the sink for FdReader / read_stream: output is recorded in the
+    scrollback and forwarded to the attached client's budget, so flow control
+    only applies while somebody is actually watching.
+    """
+
+    kind = "base"
+
+    def __init__(self, proc, session_id: Optional[str] = None):
+        self.id = session_id or uuid.uuid4().hex
+        self.proc = proc
+        self.scrollback = ScrollbackRing()
+        self.budget: Optional[OutputBudget] = None
+        self.websocket = None
+        self.eof = False
+        self.started = False
+        self.bytes_in = 0
+        self.created_at = time.time()
+        self.detached_at = None
+        self.on_resume = None
+        self._expiry = None
+        self._totals = {"bytes_out": 0, "bytes_dropped": 0, "frames_out": 0, "throttled_seconds": 0.0}
+        TERMINAL_SESSIONS[self.id] = self
+
+    @property
+    def pid(self):
+        return self.proc.pid if self.proc else None
+
+    # ── Sink interface (producers) ──
+    @property
+    def throttled(self) -> bool:
+        return self.budget is not None and self.budget.throttled
+
+    def push(self, data: bytes):
+        self.bytes_in += len(data)
+        self.scrollback.append(data)
+        if self.budget is not None:
+            self.budget.push(data)
+
+    async def wait_writable(self):
+        while self.budget is not None and self.budget.throttled:
+            await self.budget.wait_writable()
+
+    def close(self):
+        """Shell output hit EOF — the process is gone."""
+        self.eof = True
+        if self.budget is not None:
+            self.budget.close()
+        if self.websocket is None:
+            self.terminate()
+
+    def _resume(self):
+        if self.on_resume:
+            self.on_resume()
+
+    # ── Attachment ──
+    def attach(self, websocket, ack_mode: bool = False) -> OutputBudget:
+        """Attach a WebSocket, replaying scrollback into its fresh budget."""
+        if self.websocket is not None:
+            previous = self.websocket
+            self.detach(previous)
+            # Another tab took over this session
+            asyncio.create_task(previous.close(code=4001))
+        if self._expiry is not None:
+            self._expiry.cancel()
+            self._expiry = None
+
+        budget = OutputBudget(ack_mode=ack_mode)
+        budget.on_resume = self._resume
+        replay = self.scrollback.snapshot()
+        if replay:
+            budget.push(b"\x1b[0m" + replay)
+        if self.eof:
+            budget.close()
+        self.budget = budget
+        self.websocket = websocket
+        self.detached_at = None
+        return budget
+
+    def detach(self, websocket):
+        if websocket is not self.websocket:
+            return  # already taken over by a newer connection
+        budget = self.budget
+        for key, value in budget.stats().items():
+            if key in self._totals:
+                self._totals[key] += value
+        budget.close()
+        self.budget = None
+        self.websocket = None
+        self.detached_at = time.time()
+        # A reader paused for the old client keeps draining into the scrollback
+        self._resume()
+        if self.eof:
+            self.terminate()
+        else:
+            loop = asyncio.get_running_loop()
+            self._expiry = loop.call_later(SESSION_GRACE, self._expire)
+
+    def _expire(self):
+        if self.websocket is None:
+            logger.info(f"Terminal session {self.id} expired after {SESSION_GRACE:.0f}s detached")
+            self.terminate()
+
+    # ── Shell I/O (per back-end) ──
+    def start(self):
+        self.started = True
+
+    @abc.abstractmethod
+    async def write(self, data: bytes):
+        """Send keyboard input to the shell; a no-op once the session is gone."""
+
+    def resize(self, rows: int, cols: int):
+        pass
+
+    def terminate(self):
+        # A reconnect to this id after EOF registers a replacement under it; leave that one alone
+        if TERMINAL_SESSIONS.get(self.id) is self:
+            del TERMINAL_SESSIONS[self.id]
+        if self._expiry is not None:
+            self._expiry.cancel()
+            self._expiry = None
+
+    def stats(self) -> dict:
+        totals = dict(self._totals)
+        if self.budget is not None:
+            for key, value in self.budget.stats().items():
+                if key in totals:
+                    totals[key] += value
+        totals["throttled_seconds"] = round(totals["throttled_seconds"], 3)
+        return {
+            "id": self.id,
+            "backend": self.kind,
+            "pid": self.pid,
+            "attached": self.websocket is not None,
+            "alive": not self.eof,
+            "created_at": self.created_at,
+            "detached_at": self.detached_at,
+            "bytes_in": self.bytes_in,
+            "scrollback_bytes": min(self.scrollback._size, self.scrollback.capacity),
+            "pending": self.budget.pending if self.budget else 0,
+            "throttled": self.throttled,
+            **totals,
+        }
+
+
+class PtySession(TerminalSession):
+    """Unix shell on a PTY master fd, read from the event loop."""
+
+    kind = "pty"
+
+    def __init__(self, proc, master_fd: int, session_id: Optional[str] = None,
+                 initial_output: bytes = b""):
+        super().__init__(proc, session_id)
+        self.master_fd = master_fd
+        self.reader = FdReader(master_fd, self)
+        self._writable: Optional[asyncio.Future] = None
+        # Prompt already printed by a pre-warmed shell before it was handed out
+        self.initial_output = initial_output
+
+    def start(self):
+        super().start()
+        if self.initial_output:
+            self.push(self.initial_output)
+            self.initial_output = b""
+        self.reader.start()
+
+    async def write(self, data: bytes):
+        view = memoryview(data)
+        while view and self.master_fd is not None:
+            try:
+                view = view[os.write(self.master_fd, view):]
+            except BlockingIOError:
+                # PTY input buffer full (shell not reading): wait until it drains
+                await self._wait_writable()
+            except OSError as e:
+                if e.errno != errno.EIO:   # EIO: the shell has exited
+                    raise
+                return
+
+    async def _wait_writable(self):
+        loop = asyncio.get_running_loop()
+        fd = self.master_fd
+        self._writable = loop.create_future()
+        loop.add_writer(fd, lambda: self._writable.done() or self._writable.set_result(None))
+        try:
+            await self._writable
+        finally:
+            self._writable = None
+            if self.master_fd is not None:
+                loop.remove_writer(fd)
+
+    def resize(self, rows: int, cols: int):
+        s = struct.pack('HHHH', rows, cols, 0, 0)
+        fcntl.ioctl(self.master_fd, termios.TIOCSWINSZ, s)
+
+    def terminate(self):
+        super().terminate()
+        self.reader.stop()
+        if self._writable is not None and not self._writable.done():
+            # A write waiting on a full PTY gives up; remove the watch before the fd closes
+            self._writable.get_loop().remove_writer(self.master_fd)
+            self._writable.set_result(None)
+        if self.master_fd is not None:
+            try:
+                os.close(self.master_fd)
+            except Exception:
+                pass
+            self.master_fd = None
+        reap(self.proc)
+
+
+class PipeSession(TerminalSession):
+    """asyncio subprocess with piped stdin/stdout (Windows / no-PTY fallback)."""
+
+    kind = "pipe"
+
+    def __init__(self, proc, session_id: Optional[str] = None):
+        super().__init__(proc, session_id)
+        self._read_task = None
+
+    def start(self):
+        super().start()
+        self._read_task = asyncio.create_task(read_stream(self.proc.stdout, self))
+
+    async def write(self, data: bytes):
+        if self.proc.stdin is None:
+            return
+        self.proc.stdin.write(data)
+        await self.proc.stdin.drain()
+
+    def terminate(self):
+        super().terminate()
+        if self._read_task is not None:
+            self._read_task.cancel()
+        if self.proc and self.proc.returncode is None:
+            try:
+                self.proc.kill()
+            except Exception:
+                pass
@@ -0,0 +1,224 @@
+"""Cache for natural-language → shell command translations.
+
+Users repeat the same intents ("list large files", "kill port 3000") all the
+time, and each repeat used to cost a full Gemini round trip. Translations are
+keyed on the normalized prompt plus the OS and shell they were produced for,
+and kept in two tiers:
+
+  * an in-process LRU (TRANSLATION_CACHE_SIZE entries), answering in
+    microseconds;
+  * a SQLite table (WAL, shared by every worker and by the terminal_agent
+    CLI) holding up to TRANSLATION_CACHE_DISK_SIZE entries for
+    TRANSLATION_CACHE_TTL seconds; the least recently used rows go first.
+
+Only complete translations (with a command) are stored. Callers can bypass
+the cache for a single request to force a fresh answer, which then replaces
+the cached one.
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_DB = os.getenv("TRANSLATION_CACHE_DB",
+                     os.path.join(os.path.expanduser("~"), ".synnccit", "translation_cache.db"))
+MEMORY_SIZE = int(os.getenv("TRANSLATION_CACHE_SIZE", "512"))
+DISK_SIZE = int(os.getenv("TRANSLATION_CACHE_DISK_SIZE", "10000"))
+TTL = float(os.getenv("TRANSLATION_CACHE_TTL", str(7 * 24 * 3600)))
+EVICT_EVERY = 100          # disk writes between expiry / size sweeps
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Case, surrounding punctuation and runs of whitespace don't change the intent."""
+    return _SPACES.sub(" ", prompt).strip().strip(".!?").strip().lower()
+
+
+def cache_key(prompt: str, os_name: str, shell: str) -> str:
+    raw = "\0".join((normalize_prompt(prompt), os_name.lower(), shell.lower()))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class TranslationCache:
+    """Two-tier LRU + TTL cache of ``{cmd, desc, safe}`` results."""
+
+    def __init__(self, path: str = CACHE_DB, memory_size: int = MEMORY_SIZE,
+                 disk_size: int = DISK_SIZE, ttl: float = TTL):
+        self.path = path
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.ttl = ttl
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()   # key → (expires, result)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+        self._disk_ok = True
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.stores = 0
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if not self._disk_ok:
+            return None
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS translations (
+                        key       TEXT PRIMARY KEY,
+                        prompt    TEXT NOT NULL,
+                        result    TEXT NOT NULL,
+                        expires   REAL NOT NULL,
+                        last_used REAL NOT NULL
+                    )""")
+                conn.execute("CREATE INDEX IF NOT EXISTS translations_lru ON translations(last_used)")
+            except sqlite3.Error as e:
+                # A read-only home or a corrupt file must not break translation
+                logger.warning(f"Translation cache on disk disabled: {e}")
+                self._disk_ok = False
+                return None
+            self._local.conn = conn
+        return conn
+
+    # ── Lookups ──
+    def get(self, key: str) -> Optional[Dict]:
+        result = self.get_memory(key)
+        return result if result is not None else self.get_disk(key)
+
+    async def aget(self, key: str) -> Optional[Dict]:
+        """get() for the event loop: the SQLite fallback runs in a thread, like put()."""
+        result = self.get_memory(key)
+        return result if result is not None else await asyncio.to_thread(self.get_disk, key)
+
+    def get_memory(self, key: str) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.hits_memory += 1
+                    return dict(entry[1])
+                del self._memory[key]
+        return None
+
+    def get_disk(self, key: str) -> Optional[Dict]:
+        now = time.time()
+        row = None
+        conn = self._connect()
+        if conn is not None:
+            try:
+                row = conn.execute("SELECT result, expires FROM translations WHERE key = ?",
+                                   (key,)).fetchone()
+                if row is not None and row[1] <= now:
+                    conn.execute("DELETE FROM translations WHERE key = ?", (key,))
+                    row = None
+                elif row is not None:
+                    conn.execute("UPDATE translations SET last_used = ? WHERE key = ?", (now, key))
+            except sqlite3.Error as e:
+                logger.warning(f"Translation cache read failed: {e}")
+                row = None
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits_disk += 1
+            result = json.loads(row[0])
+            self._remember(key, row[1], result)
+            return dict(result)
+
+    def put(self, key: str, prompt: str, result: Dict):
+        if not result.get("cmd"):
+            return
+        now = time.time()
+        expires = now + self.ttl
+        with self._lock:
+            self._remember(key, expires, dict(result))
+            self.stores += 1
+            self._writes += 1
+            sweep = self._writes % EVICT_EVERY == 0
+        conn = self._connect()
+        if conn is None:
+            return
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO translations (key, prompt, result, expires, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, normalize_prompt(prompt), json.dumps(result), expires, now))
+            if sweep:
+                self._evict(conn, now)
+        except sqlite3.Error as e:
+            logger.warning(f"Translation cache write failed: {e}")
+
+    def _remember(self, key: str, expires: float, result: Dict):
+        self._memory[key] = (expires, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        conn.execute("DELETE FROM translations WHERE expires <= ?", (now,))
+        conn.execute(
+            "DELETE FROM translations WHERE key IN ("
+            "  SELECT key FROM translations ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.disk_size,))
+
+    # ── Maintenance ──
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        conn = self._connect()
+        if conn is not None:
+            conn.execute("DELETE FROM translations")
+
+    def stats(self) -> dict:
+        disk_entries = None
+        conn = self._connect()
+        if conn is not None:
+            try:
+                disk_entries = conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+            except sqlite3.Error:
+                pass
+        with self._lock:
+            hits = self.hits_memory + self.hits_disk
+            lookups = hits + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "memory_size": self.memory_size,
+                "disk_entries": disk_entries,
+                "disk_size": self.disk_size,
+                "ttl": self.ttl,
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "stores": self.stores,
+                "hit_rate": round(hits / lookups, 3) if lookups else None,
+            }
+
+
+_cache: Optional[TranslationCache] = None
+_cache_guard = threading.Lock()
+
+
+def get_translation_cache() -> TranslationCache:
+    global _cache
+    with _cache_guard:
+        if _cache is None:
+            _cache = TranslationCache()
+        return _cache
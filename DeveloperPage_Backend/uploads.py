@@ -0,0 +1,255 @@
+"""Streaming and resumable uploads for /api/upload and /api/uploads.
+
+Nothing here holds a whole upload in memory: multipart bodies are copied from
+Starlette's spooled temp file in fixed-size chunks, and the resumable
+protocol streams each request body straight into a ``.part`` file. All disk
+I/O runs in worker threads so a big upload never stalls the event loop.
+
+Resumable protocol (state survives a server restart):
+  POST   /api/uploads            {filename, path?, size, sha256?} → {id, offset: 0}
+  GET    /api/uploads/{id}       → {id, offset, size, …}  (where to resume; HEAD too)
+  PUT    /api/uploads/{id}?offset=N   raw bytes, optional X-Chunk-SHA256
+                                 → {offset} — or {complete, path, sha256} once done
+  DELETE /api/uploads/{id}       abort
+
+A finished upload keeps its sidecar, marked complete, for UPLOAD_DONE_TTL
+seconds: a client whose response to the final chunk was lost can repeat the
+PUT or ask for the status and gets the finished upload back.
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import asyncio
+import hashlib
+import logging
+import tempfile
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = os.getenv("UPLOAD_TMP_DIR", os.path.join(tempfile.gettempdir(), "synnccit-uploads"))
+UPLOAD_TTL = float(os.getenv("UPLOAD_TTL_SECONDS", str(24 * 3600)))
+UPLOAD_DONE_TTL = float(os.getenv("UPLOAD_DONE_TTL_SECONDS", "3600"))
+CHUNK_SIZE = 1024 * 1024          # copy / hash granularity
+MAX_CHUNK_BYTES = int(os.getenv("UPLOAD_MAX_CHUNK_BYTES", str(64 * 1024 * 1024)))
+
+
+class UploadError(Exception):
+    """Protocol error; ``status`` is the HTTP status to answer with."""
+
+    def __init__(self, message: str, status: int = 400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+def safe_name(filename: str) -> str:
+    """Client-supplied file name without any directory parts."""
+    name = os.path.basename((filename or "").replace("\\", "/"))
+    if name in ("", ".", ".."):
+        raise UploadError("Invalid file name")
+    return name
+
+
+def _copy_into_place(src, target: str):
+    folder = os.path.dirname(target)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{os.path.basename(target)}.", suffix=".upload", dir=folder)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            shutil.copyfileobj(src, out, CHUNK_SIZE)
+        os.replace(tmp, target)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+async def save_upload(upload, target_dir: str) -> str:
+    """Stream a multipart ``UploadFile`` into ``target_dir``; returns the path."""
+    target = os.path.join(target_dir, safe_name(upload.filename))
+    await asyncio.to_thread(_copy_into_place, upload.file, target)
+    return target
+
+
+# ─── Resumable uploads ───────────────────────────────────────────────────────
+
+class ResumableUpload:
+    """One in-progress upload: a ``.part`` file plus a JSON sidecar."""
+
+    def __init__(self, id: str, target: str, size: int, sha256: Optional[str] = None,
+                 created_at: Optional[float] = None, completed: Optional[dict] = None):
+        self.id = id
+        self.target = target
+        self.size = size
+        self.sha256 = sha256.lower() if sha256 else None
+        self.created_at = created_at or time.time()
+        self.completed = completed     # {sha256, at} once the file is in place
+        self.lock = asyncio.Lock()
+
+    @property
+    def part_path(self) -> str:
+        return os.path.join(UPLOAD_DIR, f"{self.id}.part")
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(UPLOAD_DIR, f"{self.id}.json")
+
+    @property
+    def offset(self) -> int:
+        if self.completed:
+            return self.size
+        try:
+            return os.path.getsize(self.part_path)
+        except FileNotFoundError:
+            return 0
+
+    def save_meta(self):
+        with open(self.meta_path, "w") as f:
+            json.dump({"id": self.id, "target": self.target, "size": self.size,
+                       "sha256": self.sha256, "created_at": self.created_at,
+                       "completed": self.completed}, f)
+
+    @classmethod
+    def load(cls, id: str) -> Optional["ResumableUpload"]:
+        try:
+            with open(os.path.join(UPLOAD_DIR, f"{id}.json")) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return cls(meta["id"], meta["target"], meta["size"], meta.get("sha256"), meta.get("created_at"),
+                   meta.get("completed"))
+
+    def expired(self, now: float) -> bool:
+        if self.completed:
+            return now - self.completed["at"] > UPLOAD_DONE_TTL
+        return now - self.created_at > UPLOAD_TTL
+
+    def discard(self):
+        _uploads.pop(self.id, None)
+        for path in (self.part_path, self.meta_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def status(self) -> dict:
+        if self.completed:
+            return self.result()
+        return {"id": self.id, "path": self.target, "size": self.size,
+                "offset": self.offset, "chunk_size": CHUNK_SIZE}
+
+    def result(self) -> dict:
+        return {"id": self.id, "size": self.size, "offset": self.size, "complete": True,
+                "path": self.target, "sha256": self.completed["sha256"]}
+
+    async def write(self, offset: int, stream, chunk_sha256: Optional[str] = None) -> dict:
+        """Append a request body stream at ``offset``; finish when the file is complete."""
+        if self.lock.locked():
+            raise UploadError("Another chunk for this upload is in progress", 409, offset=self.offset)
+        async with self.lock:
+            if self.completed:
+                # A retried final chunk whose response was lost
+                return self.result()
+            current = self.offset
+            if offset != current:
+                raise UploadError("Offset mismatch", 409, offset=current)
+            limit = min(self.size - current, MAX_CHUNK_BYTES)
+            digest = hashlib.sha256()
+            written = 0
+            f = await asyncio.to_thread(open, self.part_path, "ab")
+            try:
+                async for data in stream:
+                    if not data:
+                        continue
+                    written += len(data)
+                    if written > limit:
+                        raise UploadError("Chunk runs past the declared size or chunk limit", 413)
+                    digest.update(data)
+                    await asyncio.to_thread(f.write, data)
+                await asyncio.to_thread(f.flush)
+            except BaseException:
+                # Never keep a partial chunk: the client resumes from the last good offset
+                await asyncio.to_thread(f.close)
+                await asyncio.to_thread(os.truncate, self.part_path, current)
+                raise
+            await asyncio.to_thread(f.close)
+
+            if chunk_sha256 and digest.hexdigest() != chunk_sha256.lower():
+                await asyncio.to_thread(os.truncate, self.part_path, current)
+                raise UploadError("Chunk checksum mismatch", 422, offset=current)
+
+            if current + written < self.size:
+                return {"id": self.id, "offset": current + written, "complete": False}
+            return await asyncio.to_thread(self._finish)
+
+    def _finish(self) -> dict:
+        digest = hashlib.sha256()
+        with open(self.part_path, "rb") as f:
+            for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(block)
+        sha256 = digest.hexdigest()
+        if self.sha256 and sha256 != self.sha256:
+            self.discard()
+            raise UploadError("File checksum mismatch; upload discarded", 422, sha256=sha256)
+        os.makedirs(os.path.dirname(self.target), exist_ok=True)
+        try:
+            os.replace(self.part_path, self.target)
+        except OSError:
+            # UPLOAD_DIR on another filesystem — copy, then drop the part file
+            with open(self.part_path, "rb") as src:
+                _copy_into_place(src, self.target)
+        try:
+            os.remove(self.part_path)
+        except FileNotFoundError:
+            pass
+        self.completed = {"sha256": sha256, "at": time.time()}
+        self.save_meta()
+        logger.info(f"Upload {self.id} complete: {self.target} ({self.size} bytes)")
+        return self.result()
+
+
+_uploads: Dict[str, ResumableUpload] = {}
+
+
+def _cleanup_expired():
+    now = time.time()
+    try:
+        names = os.listdir(UPLOAD_DIR)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if name.endswith(".json"):
+            upload = ResumableUpload.load(name[:-5])
+            if upload and upload.expired(now):
+                upload.discard()
+
+
+def create_upload(target_dir: str, filename: str, size: int, sha256: Optional[str] = None) -> ResumableUpload:
+    if size < 0:
+        raise UploadError("Invalid size")
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    _cleanup_expired()
+    upload = ResumableUpload(uuid.uuid4().hex, os.path.join(target_dir, safe_name(filename)), size, sha256)
+    upload.save_meta()
+    open(upload.part_path, "wb").close()
+    _uploads[upload.id] = upload
+    return upload
+
+
+def get_upload(id: str) -> ResumableUpload:
+    upload = _uploads.get(id)
+    if upload is None and all(c in "0123456789abcdef" for c in id):
+        upload = ResumableUpload.load(id)   # started before a restart
+        if upload is not None:
+            _uploads[id] = upload
+    if upload is not None and upload.completed and upload.expired(time.time()):
+        upload.discard()
+        upload = None
+    if upload is None:
+        raise UploadError("Upload not found", 404)
+    return upload
@@ -0,0 +1,227 @@
+"""In-memory workspace index, patched in place from file-watcher events.
+
+The tree is scanned from disk once per workspace root. After that every
+batch from the root's shared watcher (fs_watcher.WatchHub) only re-stats the
+paths it names, bumps ``version`` and appends to a bounded change log, so
+clients can ask for "changes since version N" and tree requests are answered
+from memory instead of walking the disk. Folders ignored by the workspace's
+ignore rules are indexed as entries but their contents are never scanned.
+"""
+import os
+import bisect
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+
+from file_tree import list_entries, make_entry, scan_folder, is_visible
+from fs_watcher import get_hub
+from ignore_rules import get_rules, IGNORE_FILES
+
+logger = logging.getLogger(__name__)
+
+CHANGE_LOG_SIZE = int(os.getenv("WORKSPACE_INDEX_CHANGE_LOG", "10000"))
+MAX_INDEXES = int(os.getenv("WORKSPACE_INDEX_MAX_ROOTS", "4"))
+
+
+class WorkspaceIndex:
+    """Directory listings for one workspace root, kept in sync with the disk."""
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.rules = get_rules(self.root)
+        self.version = 0
+        self.ready = False
+        # folder path → sorted entries in file_tree.list_entries format
+        self._dirs: Dict[str, list] = {}
+        self._log = deque(maxlen=CHANGE_LOG_SIZE)  # (version, path, op)
+        self._log_floor = 0  # oldest version the log can still answer "since" for
+        self._lock = threading.Lock()
+        self._hub = None
+        self._building = asyncio.Lock()
+
+    # ── Building ──
+    def build(self):
+        dirs = {}
+        self._scan_into(self.root, dirs)
+        with self._lock:
+            self._dirs = dirs
+            self.version += 1
+            self._log.clear()
+            self._log_floor = self.version
+            self.ready = True
+        logger.info(f"Workspace index built for {self.root}: {len(dirs)} folders (v{self.version})")
+
+    def _scan_into(self, path: str, dirs: Dict[str, list]):
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            try:
+                entries = list_entries(current, self.rules)
+            except (PermissionError, FileNotFoundError, NotADirectoryError):
+                continue
+            dirs[current] = entries
+            stack.extend(e[2] for e in entries if e[3] and not e[4])
+
+    # ── Incremental updates ──
+    def apply(self, paths) -> int:
+        """Re-stat each changed path and patch the index; returns the new version."""
+        if any(os.path.basename(path) in IGNORE_FILES for path in paths):
+            # What is ignored may have changed anywhere below — start over
+            self.build()
+            return self.version
+        # Stat and scan outside the lock, like build(): tree() takes it on the
+        # event loop, and a clone or install can bring thousands of new folders
+        found = [(path, self._inspect(path)) for path in sorted(set(paths))]
+        with self._lock:
+            changed = []
+            for path, state in found:
+                op = self._patch(path, state) if state else None
+                if op:
+                    changed.append((path, op))
+            if changed:
+                self.version += 1
+                for path, op in changed:
+                    if len(self._log) == self._log.maxlen:
+                        self._log_floor = max(self._log_floor, self._log[0][0])
+                    self._log.append((self.version, path, op))
+            return self.version
+
+    def _inspect(self, path: str) -> Optional[tuple]:
+        """(exists, is_dir, ignored, scanned subtree or None) of ``path``, None if not indexed."""
+        if not is_visible(self.root, path, self.rules) or os.path.dirname(path) not in self._dirs:
+            return None
+        if not os.path.exists(path):
+            return False, False, False, None
+        is_dir = os.path.isdir(path)
+        ignored = self.rules.is_ignored(path, is_dir)
+        subtree = None
+        if is_dir and not ignored and path not in self._dirs:
+            subtree = {}
+            self._scan_into(path, subtree)
+        return True, is_dir, ignored, subtree
+
+    def _patch(self, path: str, state: tuple) -> Optional[str]:
+        exists, is_dir, ignored, subtree = state
+        parent, name = os.path.split(path)
+        siblings = self._dirs.get(parent)
+        if siblings is None:
+            return None  # parent is not indexed (unreadable or ignored)
+
+        existing = next((e for e in siblings if e[1] == name), None)
+        if existing:
+            siblings.remove(existing)
+        if not exists:
+            self._drop_subtree(path)
+            return "delete" if existing else None
+
+        bisect.insort(siblings, make_entry(name, path, is_dir, ignored), key=lambda e: e[0])
+        if subtree is not None and path not in self._dirs:
+            self._dirs.update(subtree)
+        elif not is_dir:
+            self._drop_subtree(path)
+        return "upsert"
+
+    def _drop_subtree(self, path: str):
+        prefix = path + os.sep
+        for folder in [d for d in self._dirs if d == path or d.startswith(prefix)]:
+            del self._dirs[folder]
+
+    # ── Queries ──
+    def _entries_of(self, path: str) -> list:
+        entries = self._dirs.get(path)
+        if entries is None:
+            raise FileNotFoundError(path)
+        return list(entries)
+
+    def contains(self, path: str) -> bool:
+        return path in self._dirs
+
+    def tree(self, path: str, depth=None, cursor=None, limit=None) -> Optional[dict]:
+        with self._lock:
+            node = scan_folder(path, depth, cursor, limit, self._entries_of)
+            if node is not None:
+                node["version"] = self.version
+            return node
+
+    def changes_since(self, since: int) -> dict:
+        """Nodes changed after ``since``; ``full`` means the log no longer covers it."""
+        with self._lock:
+            if since > self.version or since < self._log_floor:
+                return {"version": self.version, "full": True, "changes": []}
+
+            latest: Dict[str, str] = {}
+            for version, path, op in self._log:
+                if version > since:
+                    latest[path] = op
+            changes = []
+            for path, op in latest.items():
+                change = {"path": path, "parent": os.path.dirname(path), "op": op}
+                if op == "upsert":
+                    if path in self._dirs:
+                        change["node"] = scan_folder(path, 1, None, None, self._entries_of)
+                    else:
+                        is_dir = os.path.isdir(path)
+                        change["node"] = {"id": path, "name": os.path.basename(path),
+                                          "type": "folder" if is_dir else "file",
+                                          "path": path}
+                        if self.rules.is_ignored(path, is_dir):
+                            change["node"]["ignored"] = True
+                changes.append(change)
+            return {"version": self.version, "full": False, "changes": changes}
+
+    # ── Watching ──
+    def start_watching(self):
+        if self._hub is None:
+            self._hub = get_hub(self.root)
+            self._hub.add_listener(self._on_changes, self._on_watch_error)
+
+    async def _on_changes(self, paths):
+        await asyncio.to_thread(self.apply, paths)
+
+    def _on_watch_error(self):
+        # We may have missed events; force a rebuild on next use
+        self.ready = False
+        self.close()
+
+    def close(self):
+        if self._hub is not None:
+            self._hub.remove_listener(self._on_changes, self._on_watch_error)
+            self._hub = None
+
+
+_indexes: "OrderedDict[str, WorkspaceIndex]" = OrderedDict()
+
+
+async def get_index(root: str) -> WorkspaceIndex:
+    """Index for ``root``, building it (off the event loop) on first use."""
+    root = os.path.abspath(root)
+    index = _indexes.get(root)
+    if index is None:
+        index = WorkspaceIndex(root)
+        _indexes[root] = index
+        while len(_indexes) > MAX_INDEXES:
+            _, evicted = _indexes.popitem(last=False)
+            evicted.close()
+    _indexes.move_to_end(root)
+    async with index._building:
+        if not index.ready:
+            await asyncio.to_thread(index.build)
+            index.start_watching()
+    return index
+
+
+def find_index(path: str) -> Optional[WorkspaceIndex]:
+    """Ready index whose root contains ``path`` (without building one)."""
+    path = os.path.abspath(path)
+    for root, index in _indexes.items():
+        if index.ready and (path == root or path.startswith(root + os.sep)):
+            return index
+    return None
+
+
+def close_all():
+    for index in _indexes.values():
+        index.close()
+    _indexes.clear()
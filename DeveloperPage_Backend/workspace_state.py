@@ -0,0 +1,165 @@
+"""Per-client workspace directory, shared by every worker process.
+
+The current folder used to live in a module-level ``CURRENT_DIR``, which
+pinned the app to one uvicorn worker and let two browsers switch each other's
+workspace. It is now keyed by a client session id and kept in a small SQLite
+database (WAL mode), so ``uvicorn app:app --workers N`` sees the same state
+from every process.
+
+The session id comes from the ``synnccit_session`` cookie, which the HTTP
+middleware in app.py hands out on first contact. Clients that cannot send
+cookies may use an ``X-Session-Id`` header (or ``?sid=`` on WebSockets).
+
+Every file, terminal and search request needs the cwd, so lookups are served
+from an in-process map that is filled lazily from SQLite and written through
+on every change. Before the map is trusted, ``PRAGMA data_version`` (no table
+read) tells whether any other connection has committed since the last
+lookup; if one has, the map is dropped, so a folder switch made by another
+worker is seen on the very next request.
+"""
+import os
+import re
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from starlette.requests import HTTPConnection
+
+logger = logging.getLogger(__name__)
+
+STATE_DB = os.getenv("WORKSPACE_STATE_DB",
+                     os.path.join(os.path.expanduser("~"), ".synnccit", "workspace_state.db"))
+DEFAULT_WORKSPACE = os.path.abspath(os.getenv("WORKSPACE_DIR", os.getcwd()))
+SESSION_COOKIE = "synnccit_session"
+SESSION_HEADER = "x-session-id"
+SESSION_MAX_AGE = 30 * 24 * 3600
+CWD_CACHE_SIZE = 4096
+
+_VALID_ID = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+_local = threading.local()
+_cwds: "OrderedDict[str, str]" = OrderedDict()   # session id → cwd
+_cwds_lock = threading.Lock()
+
+
+def _connect() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(STATE_DB) or ".", exist_ok=True)
+        conn = sqlite3.connect(STATE_DB, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                id         TEXT PRIMARY KEY,
+                cwd        TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )""")
+        _local.conn = conn
+        _local.data_version = None
+    return conn
+
+
+def _fresh(conn: sqlite3.Connection):
+    """Drop the cached cwds if another connection wrote since this thread last looked."""
+    version = conn.execute("PRAGMA data_version").fetchone()[0]
+    if version != _local.data_version:
+        _local.data_version = version
+        with _cwds_lock:
+            _cwds.clear()
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+def valid_session_id(session_id: Optional[str]) -> bool:
+    return bool(session_id) and bool(_VALID_ID.match(session_id))
+
+
+def get_cwd(session_id: Optional[str]) -> str:
+    """The session's workspace folder (DEFAULT_WORKSPACE until it picks one)."""
+    if not session_id:
+        return DEFAULT_WORKSPACE
+    conn = _connect()
+    _fresh(conn)
+    with _cwds_lock:
+        cwd = _cwds.get(session_id)
+        if cwd is not None:
+            _cwds.move_to_end(session_id)
+            return cwd
+    row = conn.execute("SELECT cwd FROM sessions WHERE id = ?", (session_id,)).fetchone()
+    cwd = row[0] if row else DEFAULT_WORKSPACE
+    _remember(session_id, cwd)
+    return cwd
+
+
+def set_cwd(session_id: Optional[str], cwd: str) -> str:
+    cwd = os.path.abspath(cwd)
+    if session_id:
+        _remember(session_id, cwd)
+        _connect().execute(
+            "INSERT INTO sessions (id, cwd, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET cwd = excluded.cwd, updated_at = excluded.updated_at",
+            (session_id, cwd, time.time()))
+    return cwd
+
+
+def _remember(session_id: str, cwd: str):
+    with _cwds_lock:
+        _cwds[session_id] = cwd
+        _cwds.move_to_end(session_id)
+        while len(_cwds) > CWD_CACHE_SIZE:
+            _cwds.popitem(last=False)
+
+
+def prune(max_age: float = SESSION_MAX_AGE) -> int:
+    """Forget sessions untouched for ``max_age`` seconds."""
+    cur = _connect().execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - max_age,))
+    if cur.rowcount:
+        with _cwds_lock:
+            _cwds.clear()
+        logger.info(f"Pruned {cur.rowcount} stale workspace sessions")
+    return cur.rowcount
+
+
+def session_count() -> int:
+    return _connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+class SessionMiddleware:
+    """Puts the client's session id in ``scope['state']['session_id']``.
+
+    Plain ASGI (no BaseHTTPMiddleware) so streaming responses and WebSockets
+    pass straight through; a new id is set as a cookie on the first response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+        conn = HTTPConnection(scope)
+        session_id = (conn.headers.get(SESSION_HEADER) or conn.cookies.get(SESSION_COOKIE)
+                      or conn.query_params.get("sid"))
+        fresh = not valid_session_id(session_id)
+        if fresh:
+            session_id = new_session_id()
+        scope.setdefault("state", {})["session_id"] = session_id
+
+        if not fresh or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        cookie = (f"{SESSION_COOKIE}={session_id}; Path=/; Max-Age={SESSION_MAX_AGE}; "
+                  f"HttpOnly; SameSite=Lax").encode()
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", []).append((b"set-cookie", cookie))
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
@@ -23,6 +23,12 @@ interface TerminalProps {
 
 const IS_LOCAL = window.location.hostname === 'localhost' || window.location.hostname === '127.0.0.1';
 
+// crypto.randomUUID only exists in secure contexts (https or localhost), not on a LAN http URL
+function newSessionId(): string {
+  if (typeof crypto.randomUUID === 'function') return crypto.randomUUID();
+  return Array.from(crypto.getRandomValues(new Uint8Array(16)), (b) => b.toString(16).padStart(2, '0')).join('');
+}
+
 // ─── Cloud Terminal (HTTP-based, works on Vercel) ─────────────────────────────
 
 function CloudTerminal({ isExpanded }: { isExpanded?: boolean }) {
@@ -193,11 +199,20 @@ function LocalTerminal({ isExpanded, onExpand }: { isExpanded?: boolean; onExpan
     fitAddonRef.current = fitAddon;
 
     const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-    const ws = new WebSocket(`${protocol}//${window.location.host}/ws/terminal`);
+    // Reuse the shell across reloads: the backend keeps the session alive and replays its scrollback
+    let sessionId = sessionStorage.getItem('terminal-session');
+    if (!sessionId) {
+      sessionId = newSessionId();
+      sessionStorage.setItem('terminal-session', sessionId);
+    }
+    // flow=ack: the backend pauses the shell until rendered frames are acknowledged
+    const ws = new WebSocket(`${protocol}//${window.location.host}/ws/terminal?flow=ack&session=${sessionId}`);
     wsRef.current = ws;
 
     ws.onopen = () => setConnected(true);
-    ws.onmessage = (event) => term.write(event.data);
+    ws.onmessage = (event) => term.write(event.data, () => {
+      if (ws.readyState === WebSocket.OPEN) ws.send(JSON.stringify({ type: 'ack', frames: 1 }));
+    });
     ws.onclose = () => {
       setConnected(false);
       term.write('\r\n\x1b[31m[DISCONNECTED] Terminal connection lost. Make sure the local backend is running.\x1b[0m\r\n');
@@ -0,0 +1,61 @@
+// Delta saves for POST /api/file: send only the changed span against the
+// hash of the last saved version, falling back to a full save when the
+// server no longer has that version.
+
+export interface FileEdit {
+  start: number; // UTF-16 offsets into the base text
+  end: number;
+  text: string;
+}
+
+export interface SavedVersion {
+  hash: string;
+  content: string;
+}
+
+// Single splice turning `base` into `next` (common prefix / suffix trimmed)
+export function computeEdit(base: string, next: string): FileEdit {
+  let start = 0;
+  const max = Math.min(base.length, next.length);
+  while (start < max && base.charCodeAt(start) === next.charCodeAt(start)) start++;
+  let tail = 0;
+  while (
+    tail < max - start &&
+    base.charCodeAt(base.length - 1 - tail) === next.charCodeAt(next.length - 1 - tail)
+  ) tail++;
+  return { start, end: base.length - tail, text: next.slice(start, next.length - tail) };
+}
+
+async function post(backendUrl: string, body: object): Promise<Response> {
+  return fetch(`${backendUrl}/api/file`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(body),
+  });
+}
+
+// Returns the new saved version, or null if the save failed
+export async function saveFile(
+  backendUrl: string,
+  path: string,
+  content: string,
+  base?: SavedVersion,
+): Promise<SavedVersion | null> {
+  let res: Response | null = null;
+  if (base?.hash) {
+    res = await post(backendUrl, {
+      path,
+      patch: [computeEdit(base.content, content)],
+      base_hash: base.hash,
+    });
+    if (res.status === 409) {
+      // Changed on disk since we loaded it — the editor buffer wins, as before
+      console.warn(`${path} changed on disk; saving the full editor content`);
+      res = null;
+    }
+  }
+  if (!res) res = await post(backendUrl, { path, content });
+  if (!res.ok) return null;
+  const data = await res.json();
+  return { hash: data.hash, content };
+}
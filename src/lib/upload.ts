@@ -0,0 +1,69 @@
+// Uploads to the local backend. Small files go up as one multipart request;
+// bigger ones use the resumable /api/uploads protocol in fixed-size chunks,
+// picking up from the server's offset after a dropped connection.
+
+const RESUMABLE_THRESHOLD = 8 * 1024 * 1024;
+const CHUNK_BYTES = 8 * 1024 * 1024;
+const MAX_RETRIES = 5;
+
+async function sha256Hex(data: ArrayBuffer): Promise<string | null> {
+  if (!globalThis.crypto?.subtle) return null; // not a secure context
+  const digest = await crypto.subtle.digest('SHA-256', data);
+  return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, '0')).join('');
+}
+
+export async function uploadFile(
+  backendUrl: string,
+  file: File,
+  path?: string,
+  onProgress?: (sent: number, total: number) => void,
+): Promise<boolean> {
+  if (file.size < RESUMABLE_THRESHOLD) {
+    const formData = new FormData();
+    formData.append('file', file);
+    if (path) formData.append('path', path);
+    const res = await fetch(`${backendUrl}/api/upload`, { method: 'POST', body: formData });
+    return res.ok;
+  }
+
+  const start = await fetch(`${backendUrl}/api/uploads`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ filename: file.name, size: file.size, path }),
+  });
+  if (!start.ok) return false;
+  const { id } = await start.json();
+
+  let offset = 0;
+  let retries = 0;
+  while (true) {
+    try {
+      const chunk = await file.slice(offset, offset + CHUNK_BYTES).arrayBuffer();
+      const checksum = await sha256Hex(chunk);
+      const res = await fetch(`${backendUrl}/api/uploads/${id}?offset=${offset}`, {
+        method: 'PUT',
+        headers: checksum ? { 'X-Chunk-SHA256': checksum } : {},
+        body: chunk,
+      });
+      const data = await res.json();
+      if (res.ok) {
+        offset = data.offset;
+        retries = 0;
+        onProgress?.(offset, file.size);
+        if (data.complete) return true;
+        continue;
+      }
+      if (typeof data.offset !== 'number') return false;
+      offset = data.offset; // 409 / 422: resend from where the server is
+    } catch (err) {
+      // Dropped connection — ask the server where to resume
+      console.warn('Upload chunk failed, resuming:', err);
+      const status = await fetch(`${backendUrl}/api/uploads/${id}`).then(r => r.ok ? r.json() : null).catch(() => null);
+      if (status) offset = status.offset;
+    }
+    if (++retries > MAX_RETRIES) {
+      await fetch(`${backendUrl}/api/uploads/${id}`, { method: 'DELETE' }).catch(() => {});
+      return false;
+    }
+  }
+}
@@ -21,6 +21,8 @@ import {
 } from 'lucide-react';
 import { Button } from '@/components/ui/button';
 import { cn } from '@/lib/utils';
+import { saveFile } from '@/lib/fileSave';
+import { uploadFile } from '@/lib/upload';
 import { FileExplorer } from '@/components/developer/FileExplorer';
 import { CodeEditor } from '@/components/developer/CodeEditor';
 import { Terminal } from '@/components/developer/Terminal';
@@ -88,6 +90,7 @@ export default function TestingPage() {
     }
 
     let content = '';
+    let saved: OpenFile['saved'];
 
     if (isNativeMode.current) {
       const handle = nativeFileHandles.get(file.path);
@@ -105,8 +108,14 @@ export default function TestingPage() {
     } else {
       try {
         const res = await fetch(`${BACKEND_URL}/api/file?path=${encodeURIComponent(file.path)}`);
-        const data = await res.json();
-        content = data.content || '';
+        if ((res.headers.get('content-type') || '').includes('application/json')) {
+          const data = await res.json();
+          content = data.binary ? '// Binary file — not shown' : (data.content || '');
+          if (data.hash) saved = { hash: data.hash, content };
+        } else {
+          // Large files are streamed back as plain text
+          content = await res.text();
+        }
       } catch (err) {
         console.error('Failed to fetch file from backend:', err);
       }
@@ -119,6 +128,7 @@ export default function TestingPage() {
       content,
       language: file.language || detectLanguage(file.name),
       isModified: false,
+      saved,
     };
     setOpenFiles(prev => [...prev, newFile]);
     setActiveFileId(newFile.id);
@@ -143,14 +153,10 @@ export default function TestingPage() {
       }
     } else {
       try {
-        const res = await fetch(`${BACKEND_URL}/api/file`, {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({ path: file.path, content: file.content }),
-        });
-        if (res.ok) {
+        const saved = await saveFile(BACKEND_URL, file.path, file.content, file.saved);
+        if (saved) {
           setOpenFiles(prev => prev.map(f =>
-            f.id === file.id ? { ...f, isModified: false } : f
+            f.id === file.id ? { ...f, isModified: f.content !== saved.content, saved } : f
           ));
         }
       } catch (err) {
@@ -400,9 +406,7 @@ export default function TestingPage() {
             onRefresh={() => { if (!isNativeMode.current) loadFiles(); }}
             onFileUpload={async (file) => {
               if (isNativeMode.current) return;
-              const formData = new FormData();
-              formData.append('file', file);
-              await fetch(`${BACKEND_URL}/api/upload`, { method: 'POST', body: formData });
+              await uploadFile(BACKEND_URL, file);
               loadFiles();
             }}
             onWorkspaceChange={IS_LOCAL ? handleChangeWorkspace : undefined}
@@ -58,6 +58,8 @@ export interface OpenFile {
   content: string;
   language: string;
   isModified: boolean;
+  // Last version saved to / loaded from the backend, the base for delta saves
+  saved?: { hash: string; content: string };
 }
 
 export interface TerminalOutput {